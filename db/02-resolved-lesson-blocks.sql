@@ -0,0 +1,28 @@
+-- Precomputed variant resolution (tenant override, otherwise default).
+-- One row per block of a lesson, keyed by the lesson's tenant and the block's
+-- position, pointing at the chosen variant. Kept up to date by the API's
+-- content-change signals; rebuild with `python manage.py rebuild_resolved_lessons`
+-- after editing lesson_blocks/block_variants outside the API.
+
+CREATE TABLE resolved_lesson_blocks (
+  tenant_id    INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  lesson_id    INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+  position     INTEGER NOT NULL,
+  block_id     INTEGER NOT NULL REFERENCES blocks(id) ON DELETE CASCADE,
+  variant_id   INTEGER REFERENCES block_variants(id) ON DELETE SET NULL,
+  PRIMARY KEY (tenant_id, lesson_id, position)
+);
+
+-- Variant edits refresh every resolved row that uses the block.
+CREATE INDEX idx_resolved_lesson_blocks_block ON resolved_lesson_blocks(block_id);
+
+INSERT INTO resolved_lesson_blocks (tenant_id, lesson_id, position, block_id, variant_id)
+SELECT l.tenant_id, lb.lesson_id, lb.position, lb.block_id,
+       (SELECT v.id
+          FROM block_variants v
+         WHERE v.block_id = lb.block_id
+           AND (v.tenant_id = l.tenant_id OR v.tenant_id IS NULL)
+         ORDER BY v.tenant_id NULLS LAST
+         LIMIT 1)
+FROM lesson_blocks lb
+JOIN lessons l ON l.id = lb.lesson_id;
@@ -0,0 +1,43 @@
+-- Progress rollups for tenant analytics, maintained by the progress upsert
+-- and rebuilt by `python manage.py refresh_progress_rollups`.
+
+-- Per-user counts for one lesson (only blocks currently in the lesson count).
+CREATE TABLE user_lesson_progress (
+  user_id           INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  lesson_id         INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+  seen_blocks       INTEGER NOT NULL DEFAULT 0,
+  completed_blocks  INTEGER NOT NULL DEFAULT 0,
+  updated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, lesson_id)
+);
+
+CREATE INDEX idx_user_lesson_progress_lesson ON user_lesson_progress(lesson_id);
+
+-- Per-lesson totals: one row per lesson with any progress.
+CREATE TABLE lesson_progress_rollups (
+  lesson_id               INTEGER PRIMARY KEY REFERENCES lessons(id) ON DELETE CASCADE,
+  tenant_id               INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  users_started           INTEGER NOT NULL DEFAULT 0,
+  users_completed         INTEGER NOT NULL DEFAULT 0,
+  completed_blocks_total  BIGINT NOT NULL DEFAULT 0,
+  updated_at              TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX idx_lesson_progress_rollups_tenant ON lesson_progress_rollups(tenant_id);
+
+INSERT INTO user_lesson_progress (user_id, lesson_id, seen_blocks, completed_blocks)
+SELECT p.user_id, p.lesson_id, count(*), count(*) FILTER (WHERE p.status = 'completed')
+FROM user_block_progress p
+JOIN lesson_blocks lb ON lb.lesson_id = p.lesson_id AND lb.block_id = p.block_id
+GROUP BY p.user_id, p.lesson_id;
+
+INSERT INTO lesson_progress_rollups
+  (lesson_id, tenant_id, users_started, users_completed, completed_blocks_total)
+SELECT l.id, l.tenant_id, count(*),
+       count(*) FILTER (
+         WHERE u.completed_blocks >= (SELECT count(*) FROM lesson_blocks lb WHERE lb.lesson_id = l.id)
+       ),
+       sum(u.completed_blocks)
+FROM user_lesson_progress u
+JOIN lessons l ON l.id = u.lesson_id
+GROUP BY l.id, l.tenant_id;
@@ -0,0 +1,12 @@
+-- Content version of each lesson for its tenant: bumped whenever the lesson's
+-- resolved blocks are rebuilt or one of its variants changes, so clients
+-- holding the current version can skip variant data (lessons.services.resolution).
+
+CREATE TABLE lesson_content_versions (
+  lesson_id    INTEGER PRIMARY KEY REFERENCES lessons(id) ON DELETE CASCADE,
+  tenant_id    INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  version      BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO lesson_content_versions (lesson_id, tenant_id)
+SELECT id, tenant_id FROM lessons;
@@ -0,0 +1,17 @@
+-- Published lessons: a lesson's resolved blocks frozen at one content version
+-- (lessons.services.snapshots). Rows are never updated. A lesson with a
+-- published_version is served from that snapshot; later edits stay a draft
+-- until it is published again.
+
+ALTER TABLE lessons ADD COLUMN published_version BIGINT;
+
+-- blocks: [[block_id, block_type, position, variant_id, variant_tenant_id,
+-- variant_data], ...] in position order, as LessonStructure rows.
+CREATE TABLE lesson_snapshots (
+  tenant_id     INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  lesson_id     INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+  version       BIGINT NOT NULL,
+  blocks        JSONB NOT NULL,
+  published_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (tenant_id, lesson_id, version)
+);
@@ -0,0 +1,21 @@
+-- Tenant inheritance: a sub-tenant (e.g. a reseller's customer) uses its own
+-- variant of a block, otherwise its parent's, otherwise its grandparent's,
+-- ..., otherwise the default. Change parents with
+-- `python manage.py set_tenant_parent` (lessons.services.tenant_chains),
+-- which keeps tenant_chains and the resolved lessons below it current.
+
+-- A tenant with children can't be deleted until they are moved.
+ALTER TABLE tenants ADD COLUMN parent_id INTEGER REFERENCES tenants(id);
+
+-- Every tenant's ancestors, ranked by distance (1 = parent). Tenants without
+-- a parent have no rows.
+CREATE TABLE tenant_chains (
+  tenant_id    INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  ancestor_id  INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+  rank         INTEGER NOT NULL,
+  PRIMARY KEY (tenant_id, ancestor_id),
+  UNIQUE (tenant_id, rank)
+);
+
+-- Descendants of a tenant whose overrides changed.
+CREATE INDEX idx_tenant_chains_ancestor ON tenant_chains(ancestor_id);
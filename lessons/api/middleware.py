@@ -0,0 +1,165 @@
+import cProfile
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from lessons.profiling import should_profile, write_profile
+from lessons.routers import (
+    bind_read_alias,
+    bind_tenant_alias,
+    choose_replica,
+    is_pinned_to_primary,
+    pin_to_primary,
+    tenant_database,
+    unbind_read_alias,
+    unbind_tenant_alias,
+)
+from lessons.timing import ServerTimingRecorder, bind_recorder, unbind_recorder
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """
+    Attach a Server-Timing header with per-phase durations to responses.
+
+    Removed from the middleware chain entirely when SERVER_TIMING_ENABLED is
+    off, so disabled deployments pay nothing beyond the unbound-recorder check
+    in `lessons.timing`.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = ServerTimingRecorder()
+        token = bind_recorder(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            unbind_recorder(token)
+
+        if recorder.durations:
+            recorder.durations["total"] = time.perf_counter() - start
+            response["Server-Timing"] = recorder.header_value()
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile selected requests from view dispatch through rendering.
+
+    Selection happens in `process_view`, where the URL's tenant_id is known.
+    Removed from the chain when neither PROFILING_SECRET nor any tenant
+    sampling rate is configured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_SECRET and not settings.PROFILING_TENANT_SAMPLE_RATES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        profiler = getattr(request, "_lessons_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            tenant_id, label = request._lessons_profile_target
+            try:
+                write_profile(profiler, tenant_id, label)
+            except OSError:
+                logger.exception("Could not write request profile")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tenant_id = view_kwargs.get("tenant_id")
+        if tenant_id is None or not should_profile(request, tenant_id):
+            return None
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread.
+            return None
+        request._lessons_profiler = profiler
+        request._lessons_profile_target = (tenant_id, view_func.__name__)
+        return None
+
+
+class TenantRoutingMiddleware:
+    """
+    Route the request's tenant-scoped queries to the database holding the
+    URL's tenant (see `lessons.routers`).
+
+    Removed from the chain when TENANT_DATABASES is empty.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TENANT_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            token = getattr(request, "_lessons_tenant_alias_token", None)
+            if token is not None:
+                unbind_tenant_alias(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tenant_id = view_kwargs.get("tenant_id")
+        if tenant_id is not None:
+            request._lessons_tenant_alias_token = bind_tenant_alias(
+                tenant_database(tenant_id)
+            )
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Send lesson GET reads to a replica and keep each user's reads on the
+    primary for a short window after they write (see `lessons.routers`).
+
+    Removed from the chain when DATABASE_REPLICAS is empty.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, "_lessons_read_alias_token", None)
+            if token is not None:
+                unbind_read_alias(token)
+
+        user_key = getattr(request, "_lessons_user_key", None)
+        if (
+            user_key is not None
+            and request.method not in ("GET", "HEAD", "OPTIONS")
+            and 200 <= response.status_code < 300
+        ):
+            pin_to_primary(*user_key)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tenant_id = view_kwargs.get("tenant_id")
+        user_id = view_kwargs.get("user_id")
+        if tenant_id is not None and user_id is not None:
+            request._lessons_user_key = (tenant_id, user_id)
+            if request.method == "GET" and is_pinned_to_primary(tenant_id, user_id):
+                return None
+        if request.method == "GET" and tenant_id is not None:
+            request._lessons_read_alias_token = bind_read_alias(choose_replica())
+        return None
@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+from lessons.timing import phase
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that records serialization time as the `render` phase."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase("render"):
+            return super().render(data, accepted_media_type, renderer_context)
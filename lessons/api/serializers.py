@@ -1,6 +1,61 @@
 from rest_framework import serializers
 
+from lessons.services.assembly import parse_variant_fields
+from lessons.services.export import EXPORT_FORMATS, parse_export_cursor
+
+
+class LessonDetailQuerySerializer(serializers.Serializer):
+    content_version = serializers.IntegerField(required=False, min_value=0)
+    fields = serializers.CharField(required=False)
+
+    def validate_fields(self, value):
+        try:
+            return parse_variant_fields(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
 
 class ProgressUpsertRequestSerializer(serializers.Serializer):
     block_id = serializers.IntegerField()
     status = serializers.ChoiceField(choices=["seen", "completed"])
+
+
+class ProgressSyncQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+
+
+class ProgressExportQuerySerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=sorted(EXPORT_FORMATS), default="ndjson")
+    lesson_id = serializers.IntegerField(required=False)
+    updated_from = serializers.DateTimeField(required=False)
+    updated_to = serializers.DateTimeField(required=False)
+    after = serializers.CharField(required=False)
+
+    def validate_after(self, value):
+        try:
+            return parse_export_cursor(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class VariantChangeSerializer(serializers.Serializer):
+    block_id = serializers.IntegerField()
+    data = serializers.DictField()
+
+
+class LessonBlockKeySerializer(serializers.Serializer):
+    lesson_id = serializers.IntegerField()
+    block_id = serializers.IntegerField()
+
+
+class LessonBlockChangeSerializer(LessonBlockKeySerializer):
+    position = serializers.IntegerField()
+
+
+class ContentBulkRequestSerializer(serializers.Serializer):
+    variants = VariantChangeSerializer(many=True, required=False)
+    delete_variants = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    lesson_blocks = LessonBlockChangeSerializer(many=True, required=False)
+    delete_lesson_blocks = LessonBlockKeySerializer(many=True, required=False)
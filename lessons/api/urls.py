@@ -1,6 +1,15 @@
 from django.urls import path
 
-from lessons.api.views import LessonDetailView, ProgressUpsertView
+from lessons.api.views import (
+    CacheStatsView,
+    ContentBulkView,
+    LessonAnalyticsView,
+    LessonDetailView,
+    LessonPublishView,
+    ProgressExportView,
+    ProgressUpsertView,
+    UserProgressView,
+)
 
 urlpatterns = [
     path(
@@ -13,4 +22,31 @@ urlpatterns = [
         ProgressUpsertView.as_view(),
         name="progress-upsert",
     ),
+    path(
+        "tenants/<int:tenant_id>/users/<int:user_id>/progress",
+        UserProgressView.as_view(),
+        name="user-progress",
+    ),
+    path(
+        "tenants/<int:tenant_id>/analytics/lessons",
+        LessonAnalyticsView.as_view(),
+        name="lesson-analytics",
+    ),
+    path(
+        "tenants/<int:tenant_id>/progress/export",
+        ProgressExportView.as_view(),
+        name="progress-export",
+    ),
+    path(
+        "tenants/<int:tenant_id>/lessons/<int:lesson_id>/publish",
+        LessonPublishView.as_view(),
+        name="lesson-publish",
+    ),
+    path("content/bulk", ContentBulkView.as_view(), name="content-bulk"),
+    path(
+        "tenants/<int:tenant_id>/content/bulk",
+        ContentBulkView.as_view(),
+        name="tenant-content-bulk",
+    ),
+    path("cache/stats", CacheStatsView.as_view(), name="cache-stats"),
 ]
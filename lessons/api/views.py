@@ -1,21 +1,59 @@
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.views import exception_handler
 
-from lessons.api.serializers import ProgressUpsertRequestSerializer
+from lessons.api.serializers import (
+    ContentBulkRequestSerializer,
+    LessonDetailQuerySerializer,
+    ProgressExportQuerySerializer,
+    ProgressSyncQuerySerializer,
+    ProgressUpsertRequestSerializer,
+)
+from lessons.models import Tenant
 from lessons.services.assembly import (
-    assemble_lesson,
     compute_progress_summary,
     get_lesson_structure,
     get_progress_map,
 )
+from lessons.services.bulk_content import apply_content_changes
+from lessons.services.export import EXPORT_FORMATS, iter_progress_rows
+from lessons.services.lesson_body import render_lesson
 from lessons.services.progress import upsert_progress
+from lessons.services.progress_sync import lesson_progress_delta, user_progress_delta
+from lessons.services.rollups import lesson_completion_stats
+from lessons.services.snapshots import publish_lesson, unpublish_lesson
 from lessons.services.validation import (
     validate_block_in_lesson,
+    validate_tenant_user,
     validate_tenant_user_lesson,
 )
 
 
+def accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header allows gzip (RFC 9110 q-values)."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
 def custom_exception_handler(exc, context):
     """
     DRF exception handler — formats all errors as:
@@ -51,15 +89,64 @@ def custom_exception_handler(exc, context):
 
 
 class LessonDetailView(APIView):
-    """GET /tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}"""
+    """
+    GET /tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}
+
+    The body is spliced from cached, pre-encoded block content (see
+    lessons.services.lesson_body) rather than rendered by DRF, and is sent
+    gzip-compressed when the client accepts it.
+
+    `lesson.content_version` changes whenever the lesson's content does. A
+    client holding it passes `?content_version=`; while it is current, the
+    blocks come without `variant.data`. `?fields=a,b` projects each
+    `variant.data` to those keys, e.g. titles for an outline. A published
+    lesson is served from its snapshot (see LessonPublishView).
+    """
 
     def get(self, request, tenant_id, user_id, lesson_id):
+        serializer = LessonDetailQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
         _user, lesson = validate_tenant_user_lesson(tenant_id, user_id, lesson_id)
-        return Response(assemble_lesson(lesson, tenant_id, user_id))
+        gzip = accepts_gzip(request.headers.get("Accept-Encoding", ""))
+        response = HttpResponse(
+            render_lesson(
+                lesson,
+                tenant_id,
+                user_id,
+                gzip=gzip,
+                known_version=serializer.validated_data.get("content_version"),
+                fields=serializer.validated_data.get("fields"),
+            ),
+            content_type="application/json",
+        )
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
 
 
 class ProgressUpsertView(APIView):
-    """PUT /tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}/progress"""
+    """
+    PUT /tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}/progress
+
+    GET on the same URL returns the user's progress rows for the lesson,
+    only those updated after `?since=` when given, with the current
+    progress_summary and the `cursor` to pass as the next `since`.
+    """
+
+    def get(self, request, tenant_id, user_id, lesson_id):
+        serializer = ProgressSyncQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        _user, lesson = validate_tenant_user_lesson(tenant_id, user_id, lesson_id)
+        return Response(
+            lesson_progress_delta(
+                tenant_id,
+                user_id,
+                lesson_id,
+                since=serializer.validated_data.get("since"),
+                published_version=lesson.published_version,
+            )
+        )
 
     def put(self, request, tenant_id, user_id, lesson_id):
         _user, lesson = validate_tenant_user_lesson(tenant_id, user_id, lesson_id)
@@ -71,7 +158,7 @@ class ProgressUpsertView(APIView):
         req_status = serializer.validated_data["status"]
 
         # Fetch structure — used for block validation and summary
-        structure = get_lesson_structure(lesson_id, tenant_id)
+        structure = get_lesson_structure(lesson_id, tenant_id, lesson.published_version)
         validate_block_in_lesson(structure, lesson_id, block_id)
 
         stored_status = upsert_progress(user_id, lesson_id, block_id, req_status)
@@ -84,3 +171,116 @@ class ProgressUpsertView(APIView):
                 "progress_summary": compute_progress_summary(structure, progress_map),
             }
         )
+
+
+class UserProgressView(APIView):
+    """
+    GET /tenants/{tenant_id}/users/{user_id}/progress
+
+    The lesson progress GET for every lesson the user has progress in;
+    with `?since=`, only lessons with rows updated after it.
+    """
+
+    def get(self, request, tenant_id, user_id):
+        serializer = ProgressSyncQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        validate_tenant_user(tenant_id, user_id)
+        return Response(
+            user_progress_delta(
+                tenant_id, user_id, since=serializer.validated_data.get("since")
+            )
+        )
+
+
+class LessonAnalyticsView(APIView):
+    """GET /tenants/{tenant_id}/analytics/lessons"""
+
+    def get(self, request, tenant_id):
+        stats = lesson_completion_stats(tenant_id)
+        if not stats and not Tenant.objects.filter(pk=tenant_id).exists():
+            raise NotFound("Tenant not found")
+        return Response({"lessons": stats})
+
+
+class ProgressExportView(APIView):
+    """
+    GET /tenants/{tenant_id}/progress/export
+
+    Streams the tenant's progress rows as NDJSON or CSV, ordered by
+    (user_id, lesson_id, block_id). Resume an interrupted export by passing
+    the last received row's keys as `after=user_id:lesson_id:block_id`.
+    """
+
+    def get(self, request, tenant_id):
+        serializer = ProgressExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if not Tenant.objects.filter(pk=tenant_id).exists():
+            raise NotFound("Tenant not found")
+
+        encode, content_type = EXPORT_FORMATS[params["format"]]
+        rows = iter_progress_rows(
+            tenant_id,
+            lesson_id=params.get("lesson_id"),
+            updated_from=params.get("updated_from"),
+            updated_to=params.get("updated_to"),
+            after=params.get("after"),
+        )
+        return StreamingHttpResponse(encode(rows), content_type=content_type)
+
+
+class ContentBulkView(APIView):
+    """
+    POST /content/bulk — default variants
+    POST /tenants/{tenant_id}/content/bulk — the tenant's overrides and
+    lesson blocks
+
+    Applies many variant and lesson block changes in one transaction with
+    set-based SQL (see lessons.services.bulk_content) and invalidates the
+    affected lessons once.
+    """
+
+    def post(self, request, tenant_id=None):
+        serializer = ContentBulkRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(apply_content_changes(tenant_id, **serializer.validated_data))
+
+
+class LessonPublishView(APIView):
+    """
+    POST /tenants/{tenant_id}/lessons/{lesson_id}/publish
+    DELETE on the same URL
+
+    POST freezes the lesson's current content into an immutable snapshot
+    and serves the lesson from it (see lessons.services.snapshots); later
+    edits stay a draft until the next POST. 201 when a new snapshot was
+    written, 200 when the current version was already published. DELETE
+    goes back to serving the live content.
+    """
+
+    def post(self, request, tenant_id, lesson_id):
+        result = publish_lesson(lesson_id, tenant_id)
+        return Response(
+            result,
+            status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK,
+        )
+
+    def delete(self, request, tenant_id, lesson_id):
+        unpublish_lesson(lesson_id, tenant_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CacheStatsView(APIView):
+    """
+    GET /cache/stats
+
+    Occupancy and hit rate of this process's default cache, for backends
+    that keep them (lessons.cache_backends); 404 for the others.
+    """
+
+    def get(self, request):
+        stats = getattr(cache, "stats", None)
+        if stats is None:
+            raise NotFound("The cache backend keeps no statistics")
+        return Response(stats())
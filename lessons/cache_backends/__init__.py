@@ -0,0 +1,8 @@
+"""
+Cache backends for lesson content, selected in settings.CACHES:
+
+- shared_memory.SharedMemoryCache: one memory-mapped file shared by every
+  worker process on a host.
+- tinylfu.TinyLFUCache: in-process, with a byte budget and W-TinyLFU
+  admission and eviction.
+"""
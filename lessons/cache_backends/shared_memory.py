@@ -0,0 +1,460 @@
+"""
+A cache backend in a memory-mapped file shared by every worker process on a
+host, so a lesson structure or body cached by one worker is a hit in all of
+them and is held once in memory, not once per worker as with LocMemCache.
+
+Layout: a header page, then two arenas of which one is active. An arena is
+an index of SLOTS (key hash, entry offset) pairs, open-addressed with linear
+probing, followed by entries appended in write order:
+
+    self offset, key hash, expiry, key length, value length, key, value
+
+Entries are never changed once written. A set appends a new entry and then
+points the key's index slot at it; a delete points the slot at a tombstone.
+Readers take no locks: they probe the index, check that the entry they land
+on is the one they asked for, and unpickle the value straight from the
+mapping, without copying it out first.
+
+Writers (set, add, incr, delete, ...) take a process lock and an flock on the
+file. When the active arena runs out of data space or free slots, the writer
+compacts: it copies the live, unexpired entries into the other arena
+(dropping the oldest ones if more than half of it would be used), then
+flips the header's epoch to make that arena active. A reader that started
+before a flip keeps reading the old arena, which stays intact until the
+compaction after next starts overwriting it; `overwriting` in the header
+says when that happens, and the reader then retries.
+
+Aligned 8-byte stores are atomic on the platforms we deploy to (x86-64,
+arm64), and entries are fully written before a slot points at them. A
+reader that still lands on a half-updated slot fails the entry check and
+sees a miss.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MAGIC = b"PAIRSHM1"
+HEADER_SIZE = 4096
+DEFAULT_SIZE = 256 * 2**20
+DEFAULT_SLOTS = 2**16
+
+# Header fields, each 8 bytes at a fixed offset.
+_MAGIC_AT = 0
+_SLOTS_AT = 8
+_ARENA_SIZE_AT = 16
+_EPOCH_AT = 24  # active arena: epoch % 2
+_OVERWRITING_AT = 32  # epoch whose arena a compaction is writing
+_TAIL_AT = 40  # end of the active arena's entries
+_USED_SLOTS_AT = 48  # live and tombstoned slots in the active arena
+
+_Q = struct.Struct("<Q")
+_SLOT = struct.Struct("<QQ")  # key hash, entry offset (0: empty)
+_ENTRY = struct.Struct("<QQdII")  # self offset, key hash, expiry, lengths
+_EMPTY = 0
+_TOMBSTONE = 1
+_NEVER = 0.0
+_MAX_LOAD = 0.75  # of the slots, before compacting
+_KEEP = 0.5  # of the data space a compaction may fill
+
+
+def _key_hash(key_bytes):
+    # hash() is salted per process; the index is shared between processes.
+    value = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), "little")
+    return value or 1
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+class _Retry(Exception):
+    """A reader's arena was overwritten while it read."""
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    LOCATION is the file, ideally on tmpfs (/dev/shm). OPTIONS: SIZE (bytes
+    for the whole file, default 256 MiB; each arena gets half) and SLOTS
+    (index slots per arena, default 65536). Processes sharing a file must
+    use the same options; the first to open it lays it out.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._size = int(options.get("SIZE", DEFAULT_SIZE))
+        self._slots = int(options.get("SLOTS", DEFAULT_SLOTS))
+        self._arena_size = (self._size - HEADER_SIZE) // 2
+        self._data_start = _align(self._slots * _SLOT.size)
+        if self._arena_size <= self._data_start:
+            raise ValueError("SIZE is too small for SLOTS")
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._buffer = None
+
+    # Mapping
+
+    def _map(self):
+        # A forked worker opens its own file description: an inherited one
+        # would share the parent's flock.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._open()
+        return self._buffer
+
+    def _open(self):
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != self._size:
+                os.ftruncate(fd, self._size)
+            buffer = mmap.mmap(fd, self._size)
+            if (
+                buffer[:8] != MAGIC
+                or self._header(buffer, _SLOTS_AT) != self._slots
+                or self._header(buffer, _ARENA_SIZE_AT) != self._arena_size
+            ):
+                self._initialise(buffer)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._buffer, self._pid = fd, buffer, os.getpid()
+
+    def _initialise(self, buffer):
+        buffer[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        for arena in (0, 1):
+            base = self._base(arena)
+            buffer[base : base + self._data_start] = bytes(self._data_start)
+        _Q.pack_into(buffer, _SLOTS_AT, self._slots)
+        _Q.pack_into(buffer, _ARENA_SIZE_AT, self._arena_size)
+        _Q.pack_into(buffer, _TAIL_AT, self._data_start)
+        buffer[:8] = MAGIC
+
+    @staticmethod
+    def _header(buffer, field):
+        return _Q.unpack_from(buffer, field)[0]
+
+    def _base(self, arena):
+        return HEADER_SIZE + arena * self._arena_size
+
+    # Reads (no locks)
+
+    def _entry_at(self, buffer, base, offset, key_bytes, key_hash):
+        """(expiry, value start, value end) if the entry at `offset` is the key's."""
+        if offset < self._data_start or offset + _ENTRY.size > self._arena_size:
+            return None
+        self_offset, entry_hash, expiry, key_len, value_len = _ENTRY.unpack_from(
+            buffer, base + offset
+        )
+        start = base + offset + _ENTRY.size
+        end = start + key_len + value_len
+        if (
+            self_offset != offset
+            or entry_hash != key_hash
+            or key_len != len(key_bytes)
+            or end > base + self._arena_size
+            or buffer[start : start + key_len] != key_bytes
+        ):
+            return None
+        return expiry, start + key_len, end
+
+    def _probe(self, buffer, base, key_bytes, key_hash):
+        """(slot, entry) of the key's live entry, or (None, None)."""
+        slot = key_hash % self._slots
+        for _ in range(self._slots):
+            slot_hash, offset = _SLOT.unpack_from(buffer, base + slot * _SLOT.size)
+            if offset == _EMPTY:
+                break
+            if slot_hash == key_hash and offset != _TOMBSTONE:
+                entry = self._entry_at(buffer, base, offset, key_bytes, key_hash)
+                if entry is not None:
+                    return slot, entry
+            slot = (slot + 1) % self._slots
+        return None, None
+
+    def _read(self, buffer, key_bytes, key_hash, default):
+        epoch = self._header(buffer, _EPOCH_AT)
+        try:
+            _slot, entry = self._probe(
+                buffer, self._base(epoch % 2), key_bytes, key_hash
+            )
+            value = default
+            if entry is not None:
+                expiry, start, end = entry
+                if expiry == _NEVER or expiry > time.time():
+                    with memoryview(buffer) as view:
+                        value = pickle.loads(view[start:end])
+        except Exception:
+            value = default
+            torn = True
+        else:
+            torn = False
+        if self._header(buffer, _OVERWRITING_AT) >= epoch + 2:
+            raise _Retry
+        if torn:
+            # The arena was intact, so the entry really is unreadable.
+            return default
+        return value
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        key_bytes = key.encode()
+        key_hash = _key_hash(key_bytes)
+        buffer = self._map()
+        while True:
+            try:
+                return self._read(buffer, key_bytes, key_hash, default)
+            except _Retry:
+                continue
+
+    def has_key(self, key, version=None):
+        sentinel = object()
+        return self.get(key, sentinel, version=version) is not sentinel
+
+    # Writes (process lock, then flock)
+
+    def _write_lock(self):
+        buffer = self._map()
+        lock = _WriteLock(self._lock, self._fd)
+        return buffer, lock
+
+    def _active_base(self, buffer):
+        return self._base(self._header(buffer, _EPOCH_AT) % 2)
+
+    def _find_free(self, buffer, base, key_hash):
+        slot = key_hash % self._slots
+        while True:
+            slot_hash, offset = _SLOT.unpack_from(buffer, base + slot * _SLOT.size)
+            if offset in (_EMPTY, _TOMBSTONE):
+                return slot, offset == _EMPTY
+            slot = (slot + 1) % self._slots
+
+    def _store(self, buffer, key_bytes, value_bytes, expiry):
+        """Append an entry and point the key's slot at it. False if it can't fit."""
+        key_hash = _key_hash(key_bytes)
+        size = _align(_ENTRY.size + len(key_bytes) + len(value_bytes))
+        if size > (self._arena_size - self._data_start) * _KEEP:
+            self._remove(buffer, key_bytes)
+            return False
+        if (
+            self._header(buffer, _TAIL_AT) + size > self._arena_size
+            or self._header(buffer, _USED_SLOTS_AT) + 1 > self._slots * _MAX_LOAD
+        ):
+            self._compact(buffer, reserve=size)
+
+        base = self._active_base(buffer)
+        offset = self._header(buffer, _TAIL_AT)
+        _ENTRY.pack_into(
+            buffer,
+            base + offset,
+            offset,
+            key_hash,
+            expiry,
+            len(key_bytes),
+            len(value_bytes),
+        )
+        start = base + offset + _ENTRY.size
+        buffer[start : start + len(key_bytes)] = key_bytes
+        buffer[start + len(key_bytes) : start + len(key_bytes) + len(value_bytes)] = (
+            value_bytes
+        )
+        _Q.pack_into(buffer, _TAIL_AT, offset + size)
+
+        slot, _entry = self._probe(buffer, base, key_bytes, key_hash)
+        if slot is None:
+            slot, empty = self._find_free(buffer, base, key_hash)
+            if empty:
+                used = self._header(buffer, _USED_SLOTS_AT)
+                _Q.pack_into(buffer, _USED_SLOTS_AT, used + 1)
+        # Offset first: a reader matching the hash before the offset lands
+        # sees an empty slot or a tombstone, i.e. a miss.
+        slot_at = base + slot * _SLOT.size
+        _Q.pack_into(buffer, slot_at + 8, offset)
+        _Q.pack_into(buffer, slot_at, key_hash)
+        return True
+
+    def _remove(self, buffer, key_bytes):
+        base = self._active_base(buffer)
+        slot, _entry = self._probe(buffer, base, key_bytes, _key_hash(key_bytes))
+        if slot is None:
+            return False
+        _Q.pack_into(buffer, base + slot * _SLOT.size + 8, _TOMBSTONE)
+        return True
+
+    def _live_entries(self, buffer, base, now):
+        """(offset, size, key hash) of live, unexpired entries, oldest first."""
+        entries = []
+        for slot in range(self._slots):
+            _slot_hash, offset = _SLOT.unpack_from(buffer, base + slot * _SLOT.size)
+            if offset in (_EMPTY, _TOMBSTONE):
+                continue
+            _self, key_hash, expiry, key_len, value_len = _ENTRY.unpack_from(
+                buffer, base + offset
+            )
+            if expiry == _NEVER or expiry > now:
+                entries.append(
+                    (offset, _align(_ENTRY.size + key_len + value_len), key_hash)
+                )
+        entries.sort()
+        return entries
+
+    def _compact(self, buffer, reserve=0, keep=True):
+        epoch = self._header(buffer, _EPOCH_AT)
+        source, target = self._base(epoch % 2), self._base((epoch + 1) % 2)
+        entries = self._live_entries(buffer, source, time.time()) if keep else []
+
+        # Keep the newest entries that fit in half the data space.
+        budget = (self._arena_size - self._data_start) * _KEEP - reserve
+        slots = int(self._slots * _KEEP)
+        kept = []
+        for entry in reversed(entries):
+            if len(kept) == slots or entry[1] > budget:
+                break
+            budget -= entry[1]
+            kept.append(entry)
+        kept.reverse()
+
+        _Q.pack_into(buffer, _OVERWRITING_AT, epoch + 1)
+        buffer[target : target + self._data_start] = bytes(self._data_start)
+        tail = self._data_start
+        for offset, size, key_hash in kept:
+            buffer.move(target + tail, source + offset, size)
+            _Q.pack_into(buffer, target + tail, tail)
+            slot = key_hash % self._slots
+            while _SLOT.unpack_from(buffer, target + slot * _SLOT.size)[1] != _EMPTY:
+                slot = (slot + 1) % self._slots
+            _SLOT.pack_into(buffer, target + slot * _SLOT.size, key_hash, tail)
+            tail += size
+        _Q.pack_into(buffer, _TAIL_AT, tail)
+        _Q.pack_into(buffer, _USED_SLOTS_AT, len(kept))
+        _Q.pack_into(buffer, _EPOCH_AT, epoch + 1)
+
+    def _expiry(self, timeout):
+        expiry = self.get_backend_timeout(timeout)
+        return _NEVER if expiry is None else expiry
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        buffer, lock = self._write_lock()
+        with lock:
+            self._store(buffer, key.encode(), value_bytes, self._expiry(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries = [
+            (
+                self.make_and_validate_key(key, version=version).encode(),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            )
+            for key, value in data.items()
+        ]
+        expiry = self._expiry(timeout)
+        buffer, lock = self._write_lock()
+        with lock:
+            for key_bytes, value_bytes in entries:
+                self._store(buffer, key_bytes, value_bytes, expiry)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        key_bytes = key.encode()
+        value_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        buffer, lock = self._write_lock()
+        with lock:
+            _slot, entry = self._probe(
+                buffer, self._active_base(buffer), key_bytes, _key_hash(key_bytes)
+            )
+            if entry is not None and (entry[0] == _NEVER or entry[0] > time.time()):
+                return False
+            return self._store(buffer, key_bytes, value_bytes, self._expiry(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        key_bytes = key.encode()
+        buffer, lock = self._write_lock()
+        with lock:
+            _slot, entry = self._probe(
+                buffer, self._active_base(buffer), key_bytes, _key_hash(key_bytes)
+            )
+            if entry is None or not (entry[0] == _NEVER or entry[0] > time.time()):
+                return False
+            _expiry, start, end = entry
+            return self._store(
+                buffer, key_bytes, buffer[start:end], self._expiry(timeout)
+            )
+
+    def incr(self, key, delta=1, version=None):
+        # BaseCache.incr is a get and a set: concurrent workers would lose
+        # increments (e.g. the validation 404 budget's counts).
+        key = self.make_and_validate_key(key, version=version)
+        key_bytes = key.encode()
+        buffer, lock = self._write_lock()
+        with lock:
+            _slot, entry = self._probe(
+                buffer, self._active_base(buffer), key_bytes, _key_hash(key_bytes)
+            )
+            if entry is None or not (entry[0] == _NEVER or entry[0] > time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            expiry, start, end = entry
+            value = pickle.loads(buffer[start:end]) + delta
+            self._store(
+                buffer, key_bytes, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expiry
+            )
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        buffer, lock = self._write_lock()
+        with lock:
+            return self._remove(buffer, key.encode())
+
+    def delete_many(self, keys, version=None):
+        keys = [
+            self.make_and_validate_key(key, version=version).encode() for key in keys
+        ]
+        buffer, lock = self._write_lock()
+        with lock:
+            for key_bytes in keys:
+                self._remove(buffer, key_bytes)
+
+    def clear(self):
+        buffer, lock = self._write_lock()
+        with lock:
+            self._compact(buffer, keep=False)
+
+    def stats(self):
+        """Occupancy of the active arena: entries, slots and bytes used."""
+        buffer = self._map()
+        return {
+            "slots_used": self._header(buffer, _USED_SLOTS_AT),
+            "slots": self._slots,
+            "bytes_used": self._header(buffer, _TAIL_AT) - self._data_start,
+            "bytes": self._arena_size - self._data_start,
+            "compactions": self._header(buffer, _EPOCH_AT),
+        }
+
+
+class _WriteLock:
+    """The process's lock for its threads, then flock for other processes."""
+
+    def __init__(self, lock, fd):
+        self._lock = lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
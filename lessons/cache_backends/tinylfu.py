@@ -0,0 +1,329 @@
+"""
+An in-process cache backend with a memory budget in bytes and W-TinyLFU
+admission and eviction.
+
+LocMemCache evicts by entry count, in LRU order, so a 1,000-block lesson
+weighs the same as a 3-block one and a burst of one-off reads (a crawler, an
+export) flushes the lessons everyone is reading. Here every entry weighs its
+pickled size, and the cache is split by bytes into:
+
+- a window LRU (1% by default) that takes every new entry;
+- a main area of probation and protected LRUs (20/80) holding entries that
+  were read again.
+
+An entry pushed out of the window only enters the main area if it is read
+more often than the entries it would push out of probation, as counted by a
+count-min sketch of recent reads. Counts are halved periodically, so the
+sketch follows changes in popularity. One large, rarely read lesson
+therefore can't evict many small, popular ones, and a scan of cold lessons
+stays in the window.
+
+Like LocMemCache, entries are shared by the threads of a process (keyed by
+LOCATION) and guarded by one lock.
+"""
+
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+DEFAULT_WINDOW = 0.01
+DEFAULT_PROTECTED = 0.8
+AVERAGE_ENTRY_BYTES = 4096  # sizes the sketch: one counter per expected entry
+MAX_COUNT = 15
+_HALVE = bytes(count >> 1 for count in range(256))
+_SEEDS = (
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0x27D4EB2F165667C5,
+)
+_MASK64 = 2**64 - 1
+
+_stores = {}
+_stores_lock = Lock()
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of how often keys were read: 4 rows of byte counters
+    capped at MAX_COUNT. After `10 * width` increments every counter is
+    halved, so old popularity fades.
+    """
+
+    def __init__(self, width):
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self._rows = [bytearray(self.width) for _ in _SEEDS]
+        self._sample = 10 * self.width
+        self._additions = 0
+
+    def _indexes(self, key):
+        key_hash = hash(key)
+        shift = 64 - self.width.bit_length() + 1
+        return [(((key_hash ^ seed) * seed) & _MASK64) >> shift for seed in _SEEDS]
+
+    def frequency(self, key):
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def increment(self, key):
+        indexes = self._indexes(key)
+        least = min(row[i] for row, i in zip(self._rows, indexes))
+        if least == MAX_COUNT:
+            return
+        for row, i in zip(self._rows, indexes):
+            # Conservative update: only the rows at the minimum grow.
+            if row[i] == least:
+                row[i] = least + 1
+        self._additions += 1
+        if self._additions >= self._sample:
+            self._rows = [bytearray(row.translate(_HALVE)) for row in self._rows]
+            self._additions //= 2
+
+
+class _Entry:
+    __slots__ = ("pickled", "expiry", "size", "segment")
+
+    def __init__(self, pickled, expiry, size, segment):
+        self.pickled = pickled
+        self.expiry = expiry
+        self.size = size
+        self.segment = segment
+
+    def expired(self, now):
+        return self.expiry is not None and self.expiry <= now
+
+
+class _Segment:
+    """An LRU of entries, oldest first, and the bytes they hold."""
+
+    __slots__ = ("entries", "bytes")
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def push(self, key, entry):
+        entry.segment = self
+        self.entries[key] = entry
+        self.bytes += entry.size
+
+    def pop(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        return entry
+
+
+class _Store:
+    """Entries and statistics of one LOCATION, shared by every thread."""
+
+    def __init__(self, max_bytes, window, protected):
+        self.lock = Lock()
+        self.max_bytes = max_bytes
+        self.window_bytes = max(int(max_bytes * window), 1)
+        self.main_bytes = max_bytes - self.window_bytes
+        self.protected_bytes = int(self.main_bytes * protected)
+        self.reset()
+
+    def reset(self):
+        self.keys = {}
+        self.window = _Segment()
+        self.probation = _Segment()
+        self.protected = _Segment()
+        self.sketch = FrequencySketch(max(self.max_bytes // AVERAGE_ENTRY_BYTES, 1024))
+        self.hits = self.misses = 0
+        self.admitted = self.rejected = self.evicted = 0
+
+    def lookup(self, key, now):
+        """The key's live entry, or None. Expired entries are dropped."""
+        entry = self.keys.get(key)
+        if entry is not None and entry.expired(now):
+            self.remove(key)
+            return None
+        return entry
+
+    def remove(self, key):
+        entry = self.keys.pop(key, None)
+        if entry is not None:
+            entry.segment.pop(key)
+        return entry
+
+    def read(self, key, now):
+        """Record a read of `key` and return its entry (None on a miss)."""
+        self.sketch.increment(key)
+        entry = self.lookup(key, now)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        segment = entry.segment
+        if segment is self.probation:
+            self.probation.pop(key)
+            self.protected.push(key, entry)
+            self._demote()
+        else:
+            segment.entries.move_to_end(key)
+        return entry
+
+    def write(self, key, pickled, expiry, now):
+        """Store `pickled`. False if it's larger than the whole cache."""
+        size = len(key) + len(pickled)
+        self.remove(key)
+        if size > self.main_bytes:
+            return False
+        entry = _Entry(pickled, expiry, size, None)
+        self.keys[key] = entry
+        self.window.push(key, entry)
+        while self.window.bytes > self.window_bytes:
+            candidate, entry = self.window.entries.popitem(last=False)
+            self.window.bytes -= entry.size
+            self._admit(candidate, entry, now)
+        return True
+
+    def _demote(self):
+        while self.protected.bytes > self.protected_bytes:
+            key, entry = self.protected.entries.popitem(last=False)
+            self.protected.bytes -= entry.size
+            self.probation.push(key, entry)
+
+    def _admit(self, candidate, entry, now):
+        """Move an entry out of the window into probation, if it earns it."""
+        needed = self.probation.bytes + self.protected.bytes + entry.size
+        needed -= self.main_bytes
+        victims = []
+        if needed > 0:
+            frequency = self.sketch.frequency(candidate)
+            # Probation first, oldest first, then protected.
+            for segment in (self.probation, self.protected):
+                for key, victim in segment.entries.items():
+                    if needed <= 0:
+                        break
+                    if not victim.expired(now):
+                        if self.sketch.frequency(key) >= frequency:
+                            del self.keys[candidate]
+                            self.rejected += 1
+                            return
+                    victims.append(key)
+                    needed -= victim.size
+        for key in victims:
+            self.remove(key)
+        self.evicted += len(victims)
+        self.probation.push(candidate, entry)
+        self.admitted += 1
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self.keys),
+            "bytes_used": (
+                self.window.bytes + self.probation.bytes + self.protected.bytes
+            ),
+            "bytes": self.max_bytes,
+            "window_bytes": self.window.bytes,
+            "probation_bytes": self.probation.bytes,
+            "protected_bytes": self.protected.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+
+class TinyLFUCache(BaseCache):
+    """
+    OPTIONS: MAX_BYTES (default 64 MiB, counting keys and pickled values),
+    WINDOW (share of it for new entries, default 0.01) and PROTECTED (share
+    of the rest for entries read more than once, default 0.8).
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        with _stores_lock:
+            self._store = _stores.get(location)
+            if self._store is None:
+                self._store = _stores[location] = _Store(
+                    int(options.get("MAX_BYTES", DEFAULT_MAX_BYTES)),
+                    float(options.get("WINDOW", DEFAULT_WINDOW)),
+                    float(options.get("PROTECTED", DEFAULT_PROTECTED)),
+                )
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        store = self._store
+        with store.lock:
+            entry = store.read(key, time.time())
+            if entry is None:
+                return default
+            pickled = entry.pickled
+        return pickle.loads(pickled)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            return self._store.lookup(key, time.time()) is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._store.lock:
+            self._store.write(key, pickled, self._expiry(timeout), time.time())
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        with self._store.lock:
+            if self._store.lookup(key, now) is not None:
+                return False
+            return self._store.write(key, pickled, self._expiry(timeout), now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            entry = self._store.lookup(key, time.time())
+            if entry is None:
+                return False
+            entry.expiry = self._expiry(timeout)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        store = self._store
+        with store.lock:
+            entry = store.lookup(key, time.time())
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(entry.pickled) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            store.write(key, pickled, entry.expiry, time.time())
+        return new_value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            return self._store.remove(key) is not None
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        with self._store.lock:
+            for key in keys:
+                self._store.remove(key)
+
+    def clear(self):
+        with self._store.lock:
+            self._store.reset()
+
+    def stats(self):
+        """Occupancy by area, hit rate and admission counts, for this process."""
+        with self._store.lock:
+            return self._store.stats()
@@ -0,0 +1,88 @@
+import pickle
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from lessons.management.synthetic import synthetic_rows
+from lessons.services.assembly import (
+    LessonStructure,
+    build_lesson_response,
+    compute_progress_summary,
+)
+from lessons.services.lesson_body import build_lesson_body, encode_lesson_response
+
+
+def _best_of(func, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request CPU and bytes on the wire for lesson GET bodies "
+        "on generated lessons: DRF rendering (optionally gzipped per request, "
+        "as GZipMiddleware would) against splicing a cached LessonBody."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, nargs="+", default=[5, 20, 100, 1000])
+        parser.add_argument(
+            "--data-bytes",
+            type=int,
+            default=200,
+            help="Approximate text per variant",
+        )
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, blocks, data_bytes, runs, seed, **options):
+        lesson = SimpleNamespace(id=1, slug="generated", title="Generated lesson")
+        renderer = JSONRenderer()
+        rng = random.Random(seed)
+        self.stdout.write(f"{'blocks':>6} {'body':<16} {'bytes':>9} {'us/request':>10}")
+        for count in blocks:
+            structure = LessonStructure.from_rows(
+                synthetic_rows(count, data_bytes, seed)
+            )
+            progress_map = {
+                block_id: rng.choice(("seen", "completed"))
+                for block_id in structure.block_ids
+                if rng.random() < 0.5
+            }
+            start = time.perf_counter()
+            body = build_lesson_body(structure)
+            build = time.perf_counter() - start
+
+            def drf():
+                return renderer.render(
+                    build_lesson_response(lesson, structure, progress_map)
+                )
+
+            def spliced(gzip):
+                summary = compute_progress_summary(body, progress_map)
+                return encode_lesson_response(lesson, body, progress_map, summary, gzip)
+
+            for name, func in (
+                ("DRF", drf),
+                ("DRF + gzip", lambda: compress_string(drf())),
+                ("spliced", lambda: spliced(False)),
+                ("spliced gzip", lambda: spliced(True)),
+            ):
+                self.stdout.write(
+                    f"{count:>6} {name:<16} {len(func()):>9} "
+                    f"{_best_of(func, runs) * 1e6:>10.1f}"
+                )
+            self.stdout.write(
+                f"{count:>6} LessonBody built in {build * 1e6:.0f} us, cached as "
+                f"{len(pickle.dumps(body, pickle.HIGHEST_PROTOCOL))} bytes "
+                f"(LessonStructure: "
+                f"{len(pickle.dumps(structure, pickle.HIGHEST_PROTOCOL))})"
+            )
@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from lessons.services.assembly import get_progress_map
+from lessons.services.progress import upsert_progress
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "p50": statistics.median(ordered) * 1000,
+        "p95": ordered[int(len(ordered) * 0.95) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark user_block_progress: get_progress_map and upsert_progress "
+        "latency on random existing (user, lesson) pairs, index sizes, and "
+        "VACUUM (ANALYZE) time. Run before and after partition_progress. "
+        "The upserts write 'completed' rows: use a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--skip-vacuum", action="store_true")
+
+    def handle(self, *args, samples, seed, **options):
+        with connection.cursor() as cursor:
+            # TABLESAMPLE keeps picking the pairs cheap on a large table.
+            cursor.execute(
+                """
+                SELECT user_id, lesson_id, block_id
+                  FROM user_block_progress TABLESAMPLE SYSTEM (1)
+                 LIMIT %s
+                """,
+                [samples],
+            )
+            keys = cursor.fetchall()
+        if not keys:
+            self.stdout.write("user_block_progress is empty")
+            return
+        random.Random(seed).shuffle(keys)
+
+        reads = []
+        for user_id, lesson_id, _block_id in keys:
+            start = time.perf_counter()
+            get_progress_map(user_id, lesson_id)
+            reads.append(time.perf_counter() - start)
+
+        writes = []
+        for user_id, lesson_id, block_id in keys:
+            start = time.perf_counter()
+            upsert_progress(user_id, lesson_id, block_id, "completed")
+            writes.append(time.perf_counter() - start)
+
+        for name, timings in (("get_progress_map", reads), ("upsert", writes)):
+            stats = _percentiles(timings)
+            self.stdout.write(
+                f"{name}: p50 {stats['p50']:.2f}ms p95 {stats['p95']:.2f}ms "
+                f"({len(timings)} calls)"
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT count(*),
+                       pg_size_pretty(sum(pg_indexes_size(c.oid))),
+                       pg_size_pretty(max(pg_indexes_size(c.oid)))
+                  FROM pg_class c
+                 WHERE c.oid = 'user_block_progress'::regclass
+                    OR c.oid IN (SELECT inhrelid FROM pg_inherits
+                                  WHERE inhparent = 'user_block_progress'::regclass)
+                """)
+            relations, total_index, largest_index = cursor.fetchone()
+        self.stdout.write(
+            f"indexes: {total_index} total, {largest_index} in the largest of "
+            f"{relations} relation(s)"
+        )
+
+        if not options["skip_vacuum"]:
+            with connection.cursor() as cursor:
+                start = time.perf_counter()
+                cursor.execute("VACUUM (ANALYZE) user_block_progress")
+                self.stdout.write(
+                    f"VACUUM (ANALYZE): {time.perf_counter() - start:.2f}s"
+                )
@@ -0,0 +1,69 @@
+import pickle
+import time
+
+from django.core.management.base import BaseCommand
+
+from lessons.management.synthetic import synthetic_rows
+from lessons.services.assembly import LessonStructure
+
+
+def _as_dicts(rows):
+    """The list-of-dicts format cached before LessonStructure."""
+    keys = (
+        "block_id",
+        "block_type",
+        "position",
+        "variant_id",
+        "variant_tenant_id",
+        "variant_data",
+    )
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _best_of(func, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare cached lesson structure formats on generated lessons: "
+        "pickled bytes (what LocMemCache stores per lesson) and the time to "
+        "pickle and unpickle one, for the old list of dicts and LessonStructure."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--blocks", type=int, nargs="+", default=[5, 20, 100, 1000])
+        parser.add_argument(
+            "--data-bytes",
+            type=int,
+            default=200,
+            help="Approximate text per variant",
+        )
+        parser.add_argument("--runs", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, blocks, data_bytes, runs, seed, **options):
+        self.stdout.write(
+            f"{'blocks':>6} {'format':<16} {'bytes':>9} {'dumps us':>9} "
+            f"{'loads us':>9}"
+        )
+        for count in blocks:
+            rows = list(synthetic_rows(count, data_bytes, seed))
+            for name, value in (
+                ("list of dicts", _as_dicts(rows)),
+                ("LessonStructure", LessonStructure.from_rows(rows)),
+            ):
+                payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                dumps = _best_of(
+                    lambda: pickle.dumps(value, pickle.HIGHEST_PROTOCOL), runs
+                )
+                loads = _best_of(lambda: pickle.loads(payload), runs)
+                self.stdout.write(
+                    f"{count:>6} {name:<16} {len(payload):>9} "
+                    f"{dumps * 1e6:>9.1f} {loads * 1e6:>9.1f}"
+                )
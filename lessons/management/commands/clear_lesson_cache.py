@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.services.invalidation import (
+    flush_invalidations,
+    invalidate_lesson_ids,
+    invalidate_tenants,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Make cached live lesson content unreachable for whole tenants "
+        "(--tenant) or for the given lessons, by renewing their cache "
+        "generations. Takes one cache write each, however many entries are "
+        "cached; the old entries age out. Only reaches caches shared with "
+        "the API's processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lesson_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--tenant",
+            type=int,
+            action="append",
+            default=[],
+            dest="tenant_ids",
+            help="Tenant to clear; repeat for several",
+        )
+
+    def handle(self, *args, lesson_ids, tenant_ids, **options):
+        if not lesson_ids and not tenant_ids:
+            raise CommandError("Give lesson ids, --tenant, or both")
+        invalidate_tenants(tenant_ids)
+        invalidate_lesson_ids(lesson_ids)
+        if not flush_invalidations(settings.CACHE_INVALIDATION_FLUSH_TIMEOUT):
+            self.stderr.write(
+                "Timed out waiting for cache evictions; some cached lessons "
+                "may be stale until they expire"
+            )
+        self.stdout.write(
+            f"Renewed cache generations of {len(tenant_ids)} tenants and "
+            f"{len(lesson_ids)} lessons"
+        )
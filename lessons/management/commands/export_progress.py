@@ -0,0 +1,65 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from lessons.models import Tenant
+from lessons.services.export import (
+    EXPORT_FORMATS,
+    iter_progress_rows,
+    parse_export_cursor,
+)
+
+
+def _timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f"Invalid timestamp: {value}")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a tenant's user_block_progress rows as NDJSON or CSV. Rows are "
+        "ordered by (user_id, lesson_id, block_id); restart an interrupted "
+        "export with --after set to the last written row's keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+        parser.add_argument(
+            "--format", choices=sorted(EXPORT_FORMATS), default="ndjson"
+        )
+        parser.add_argument("--lesson", type=int, dest="lesson_id")
+        parser.add_argument("--updated-from", type=_timestamp)
+        parser.add_argument("--updated-to", type=_timestamp)
+        parser.add_argument("--after", help="user_id:lesson_id:block_id")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+
+    def handle(self, *args, tenant_id, **options):
+        if not Tenant.objects.filter(pk=tenant_id).exists():
+            raise CommandError(f"Tenant {tenant_id} not found")
+        after = None
+        if options["after"]:
+            try:
+                after = parse_export_cursor(options["after"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        encode, _content_type = EXPORT_FORMATS[options["format"]]
+        rows = iter_progress_rows(
+            tenant_id,
+            lesson_id=options["lesson_id"],
+            updated_from=options["updated_from"],
+            updated_to=options["updated_to"],
+            after=after,
+        )
+
+        output = options["output"]
+        out = open(output, "w", newline="") if output else sys.stdout
+        try:
+            for chunk in encode(rows):
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
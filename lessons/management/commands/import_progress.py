@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.models import Tenant
+from lessons.services.bulk_import import IMPORT_FORMATS, import_progress
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load user_block_progress from NDJSON or CSV (columns user_id, "
+        "lesson_id, block_id, status and optionally updated_at). Rows are "
+        "COPYed into a staging table, validated in SQL and merged in one "
+        "statement; existing 'completed' rows are never downgraded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, default="ndjson")
+        parser.add_argument(
+            "--tenant", type=int, dest="tenant_id", help="Reject rows of other tenants"
+        )
+        parser.add_argument(
+            "--rejects", help="Write rejected rows (line_no, reason) to this CSV file"
+        )
+
+    def handle(self, *args, path, **options):
+        tenant_id = options["tenant_id"]
+        if tenant_id is not None and not Tenant.objects.filter(pk=tenant_id).exists():
+            raise CommandError(f"Tenant {tenant_id} not found")
+
+        source = sys.stdin if path == "-" else open(path, newline="")
+        rejects = (
+            open(options["rejects"], "w", newline="") if options["rejects"] else None
+        )
+        try:
+            stats = import_progress(
+                source, options["format"], tenant_id=tenant_id, rejects=rejects
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if rejects is not None:
+                rejects.close()
+
+        self.stdout.write(
+            f"Read {stats['rows_read']} rows in {stats['seconds']:.2f}s "
+            f"({stats['rows_per_second']:.0f} rows/s): "
+            f"{stats['rows_merged']} inserted or upgraded, "
+            f"{stats['rows_rejected']} rejected"
+        )
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.models import Tenant
+from lessons.services.tenant_databases import move_tenant
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a tenant's users, lessons and progress to another database "
+        "alias. Afterwards set TENANT_DATABASES[tenant_id] to the target, "
+        "deploy, then remove the old copy with purge_tenant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+        parser.add_argument("target")
+        parser.add_argument(
+            "--source", help="Alias to copy from (default: the current placement)"
+        )
+
+    def handle(self, *args, tenant_id, target, **options):
+        if not Tenant.objects.filter(pk=tenant_id).exists():
+            raise CommandError(f"Tenant {tenant_id} not found")
+        for alias in (target, options["source"]):
+            if alias is not None and alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database alias: {alias}")
+        try:
+            copied = move_tenant(tenant_id, target, source=options["source"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for table, rows in copied.items():
+            self.stdout.write(f"{table}: {rows} rows")
+        self.stdout.write(
+            f"Copied tenant {tenant_id} to {target}. Set "
+            f"TENANT_DATABASES[{tenant_id}] = {target!r}, deploy, then run "
+            f"purge_tenant {tenant_id} <old alias>."
+        )
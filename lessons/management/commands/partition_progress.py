@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.services.export import parse_export_cursor
+from lessons.services.partitioning import (
+    DEFAULT_PARTITIONS,
+    LEGACY_TABLE,
+    copy_batch,
+    is_partitioned,
+    missing_rows,
+    prepare_partitioned_table,
+    swap_partitioned_table,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Migrate user_block_progress to a table hash-partitioned on user_id "
+        "while the API keeps writing: mirror writes with a trigger, backfill "
+        "in batches, then swap the tables. Safe to re-run after an interruption."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches to limit load",
+        )
+        parser.add_argument(
+            "--after",
+            help="Resume the backfill after this user_id:lesson_id:block_id",
+        )
+        parser.add_argument(
+            "--no-swap",
+            action="store_true",
+            help="Stop after the backfill; the trigger keeps the copy current",
+        )
+
+    def handle(self, *args, **options):
+        if is_partitioned():
+            self.stdout.write("user_block_progress is already partitioned")
+            return
+        after = None
+        if options["after"]:
+            try:
+                after = parse_export_cursor(options["after"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        if prepare_partitioned_table(options["partitions"]):
+            self.stdout.write(
+                f"Created {options['partitions']} partitions; mirroring writes"
+            )
+
+        copied = 0
+        started = time.perf_counter()
+        while True:
+            count, last_key = copy_batch(after, options["batch_size"])
+            if last_key is None:
+                break
+            copied += count
+            after = last_key
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Copied {copied} rows ({copied / elapsed:.0f} rows/s), "
+                f"last key {':'.join(map(str, after))}"
+            )
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        if options["no_swap"]:
+            return
+        missing = missing_rows()
+        if missing:
+            raise CommandError(f"{missing} rows were not copied; re-run the backfill")
+        swap_partitioned_table()
+        self.stdout.write(
+            f"Swapped in the partitioned table; the old one is kept as "
+            f"{LEGACY_TABLE} until you drop it"
+        )
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed X-Profile-Token header value for one tenant."
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+
+    def handle(self, *args, tenant_id, **options):
+        if not settings.PROFILING_SECRET:
+            raise CommandError("PROFILING_SECRET is not configured")
+        self.stdout.write(make_profile_token(tenant_id))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.services.tenant_databases import provision_tenant_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the tenant-scoped tables (users, lessons, lesson blocks, "
+        "progress and rollups) on a database alias so tenants can be moved "
+        "there with move_tenant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("alias")
+
+    def handle(self, *args, alias, **options):
+        if alias == "default" or alias not in settings.DATABASES:
+            raise CommandError(f"{alias} is not a tenant database alias")
+        if provision_tenant_database(alias):
+            self.stdout.write(f"Created the tenant schema on {alias}")
+        else:
+            self.stdout.write(f"{alias} already has the tenant schema")
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.services.tenant_databases import purge_tenant
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete a tenant's users, lessons and progress from a database alias "
+        "it has been moved away from. Refuses the alias it is placed on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+        parser.add_argument("alias")
+
+    def handle(self, *args, tenant_id, alias, **options):
+        if alias not in settings.DATABASES:
+            raise CommandError(f"Unknown database alias: {alias}")
+        try:
+            purge_tenant(tenant_id, alias)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"Removed tenant {tenant_id}'s rows from {alias}")
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lessons.models import Lesson
+from lessons.routers import tenant_database, use_tenant_database
+from lessons.services.invalidation import flush_invalidations, invalidate_lessons
+from lessons.services.resolution import rebuild_resolved_lessons
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute resolved_lesson_blocks (and drop cached structures) for the "
+        "given lessons, or for every lesson. Needed after editing lesson_blocks "
+        "or block_variants outside the API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lesson_ids", nargs="*", type=int)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--database", default="default", help="Tenant database alias to rebuild"
+        )
+
+    def handle(self, *args, lesson_ids, batch_size, database, **options):
+        with use_tenant_database(database):
+            self._rebuild_all(lesson_ids, batch_size)
+
+    def _rebuild_all(self, lesson_ids, batch_size):
+        lessons = Lesson.objects.order_by("id").values_list("id", "tenant_id")
+        if lesson_ids:
+            lessons = lessons.filter(id__in=lesson_ids)
+
+        batch = []
+        total = 0
+        for lesson in lessons.iterator(chunk_size=batch_size):
+            batch.append(lesson)
+            if len(batch) >= batch_size:
+                total += self._rebuild(batch)
+                batch = []
+        if batch:
+            total += self._rebuild(batch)
+        if not flush_invalidations(settings.CACHE_INVALIDATION_FLUSH_TIMEOUT):
+            self.stderr.write(
+                "Timed out waiting for cache evictions; some cached lessons "
+                "may be stale until they expire"
+            )
+
+        self.stdout.write(f"Rebuilt resolved blocks for {total} lessons")
+
+    def _rebuild(self, batch):
+        using = tenant_database()
+        with transaction.atomic(using=using):
+            rebuild_resolved_lessons([lesson_id for lesson_id, _tenant_id in batch])
+            invalidate_lessons(
+                [(tenant_id, lesson_id) for lesson_id, tenant_id in batch], using
+            )
+        return len(batch)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from lessons.routers import use_tenant_database
+from lessons.services.rollups import rebuild_progress_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the analytics rollups from user_block_progress. With --since, "
+        "only (user, lesson) pairs with progress updated since then are redone; "
+        "pass lesson ids to redo lessons whose block list changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lesson_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--since",
+            help="ISO timestamp; only refresh progress updated at or after it.",
+        )
+        parser.add_argument(
+            "--database", default="default", help="Tenant database alias to refresh"
+        )
+
+    def handle(self, *args, lesson_ids, since, **options):
+        if since is not None:
+            parsed = parse_datetime(since)
+            if parsed is None:
+                raise CommandError(f"Invalid --since timestamp: {since}")
+            since = parsed
+
+        with use_tenant_database(options["database"]):
+            refreshed = rebuild_progress_rollups(lesson_ids or None, since=since)
+        self.stdout.write(f"Refreshed rollups for {len(refreshed)} lessons")
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lessons.services.invalidation import flush_invalidations
+from lessons.services.tenant_chains import set_tenant_parent, tenant_chain
+
+
+class Command(BaseCommand):
+    help = (
+        "Make a tenant inherit block variants from a parent tenant (its "
+        "reseller), or from the defaults only with --root. Re-resolves the "
+        "lessons of the tenant and of every tenant inheriting from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=int)
+        parser.add_argument("parent_id", type=int, nargs="?")
+        parser.add_argument(
+            "--root", action="store_true", help="Remove the tenant's parent"
+        )
+
+    def handle(self, *args, tenant_id, parent_id, root, **options):
+        if (parent_id is None) == (not root):
+            raise CommandError("Give a parent_id or --root")
+        try:
+            lessons = set_tenant_parent(tenant_id, parent_id)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if not flush_invalidations(settings.CACHE_INVALIDATION_FLUSH_TIMEOUT):
+            self.stderr.write(
+                "Timed out waiting for cache evictions; some cached lessons "
+                "may be stale until they expire"
+            )
+
+        chain = " -> ".join(
+            str(tenant) for tenant in [tenant_id, *tenant_chain(tenant_id)]
+        )
+        self.stdout.write(
+            f"Tenant chain: {chain} -> defaults. Re-resolved {lessons} lessons"
+        )
@@ -0,0 +1,53 @@
+"""Generated lesson content for the benchmark commands."""
+
+import random
+
+_SYLLABLES = "ba ce di fo gu la me ni so tu ra pe ki zo nu an er in on st".split()
+
+
+def _vocabulary(rng, size=2000):
+    return [
+        "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+        for _ in range(size)
+    ]
+
+
+def _text(rng, words, weights, size):
+    """Zipf-distributed words: compresses about as well as English prose."""
+    text = []
+    length = 0
+    while length < size:
+        word = rng.choices(words, weights)[0]
+        text.append(word)
+        length += len(word) + 1
+    return " ".join(text)
+
+
+def _variant_data(rng, words, weights, block_type, size):
+    if block_type == "quiz":
+        return {
+            "question": _text(rng, words, weights, size // 2),
+            "options": [_text(rng, words, weights, size // 8) for _ in range(4)],
+            "answer": rng.randrange(4),
+        }
+    return {"markdown": _text(rng, words, weights, size)}
+
+
+def synthetic_rows(blocks, data_bytes, seed=0):
+    """
+    LessonStructure rows for a generated lesson: every third block a quiz,
+    every fifth a tenant override, about `data_bytes` of text per variant.
+    """
+    rng = random.Random(seed)
+    words = _vocabulary(rng)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    for position in range(1, blocks + 1):
+        block_type = "quiz" if position % 3 == 0 else "markdown"
+        yield (
+            100_000 + position,
+            block_type,
+            position,
+            200_000 + position,
+            1 if position % 5 == 0 else None,
+            _variant_data(rng, words, weights, block_type, data_bytes),
+        )
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lessons", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResolvedLessonBlock",
+            fields=[
+                ("position", models.IntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                "db_table": "resolved_lesson_blocks",
+                "ordering": ["position"],
+                "managed": False,
+            },
+        ),
+    ]
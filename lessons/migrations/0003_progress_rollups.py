@@ -0,0 +1,61 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lessons", "0002_resolved_lesson_blocks"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LessonProgressRollup",
+            fields=[
+                (
+                    "lesson",
+                    models.OneToOneField(
+                        db_column="lesson_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="progress_rollup",
+                        serialize=False,
+                        to="lessons.lesson",
+                    ),
+                ),
+                ("users_started", models.IntegerField()),
+                ("users_completed", models.IntegerField()),
+                ("completed_blocks_total", models.BigIntegerField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "lesson_progress_rollups",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="UserLessonProgress",
+            fields=[
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_column="user_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="lesson_progress",
+                        serialize=False,
+                        to="lessons.user",
+                    ),
+                ),
+                ("seen_blocks", models.IntegerField()),
+                ("completed_blocks", models.IntegerField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "user_lesson_progress",
+                "managed": False,
+            },
+        ),
+    ]
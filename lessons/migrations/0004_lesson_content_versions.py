@@ -0,0 +1,35 @@
+# Generated by Django 4.2.28 on 2026-10-19 08:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lessons", "0003_progress_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LessonContentVersion",
+            fields=[
+                (
+                    "lesson",
+                    models.OneToOneField(
+                        db_column="lesson_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="content_version",
+                        serialize=False,
+                        to="lessons.lesson",
+                    ),
+                ),
+                ("version", models.BigIntegerField()),
+            ],
+            options={
+                "db_table": "lesson_content_versions",
+                "managed": False,
+            },
+        ),
+    ]
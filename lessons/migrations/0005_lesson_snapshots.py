@@ -0,0 +1,25 @@
+# Generated by Django 4.2.28 on 2026-10-19 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lessons", "0004_lesson_content_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LessonSnapshot",
+            fields=[
+                ("version", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("blocks", models.JSONField()),
+                ("published_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "lesson_snapshots",
+                "managed": False,
+            },
+        ),
+    ]
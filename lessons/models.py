@@ -4,6 +4,15 @@ from django.db import models
 class Tenant(models.Model):
     id = models.IntegerField(primary_key=True)
     name = models.TextField()
+    # Tenant whose variants this one inherits (lessons.services.tenant_chains);
+    # change it with set_tenant_parent, never directly.
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.PROTECT,
+        db_column="parent_id",
+        null=True,
+        related_name="children",
+    )
 
     class Meta:
         managed = False
@@ -43,6 +52,9 @@ class Lesson(models.Model):
     slug = models.TextField()
     title = models.TextField()
     created_at = models.DateTimeField()
+    # Content version served from lesson_snapshots; None: not published, the
+    # live content is served.
+    published_version = models.BigIntegerField(null=True)
 
     class Meta:
         managed = False
@@ -150,3 +162,157 @@ class UserBlockProgress(models.Model):
     class Meta:
         managed = False
         db_table = "user_block_progress"
+
+
+class ResolvedLessonBlock(models.Model):
+    """
+    Maps to resolved_lesson_blocks: the variant chosen for each block of a
+    lesson, with composite PK (tenant_id, lesson_id, position).
+    We declare position as primary_key to suppress Django's auto id field.
+    Always filter by (tenant_id, lesson_id). Maintained by
+    lessons.services.resolution — never write to it directly.
+    """
+
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        db_column="tenant_id",
+        related_name="+",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        db_column="lesson_id",
+        related_name="resolved_blocks",
+    )
+    position = models.IntegerField(primary_key=True)
+    block = models.ForeignKey(
+        Block,
+        on_delete=models.CASCADE,
+        db_column="block_id",
+        related_name="+",
+    )
+    variant = models.ForeignKey(
+        BlockVariant,
+        on_delete=models.SET_NULL,
+        db_column="variant_id",
+        null=True,
+        related_name="+",
+    )
+
+    class Meta:
+        managed = False
+        db_table = "resolved_lesson_blocks"
+        ordering = ["position"]
+
+
+class UserLessonProgress(models.Model):
+    """
+    Maps to user_lesson_progress: per-user block counts for one lesson, with
+    composite PK (user_id, lesson_id). We declare user as primary_key to
+    suppress Django's auto id field. Always filter by (user_id, lesson_id).
+    Maintained by lessons.services.rollups.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_column="user_id",
+        primary_key=True,
+        related_name="lesson_progress",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        db_column="lesson_id",
+        related_name="user_progress",
+    )
+    seen_blocks = models.IntegerField()
+    completed_blocks = models.IntegerField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "user_lesson_progress"
+
+
+class LessonProgressRollup(models.Model):
+    """Maps to lesson_progress_rollups. Maintained by lessons.services.rollups."""
+
+    lesson = models.OneToOneField(
+        Lesson,
+        on_delete=models.CASCADE,
+        db_column="lesson_id",
+        primary_key=True,
+        related_name="progress_rollup",
+    )
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        db_column="tenant_id",
+        related_name="+",
+    )
+    users_started = models.IntegerField()
+    users_completed = models.IntegerField()
+    completed_blocks_total = models.BigIntegerField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "lesson_progress_rollups"
+
+
+class LessonContentVersion(models.Model):
+    """
+    Maps to lesson_content_versions: a counter bumped whenever the lesson's
+    content changes for its tenant. Maintained by lessons.services.resolution.
+    """
+
+    lesson = models.OneToOneField(
+        Lesson,
+        on_delete=models.CASCADE,
+        db_column="lesson_id",
+        primary_key=True,
+        related_name="content_version",
+    )
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        db_column="tenant_id",
+        related_name="+",
+    )
+    version = models.BigIntegerField()
+
+    class Meta:
+        managed = False
+        db_table = "lesson_content_versions"
+
+
+class LessonSnapshot(models.Model):
+    """
+    Maps to lesson_snapshots: a lesson's resolved blocks frozen when it was
+    published, with composite PK (tenant_id, lesson_id, version). We declare
+    version as primary_key to suppress Django's auto id field. Always filter
+    by (tenant_id, lesson_id, version). Written by lessons.services.snapshots,
+    never updated.
+    """
+
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        db_column="tenant_id",
+        related_name="+",
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        db_column="lesson_id",
+        related_name="snapshots",
+    )
+    version = models.BigIntegerField(primary_key=True)
+    blocks = models.JSONField()
+    published_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "lesson_snapshots"
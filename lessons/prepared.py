@@ -0,0 +1,85 @@
+"""
+Server-side prepared statements for the hot path.
+
+psycopg2 sends every query as plain text with its parameters inlined, so
+Postgres parses, analyses and plans the progress lookup, the validation
+lookups and the upsert statements from scratch on every request, and the
+ORM compiles them in Python first. A PreparedStatement holds its SQL
+already written out. The first time it runs on a connection it is sent
+once as `PREPARE`; from then on it is `EXECUTE name (params)`, and Postgres
+reuses the parsed statement and, after a few executions, a generic plan.
+
+Prepared statements belong to a database session. Statements are tracked
+per psycopg2 connection object, so when Django opens a new connection
+(CONN_MAX_AGE expiry, a dropped connection, a forked worker) they are
+prepared again on it. PREPARE isn't transactional: a statement prepared in
+a transaction that rolls back stays prepared. The PREPARE is sent on the
+driver's own cursor, as session setup, so query counts (and
+assertNumQueries) see only the EXECUTE.
+
+Connections that don't keep their session across transactions (PgBouncer
+in transaction mode) can't use them: set DATABASE_PREPARED_STATEMENTS to
+False and the same SQL runs unprepared. If a session loses its statements
+anyway (DISCARD ALL), the failed EXECUTE is prepared and run again, unless
+it ran inside a transaction: the failure has aborted it, so it raises and
+the next use prepares again.
+"""
+
+import re
+import weakref
+
+from django.conf import settings
+from django.db import DatabaseError
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
+_PARAM = re.compile(r"%\((\w+)\)s")
+_INVALID_STATEMENT_NAME = "26000"
+
+# psycopg2 connection -> names of the statements prepared on it.
+_prepared = weakref.WeakKeyDictionary()
+
+
+class PreparedStatement:
+    """
+    SQL with `%(name)s` parameters, run as the prepared statement `name`.
+    """
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.params = []
+        for param in _PARAM.findall(sql):
+            if param not in self.params:
+                self.params.append(param)
+        positional = _PARAM.sub(
+            lambda match: f"${self.params.index(match.group(1)) + 1}", sql
+        )
+        self.prepare_sql = f"PREPARE {name} AS {positional}"
+        placeholders = ", ".join(f"%({param})s" for param in self.params)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})"
+
+    def execute(self, cursor, params):
+        """Run on a Django cursor; fetch from the cursor afterwards."""
+        if not settings.DATABASE_PREPARED_STATEMENTS:
+            cursor.execute(self.sql, params)
+            return
+        raw = cursor.db.connection
+        prepared = _prepared.setdefault(raw, set())
+        if self.name not in prepared:
+            self._prepare(raw, prepared)
+        try:
+            cursor.execute(self.execute_sql, params)
+        except DatabaseError as exc:
+            if getattr(exc.__cause__, "pgcode", None) != _INVALID_STATEMENT_NAME:
+                raise
+            # The session was reset under us.
+            prepared.clear()
+            if raw.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+                raise
+            self._prepare(raw, prepared)
+            cursor.execute(self.execute_sql, params)
+
+    def _prepare(self, raw, prepared):
+        with raw.cursor() as raw_cursor:
+            raw_cursor.execute(self.prepare_sql)
+        prepared.add(self.name)
@@ -0,0 +1,87 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries a valid signed `X-Profile-Token` header
+for its tenant, or when it is picked by the tenant's sampling rate in
+PROFILING_TENANT_SAMPLE_RATES. Profiles are cProfile dumps (pstats format),
+which snakeviz, flameprof and gprof2dot turn into flame graphs.
+"""
+
+import os
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+
+PROFILE_HEADER = "HTTP_X_PROFILE_TOKEN"
+_TOKEN_SALT = "lessons.profiling"
+
+
+def _signer():
+    return signing.TimestampSigner(key=settings.PROFILING_SECRET, salt=_TOKEN_SALT)
+
+
+def make_profile_token(tenant_id):
+    """Return a header value that requests a profile for one tenant's request."""
+    return _signer().sign(str(tenant_id))
+
+
+def has_valid_token(request, tenant_id):
+    token = request.META.get(PROFILE_HEADER)
+    if not token or not settings.PROFILING_SECRET:
+        return False
+    try:
+        value = _signer().unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return value == str(tenant_id)
+
+
+def should_profile(request, tenant_id):
+    """Decide whether to profile this request. No work for unsampled tenants."""
+    rate = settings.PROFILING_TENANT_SAMPLE_RATES.get(tenant_id)
+    if rate and random.random() < rate:
+        return True
+    return PROFILE_HEADER in request.META and has_valid_token(request, tenant_id)
+
+
+def write_profile(profiler, tenant_id, label):
+    """
+    Dump `profiler` into PROFILING_DIR, then delete the oldest dumps until the
+    directory fits PROFILING_MAX_BYTES. The newest dump is always kept.
+    """
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    filename = f"tenant{tenant_id}-{label}-{stamp}-{uuid.uuid4().hex[:8]}.prof"
+    path = os.path.join(directory, filename)
+    profiler.dump_stats(path)
+    _prune(directory, settings.PROFILING_MAX_BYTES, keep=path)
+    return path
+
+
+def _prune(directory, max_bytes, keep):
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(".prof"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
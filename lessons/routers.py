@@ -0,0 +1,154 @@
+"""
+Database routing: per-tenant databases and read replicas.
+
+Tenant placement: TENANT_DATABASES maps a tenant_id to the alias holding its
+users, lessons, lesson blocks, snapshots and progress (everything in
+TENANT_SCOPED_MODELS); unlisted tenants live on "default". Shared tables
+(tenants, blocks, block_variants) always stay on "default".
+TenantRoutingMiddleware binds the alias for the URL's tenant_id, so the ORM
+queries in the validation, assembly and progress services go to the right
+database without being passed an alias. Raw SQL and `transaction.atomic`
+take it from `tenant_database()`. Outside a request, bind one with
+`use_tenant_database()`; unbound code uses "default".
+
+Read replicas: ReplicaRoutingMiddleware binds a replica alias to the current
+request context for lesson GETs; reads of default-placed data go to it, while
+writes, and everything outside such a request (PUTs, management commands,
+tests), stay on the primary. So do reads that fill shared caches
+(`use_primary`): a lagging replica would otherwise let one GET cache
+pre-edit content for every user of the tenant.
+
+Read-your-writes: a successful write pins the (tenant, user) to the primary
+for DATABASE_REPLICA_PIN_SECONDS, which should exceed normal replication lag,
+so the progress_summary a user sees right after a PUT never goes backwards.
+Pins live in the default cache, so they are only shared between processes
+when that cache is.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+TENANT_SCOPED_MODELS = {
+    "lessons.User",
+    "lessons.Lesson",
+    "lessons.LessonBlock",
+    "lessons.UserBlockProgress",
+    "lessons.ResolvedLessonBlock",
+    "lessons.UserLessonProgress",
+    "lessons.LessonProgressRollup",
+    "lessons.LessonContentVersion",
+    "lessons.LessonSnapshot",
+}
+
+_read_alias = ContextVar("lessons_read_alias", default=None)
+_tenant_alias = ContextVar("lessons_tenant_alias", default=None)
+
+
+def bind_read_alias(alias):
+    return _read_alias.set(alias)
+
+
+def unbind_read_alias(token):
+    _read_alias.reset(token)
+
+
+def tenant_database(tenant_id=None):
+    """
+    Alias holding a tenant's data. Without a tenant_id, the alias bound to
+    the current context ("default" when nothing is bound).
+    """
+    if tenant_id is None:
+        return _tenant_alias.get() or "default"
+    return settings.TENANT_DATABASES.get(tenant_id, "default")
+
+
+def tenant_databases():
+    """Every alias that may hold tenant data."""
+    return {"default", *settings.TENANT_DATABASES.values()}
+
+
+def bind_tenant_alias(alias):
+    return _tenant_alias.set(alias)
+
+
+def unbind_tenant_alias(token):
+    _tenant_alias.reset(token)
+
+
+@contextmanager
+def use_tenant_database(alias):
+    token = bind_tenant_alias(alias)
+    try:
+        yield alias
+    finally:
+        unbind_tenant_alias(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, even in a request bound to a
+    replica: for reads that fill caches shared with other users, which must
+    not store what a lagging replica returns.
+    """
+    token = bind_read_alias(None)
+    try:
+        yield
+    finally:
+        unbind_read_alias(token)
+
+
+def choose_replica():
+    """Pick the replica for one request; all its reads use the same one."""
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else None
+
+
+def _pin_key(tenant_id, user_id):
+    return f"db-pin:{tenant_id}:{user_id}"
+
+
+def pin_to_primary(tenant_id, user_id):
+    cache.set(_pin_key(tenant_id, user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(tenant_id, user_id):
+    return cache.get(_pin_key(tenant_id, user_id), False)
+
+
+class DatabaseRouter:
+    def _tenant_alias(self, model, hints):
+        alias = _tenant_alias.get()
+        if alias is None:
+            # e.g. lesson_block.lesson for a block loaded from a tenant database
+            instance = hints.get("instance")
+            if instance is not None and instance._state.db in tenant_databases():
+                alias = instance._state.db
+        return alias or "default"
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label in TENANT_SCOPED_MODELS:
+            alias = self._tenant_alias(model, hints)
+            if alias != "default":
+                return alias
+        return _read_alias.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label in TENANT_SCOPED_MODELS:
+            return self._tenant_alias(model, hints)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Tenant rows reference shared rows across databases by id.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas follow the primary; tenant databases are provisioned from
+        # db/*.sql by `manage.py provision_tenant_database`.
+        if db != "default":
+            return False
+        return None
@@ -1,96 +1,512 @@
+import hashlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
 from django.core.cache import cache
-from django.db.models import F, Q
+from django.db import connections, router
+from django.db.models import F, Func, JSONField, Subquery, Value
+
+from lessons.models import (
+    Block,
+    LessonContentVersion,
+    LessonSnapshot,
+    ResolvedLessonBlock,
+    UserBlockProgress,
+)
+from lessons.prepared import PreparedStatement
+from lessons.routers import tenant_database, use_primary
+from lessons.timing import timed
+
+logger = logging.getLogger(__name__)
+
+STRUCTURE_CACHE_TTL = settings.LESSON_CACHE_TTL  # live content, evicted on edits
+SNAPSHOT_CACHE_TTL = 86400  # snapshots never change; this only bounds memory
+FILL_LEASE_TTL = 10  # seconds; only matters if a fill dies half-way
+MAX_VARIANT_FIELDS = 32
+
+
+def structure_cache_key(lesson_id, tenant_id, generation):
+    return f"lesson:{tenant_id}:{lesson_id}:g{generation}"
+
+
+def body_cache_key(lesson_id, tenant_id, generation):
+    """Key of the lesson's LessonBody (lessons.services.lesson_body)."""
+    return f"lesson-body:{tenant_id}:{lesson_id}:g{generation}"
+
+
+def content_version_cache_key(lesson_id, tenant_id, generation):
+    """Key of the content version that projected bodies were built from."""
+    return f"lesson-version:{tenant_id}:{lesson_id}:g{generation}"
+
+
+def _fields_digest(fields):
+    return hashlib.blake2b(",".join(fields).encode(), digest_size=8).hexdigest()
+
+
+def projected_body_cache_key(lesson_id, tenant_id, generation, version, fields):
+    """
+    Key of a LessonBody with variant data projected to `fields`. It carries
+    the content version, so entries of older versions are never read again
+    and just expire; the set of projections needn't be tracked to evict it.
+    """
+    digest = _fields_digest(fields)
+    return f"lesson-body:{tenant_id}:{lesson_id}:g{generation}:{version}:{digest}"
+
+
+def snapshot_cache_key(lesson_id, tenant_id, version):
+    """Key of a published lesson's LessonStructure (see `get_lesson_structure`)."""
+    return f"lesson:{tenant_id}:{lesson_id}:{version}"
+
+
+def snapshot_body_cache_key(lesson_id, tenant_id, version, fields=()):
+    """Key of a published lesson's LessonBody, projected to `fields` if any."""
+    key = f"lesson-body:{tenant_id}:{lesson_id}:{version}"
+    return f"{key}:{_fields_digest(fields)}" if fields else key
+
+
+def lesson_cache_keys(lesson_id, tenant_id, generation):
+    """
+    Every cache entry derived from a lesson's live content for one tenant, in
+    `generation`. Entries of published snapshots are keyed by version and
+    never go stale.
+    """
+    return [
+        structure_cache_key(lesson_id, tenant_id, generation),
+        body_cache_key(lesson_id, tenant_id, generation),
+        content_version_cache_key(lesson_id, tenant_id, generation),
+    ]
+
+
+def tenant_generation_key(tenant_id):
+    return f"lesson-generation:tenant:{tenant_id}"
+
 
-from lessons.models import BlockVariant, LessonBlock, UserBlockProgress
+def lesson_generation_key(lesson_id):
+    return f"lesson-generation:lesson:{lesson_id}"
 
-STRUCTURE_CACHE_TTL = 300  # 5 minutes
 
+def new_generation():
+    # Random rather than counted up: a generation evicted from the cache
+    # comes back as a new one, never as one whose entries are still cached.
+    return uuid.uuid4().hex[:12]
 
-def fetch_lesson_structure(lesson_id, tenant_id):
+
+def lesson_generations(pairs):
+    """
+    {(tenant_id, lesson_id): generation} for live content cache keys. A
+    generation joins the tenant's and the lesson's, so replacing either
+    (lessons.services.invalidation) moves every key built from it to names
+    nothing has cached yet. One cache read, plus one add per generation not
+    set yet.
+    """
+    keys = {
+        pair: (tenant_generation_key(pair[0]), lesson_generation_key(pair[1]))
+        for pair in pairs
+    }
+    generation_keys = list(dict.fromkeys(key for both in keys.values() for key in both))
+    found = cache.get_many(generation_keys)
+    missing = [key for key in generation_keys if key not in found]
+    if missing:
+        created = {key: new_generation() for key in missing}
+        for key, generation in created.items():
+            cache.add(key, generation, None)
+        # Another process may have added first; its generation wins.
+        found.update(created)
+        found.update(cache.get_many(missing))
+    return {
+        pair: f"{found[tenant_key]}.{found[lesson_key]}"
+        for pair, (tenant_key, lesson_key) in keys.items()
+    }
+
+
+def lesson_generation(lesson_id, tenant_id):
+    return lesson_generations([(tenant_id, lesson_id)])[(tenant_id, lesson_id)]
+
+
+def fill_lease_key(cache_key):
+    return f"{cache_key}:fill"
+
+
+def acquire_fill_lease(cache_key):
+    """
+    Claim the right to fill `cache_key`, before reading what goes in it.
+    Returns a token for `fill_cache`, or None while another fill holds it.
     """
-    Fetch lesson structure: ordered blocks with their best variant.
+    token = uuid.uuid4().hex
+    if cache.add(fill_lease_key(cache_key), token, FILL_LEASE_TTL):
+        return token
+    return None
 
 
-      1. LessonBlock rows with block_type (via FK join), ordered by position
-      2. All relevant BlockVariants for these blocks (tenant-specific + defaults)
+def fill_cache(cache_key, token, values, timeout=STRUCTURE_CACHE_TTL):
+    """
+    Store `values`, read from the database under the lease `token` on
+    `cache_key`, and take them back out if the key was invalidated since.
 
-    Then merge in Python: for each block pick tenant override if exists, else default.
+    Invalidation deletes the lease before the entries
+    (lessons.services.invalidation), so a reader whose read predates a
+    change either finds its lease gone here, or stored early enough for the
+    invalidation to delete what it stored. Checking after the store leaves
+    no gap between the two.
     """
-    blocks = list(
-        LessonBlock.objects.filter(lesson_id=lesson_id)
-        .annotate(block_type=F("block__block_type"))
+    lease_key = fill_lease_key(cache_key)
+    cache.set_many(values, timeout)
+    if cache.get(lease_key) == token:
+        cache.delete(lease_key)
+    else:
+        cache.delete_many(list(values))
+
+
+def get_or_fill(cache_key, fetch, timeout=STRUCTURE_CACHE_TTL):
+    """
+    cache.get, or on a miss `fetch()` and cache the result under a fill
+    lease. A miss while another fill is running reads without caching.
+    A fill reads from the primary (`use_primary`), as a replica may not
+    have the change that evicted the entry yet.
+    """
+    value = cache.get(cache_key)
+    if value is None:
+        token = acquire_fill_lease(cache_key)
+        if token is None:
+            return fetch()
+        with use_primary():
+            value = fetch()
+        fill_cache(cache_key, token, {cache_key: value}, timeout)
+    return value
+
+
+def parse_variant_fields(value):
+    """
+    Parse a comma-separated `fields` list into the sorted tuple of distinct
+    variant data keys used for projections and their cache keys.
+    """
+    fields = tuple(sorted({field.strip() for field in value.split(",")} - {""}))
+    if not fields:
+        raise ValueError("fields must name at least one key")
+    if len(fields) > MAX_VARIANT_FIELDS:
+        raise ValueError(f"fields may name at most {MAX_VARIANT_FIELDS} keys")
+    return fields
+
+
+# `data` restricted to the keys in the text[] `keys`: {} when it has none of
+# them, NULL when there is no variant. `data` appears twice.
+_PROJECT_KEYS_SQL = (
+    "(SELECT CASE WHEN {data} IS NOT NULL "
+    "THEN coalesce(jsonb_object_agg(e.key, e.value), '{{}}'::jsonb) END "
+    "FROM jsonb_each({data}) AS e WHERE e.key = ANY({keys}))"
+)
+
+
+class ProjectKeys(Func):
+    """Project a jsonb expression to the given top-level keys in Postgres."""
+
+    output_field = JSONField()
+
+    def __init__(self, expression, keys):
+        super().__init__(expression, Value(list(keys)))
+
+    def as_sql(self, compiler, connection):
+        data, keys = self.get_source_expressions()
+        data_sql, data_params = compiler.compile(data)
+        keys_sql, keys_params = compiler.compile(keys)
+        sql = _PROJECT_KEYS_SQL.format(data=data_sql, keys=keys_sql)
+        return sql, (*data_params, *data_params, *keys_params)
+
+
+class LessonStructure:
+    """
+    A lesson's ordered blocks as parallel tuples: entry i of each field
+    describes the block at position i. This is what gets cached, so it is
+    kept compact: pickling it writes six tuples instead of a dict (six keys)
+    per block, and variant data sits in its own tuple so the small columns
+    can be scanned without touching it. See `bench_structure_cache`.
+
+    `version` is the lesson's content version (lesson_content_versions),
+    read in the same query as the blocks; 0 if it has never been set.
+    """
+
+    __slots__ = (
+        "block_ids",
+        "block_types",
+        "positions",
+        "variant_ids",
+        "variant_tenant_ids",
+        "variant_data",
+        "version",
+    )
+
+    def __init__(
+        self,
+        block_ids=(),
+        block_types=(),
+        positions=(),
+        variant_ids=(),
+        variant_tenant_ids=(),
+        variant_data=(),
+        version=0,
+    ):
+        self.block_ids = tuple(block_ids)
+        self.block_types = tuple(block_types)
+        self.positions = tuple(positions)
+        self.variant_ids = tuple(variant_ids)
+        self.variant_tenant_ids = tuple(variant_tenant_ids)
+        self.variant_data = tuple(variant_data)
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, rows, version=0):
+        """Build from (block_id, block_type, position, variant_id,
+        variant_tenant_id, variant_data) rows in position order."""
+        return cls(*zip(*rows), version=version)
+
+    def __reduce__(self):
+        # Positional arguments only: no slot names in the pickle.
+        return (
+            LessonStructure,
+            (
+                self.block_ids,
+                self.block_types,
+                self.positions,
+                self.variant_ids,
+                self.variant_tenant_ids,
+                self.variant_data,
+                self.version,
+            ),
+        )
+
+    def __len__(self):
+        return len(self.block_ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, LessonStructure):
+            return NotImplemented
+        return self.__reduce__()[1] == other.__reduce__()[1]
+
+    def rows(self):
+        return zip(
+            self.block_ids,
+            self.block_types,
+            self.positions,
+            self.variant_ids,
+            self.variant_tenant_ids,
+            self.variant_data,
+        )
+
+
+def fetch_lesson_structure(lesson_id, tenant_id, fields=None):
+    """
+    Fetch lesson structure: ordered blocks with their best variant, as a
+    LessonStructure. With `fields` (see `parse_variant_fields`), variant
+    data is projected to those keys by Postgres, so the rest of each
+    document is never sent over the wire.
+
+    Reads the precomputed resolved_lesson_blocks rows (see
+    lessons.services.resolution), so variant selection is already done:
+    1 query — an index range scan on (tenant_id, lesson_id) joined to blocks
+    and block_variants by primary key.
+
+    A tenant on its own database (lessons.routers) can't join the shared
+    tables, so its resolved rows and their content are fetched separately:
+    2 queries.
+    """
+    if tenant_database(tenant_id) != "default":
+        return _fetch_lesson_structure_remote(lesson_id, tenant_id, fields)
+    rows = list(
+        ResolvedLessonBlock.objects.filter(tenant_id=tenant_id, lesson_id=lesson_id)
+        .annotate(
+            content_version=_content_version_subquery(lesson_id),
+            variant_data=(
+                ProjectKeys("variant__data", fields) if fields else F("variant__data")
+            ),
+        )
         .order_by("position")
-        .values("block_id", "block_type", "position")
+        .values_list(
+            "block_id",
+            "block__block_type",
+            "position",
+            "variant_id",
+            "variant__tenant_id",
+            "variant_data",
+            "content_version",
+        )
     )
+    return _structure_from_rows(rows, lesson_id, "default")
+
 
-    if not blocks:
-        return []
+def _content_version_subquery(lesson_id):
+    # Uncorrelated, so Postgres evaluates it once (an InitPlan), not per row.
+    return Subquery(
+        LessonContentVersion.objects.filter(lesson_id=lesson_id).values("version")
+    )
 
-    block_ids = [b["block_id"] for b in blocks]
 
-    variants = list(
-        BlockVariant.objects.filter(block_id__in=block_ids)
-        .filter(Q(tenant_id=tenant_id) | Q(tenant_id__isnull=True))
-        .values("id", "block_id", "tenant_id", "data")
+def _structure_from_rows(rows, lesson_id, using):
+    """rows: LessonStructure rows with the content version appended."""
+    if not rows:
+        # No block rows to carry the version: the lesson is empty.
+        version = (
+            LessonContentVersion.objects.using(using)
+            .filter(lesson_id=lesson_id)
+            .values_list("version", flat=True)
+            .first()
+        )
+        return LessonStructure(version=version or 0)
+    return LessonStructure.from_rows(
+        (row[:-1] for row in rows), version=rows[0][-1] or 0
     )
 
-    # Build lookup: tenant override wins over default
-    variant_map = {}
-    for v in variants:
-        bid = v["block_id"]
-        if v["tenant_id"] is None:
-            variant_map.setdefault(bid, v)
-        else:
-            variant_map[bid] = v
-
-    structure = []
-    for b in blocks:
-        v = variant_map.get(b["block_id"], {})
-        structure.append(
-            {
-                "block_id": b["block_id"],
-                "block_type": b["block_type"],
-                "position": b["position"],
-                "variant_id": v.get("id"),
-                "variant_tenant_id": v.get("tenant_id"),
-                "variant_data": v.get("data"),
-            }
+
+def _fetch_lesson_structure_remote(lesson_id, tenant_id, fields=None):
+    using = tenant_database(tenant_id)
+    resolved = list(
+        ResolvedLessonBlock.objects.using(using)
+        .filter(tenant_id=tenant_id, lesson_id=lesson_id)
+        .annotate(content_version=_content_version_subquery(lesson_id))
+        .order_by("position")
+        .values_list("block_id", "position", "variant_id", "content_version")
+    )
+    if not resolved:
+        return _structure_from_rows([], lesson_id, using)
+    block_ids = [row[0] for row in resolved]
+    variant_ids = [row[2] for row in resolved]
+    data = _PROJECT_KEYS_SQL.format(data="v.data", keys="%s") if fields else "v.data"
+    with connections[router.db_for_read(Block)].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT b.id, b.block_type, v.tenant_id, {data}
+              FROM unnest(%s::int[], %s::int[]) AS r(block_id, variant_id)
+              JOIN blocks b ON b.id = r.block_id
+              LEFT JOIN block_variants v ON v.id = r.variant_id
+            """,
+            ([list(fields)] if fields else []) + [block_ids, variant_ids],
         )
+        # Django leaves jsonb undecoded on raw cursors.
+        content = {
+            block_id: (
+                block_type,
+                variant_tenant_id,
+                variant_data and json.loads(variant_data),
+            )
+            for block_id, block_type, variant_tenant_id, variant_data in cursor.fetchall()
+        }
+
+    # Nothing keeps blocks and resolved rows in one database consistent: skip
+    # blocks deleted from "default", as the join does for local tenants.
+    orphaned = [row[0] for row in resolved if row[0] not in content]
+    if orphaned:
+        logger.warning(
+            "Lesson %s of tenant %s resolves to missing blocks %s",
+            lesson_id,
+            tenant_id,
+            orphaned,
+        )
+    return _structure_from_rows(
+        [
+            (block_id, content[block_id][0], position, variant_id)
+            + content[block_id][1:]
+            + (version,)
+            for block_id, position, variant_id, version in resolved
+            if block_id in content
+        ],
+        lesson_id,
+        using,
+    )
+
+
+def fetch_lesson_snapshot(lesson_id, tenant_id, version):
+    """
+    The LessonStructure frozen when the lesson was published at `version`
+    (lessons.services.snapshots). 1 query: a primary-key lookup, however
+    many blocks the lesson has.
+    """
+    using = tenant_database(tenant_id)
+    snapshots = LessonSnapshot.objects
+    if using != "default":
+        snapshots = snapshots.using(using)
+    rows = snapshots.values_list("blocks", flat=True).get(
+        tenant_id=tenant_id, lesson_id=lesson_id, version=version
+    )
+    return LessonStructure.from_rows(rows, version=version)
 
-    return structure
 
+def project_structure(structure, fields):
+    """
+    `structure` with variant data restricted to `fields`, as
+    `fetch_lesson_structure` projects it in Postgres. No queries.
+    """
+    return LessonStructure(
+        structure.block_ids,
+        structure.block_types,
+        structure.positions,
+        structure.variant_ids,
+        structure.variant_tenant_ids,
+        (
+            (
+                None
+                if data is None
+                else {key: value for key, value in data.items() if key in fields}
+            )
+            for data in structure.variant_data
+        ),
+        version=structure.version,
+    )
 
-def get_lesson_structure(lesson_id, tenant_id):
+
+@timed("structure")
+def get_lesson_structure(lesson_id, tenant_id, published_version=None):
     """
     Return lesson structure, served from cache when available.
 
     Lesson structure (blocks + variants) is shared across all users in a
     tenant and rarely changes, so caching avoids redundant DB hits when
     multiple users view the same lesson.
+
+    With `published_version` (Lesson.published_version), the published
+    snapshot is returned instead of the live content. It never changes, so
+    it is cached for longer and without a fill lease.
     """
-    cache_key = f"lesson:{tenant_id}:{lesson_id}"
-    structure = cache.get(cache_key)
-    if structure is None:
-        structure = fetch_lesson_structure(lesson_id, tenant_id)
-        cache.set(cache_key, structure, STRUCTURE_CACHE_TTL)
-    return structure
+    if published_version is not None:
+        key = snapshot_cache_key(lesson_id, tenant_id, published_version)
+        structure = cache.get(key)
+        if structure is None:
+            structure = fetch_lesson_snapshot(lesson_id, tenant_id, published_version)
+            cache.set(key, structure, SNAPSHOT_CACHE_TTL)
+        return structure
+    return get_or_fill(
+        structure_cache_key(
+            lesson_id, tenant_id, lesson_generation(lesson_id, tenant_id)
+        ),
+        lambda: fetch_lesson_structure(lesson_id, tenant_id),
+    )
 
 
+_PROGRESS_MAP = PreparedStatement(
+    "lessons_progress_map",
+    """
+    SELECT block_id, status
+      FROM user_block_progress
+     WHERE user_id = %(user_id)s AND lesson_id = %(lesson_id)s
+    """,
+)
+
+
+@timed("progress")
 def get_progress_map(user_id, lesson_id):
     """Fetch user progress as {block_id: status} dict. Single query."""
-    return dict(
-        UserBlockProgress.objects.filter(
-            user_id=user_id,
-            lesson_id=lesson_id,
-        ).values_list("block_id", "status")
-    )
+    using = router.db_for_read(UserBlockProgress)
+    with connections[using].cursor() as cursor:
+        _PROGRESS_MAP.execute(cursor, {"user_id": user_id, "lesson_id": lesson_id})
+        return dict(cursor.fetchall())
 
 
+@timed("summary")
 def compute_progress_summary(structure, progress_map):
     """
     Compute progress_summary from structure and progress map.
 
-    structure: list of dicts with 'block_id' key, ordered by position.
+    structure: LessonStructure (blocks ordered by position).
     progress_map: {block_id: status}
     """
     total = len(structure)
@@ -98,11 +514,11 @@ def compute_progress_summary(structure, progress_map):
     completed = 0
     last_seen_block_id = None
 
-    for block in structure:
-        status = progress_map.get(block["block_id"])
+    for block_id in structure.block_ids:
+        status = progress_map.get(block_id)
         if status is not None:
             seen += 1
-            last_seen_block_id = block["block_id"]
+            last_seen_block_id = block_id
             if status == "completed":
                 completed += 1
 
@@ -115,27 +531,43 @@ def compute_progress_summary(structure, progress_map):
     }
 
 
-def assemble_lesson(lesson, tenant_id, user_id):
+def assemble_lesson(lesson, tenant_id, user_id, known_version=None):
     """
-    Assemble the full lesson response.
-    Cache hit: 1 query (progress).  Cache miss: 3 queries.
+    Assemble the full lesson response; variant data is left out when
+    `known_version` is the current content version.
+    Cache hit: 1 query (progress).  Cache miss: 2 queries.
     """
-    structure = get_lesson_structure(lesson.id, tenant_id)
+    structure = get_lesson_structure(lesson.id, tenant_id, lesson.published_version)
     progress_map = get_progress_map(user_id, lesson.id)
+    return build_lesson_response(
+        lesson,
+        structure,
+        progress_map,
+        include_data=known_version != structure.version,
+    )
+
 
+def build_lesson_response(lesson, structure, progress_map, include_data=True):
+    """The lesson response document for one user. No queries."""
     block_list = []
-    for row in structure:
+    for (
+        block_id,
+        block_type,
+        position,
+        variant_id,
+        variant_tenant_id,
+        variant_data,
+    ) in structure.rows():
+        variant = {"id": variant_id, "tenant_id": variant_tenant_id}
+        if include_data:
+            variant["data"] = variant_data
         block_list.append(
             {
-                "id": row["block_id"],
-                "type": row["block_type"],
-                "position": row["position"],
-                "variant": {
-                    "id": row["variant_id"],
-                    "tenant_id": row["variant_tenant_id"],
-                    "data": row["variant_data"],
-                },
-                "user_progress": progress_map.get(row["block_id"]),
+                "id": block_id,
+                "type": block_type,
+                "position": position,
+                "variant": variant,
+                "user_progress": progress_map.get(block_id),
             }
         )
 
@@ -144,6 +576,7 @@ def assemble_lesson(lesson, tenant_id, user_id):
             "id": lesson.id,
             "slug": lesson.slug,
             "title": lesson.title,
+            "content_version": structure.version,
         },
         "blocks": block_list,
         "progress_summary": compute_progress_summary(structure, progress_map),
@@ -0,0 +1,289 @@
+"""
+Bulk edits of lesson content: block variants and lesson blocks.
+
+Saving models one at a time sends a signal per row, and each signal
+re-resolves and invalidates on its own. `apply_content_changes` writes each
+kind of change with one set-based statement instead, then re-resolves and
+invalidates everything it touched once. Signals don't fire for these writes,
+so this module does their work itself.
+"""
+
+import json
+
+from django.db import IntegrityError, connections, transaction
+from rest_framework.exceptions import NotFound, ValidationError
+
+from lessons.models import Tenant
+from lessons.routers import tenant_database, use_tenant_database
+from lessons.services.invalidation import invalidate_lessons
+from lessons.services.resolution import (
+    rebuild_resolved_lessons,
+    refresh_resolved_blocks,
+)
+from lessons.services.rollups import rebuild_progress_rollups
+
+MAX_CONTENT_CHANGES = 50_000
+
+# Update the tenant's existing variant for each block, insert the rest. Not
+# ON CONFLICT: UNIQUE (block_id, tenant_id) doesn't hold for defaults, whose
+# tenant_id is NULL.
+_UPSERT_VARIANTS_SQL = """
+    WITH input AS (
+        SELECT * FROM unnest(%(block_ids)s::int[], %(data)s::text[])
+            AS i(block_id, data)
+    ), updated AS (
+        UPDATE block_variants v
+           SET data = i.data::jsonb, updated_at = now()
+          FROM input i
+         WHERE v.block_id = i.block_id AND {tenant_match}
+        RETURNING v.block_id
+    )
+    INSERT INTO block_variants (block_id, tenant_id, data)
+    SELECT i.block_id, %(tenant_id)s, i.data::jsonb
+      FROM input i
+     WHERE i.block_id NOT IN (SELECT block_id FROM updated)
+"""
+
+_DELETE_VARIANTS_SQL = """
+    DELETE FROM block_variants v
+     WHERE v.block_id = ANY(%(block_ids)s) AND {tenant_match}
+"""
+
+_DELETE_LESSON_BLOCKS_SQL = """
+    DELETE FROM lesson_blocks lb
+     USING unnest(%s::int[], %s::int[]) AS d(lesson_id, block_id)
+     WHERE lb.lesson_id = d.lesson_id AND lb.block_id = d.block_id
+"""
+
+_INSERT_LESSON_BLOCKS_SQL = """
+    INSERT INTO lesson_blocks (lesson_id, block_id, position)
+    SELECT * FROM unnest(%s::int[], %s::int[], %s::int[])
+"""
+
+
+# Rows loaded with explicit ids (seed data, `ingest_content`) leave an
+# identity sequence behind; move it past them before inserting by default.
+_SYNC_IDENTITY_SQL = """
+    SELECT setval(q.seq, m.id)
+      FROM (SELECT pg_get_serial_sequence(%s, 'id')::regclass AS seq) q,
+           (SELECT max(id) AS id FROM {table}) m
+     WHERE m.id >= coalesce(pg_sequence_last_value(q.seq), 0)
+"""
+
+
+def sync_identity(cursor, table):
+    """Advance `table`'s id sequence past its largest id. 1 query."""
+    cursor.execute(_SYNC_IDENTITY_SQL.format(table=table), [table])
+
+
+def _tenant_match(tenant_id):
+    # Equality keeps idx_block_variants_block_tenant usable.
+    return "v.tenant_id IS NULL" if tenant_id is None else "v.tenant_id = %(tenant_id)s"
+
+
+def _duplicates(keys):
+    seen = set()
+    return sorted({key for key in keys if key in seen or seen.add(key)})
+
+
+def _check_changes(
+    tenant_id, variants, delete_variants, lesson_blocks, delete_lesson_blocks
+):
+    """Checks that need no queries. Returns {field: message}."""
+    errors = {}
+    total = len(variants) + len(delete_variants) + len(lesson_blocks)
+    if total + len(delete_lesson_blocks) > MAX_CONTENT_CHANGES:
+        errors["non_field_errors"] = (
+            f"At most {MAX_CONTENT_CHANGES} changes per request"
+        )
+    duplicates = _duplicates(
+        [change["block_id"] for change in variants] + list(delete_variants)
+    )
+    if duplicates:
+        errors["variants"] = f"Blocks changed more than once: {duplicates}"
+    if tenant_id is None and (lesson_blocks or delete_lesson_blocks):
+        errors["lesson_blocks"] = "Lesson blocks can only be changed for a tenant"
+    duplicates = _duplicates(
+        [(change["lesson_id"], change["block_id"]) for change in lesson_blocks]
+        + [(change["lesson_id"], change["block_id"]) for change in delete_lesson_blocks]
+    )
+    if duplicates:
+        errors["lesson_blocks"] = (
+            f"(lesson_id, block_id) changed more than once: {duplicates}"
+        )
+    duplicates = _duplicates(
+        [(change["lesson_id"], change["position"]) for change in lesson_blocks]
+    )
+    if duplicates:
+        errors["lesson_blocks"] = f"(lesson_id, position) used twice: {duplicates}"
+    return errors
+
+
+def _missing_blocks(block_ids):
+    """Ids in `block_ids` with no blocks row. 1 query on "default"."""
+    if not block_ids:
+        return []
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT i.id
+              FROM unnest(%s::int[]) AS i(id)
+             WHERE NOT EXISTS (SELECT 1 FROM blocks b WHERE b.id = i.id)
+             ORDER BY i.id
+            """,
+            [sorted(block_ids)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _foreign_lessons(tenant_id, lesson_ids, using):
+    """Ids in `lesson_ids` that aren't lessons of the tenant. 1 query."""
+    if not lesson_ids:
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT i.id
+              FROM unnest(%s::int[]) AS i(id)
+             WHERE NOT EXISTS (
+                   SELECT 1 FROM lessons l WHERE l.id = i.id AND l.tenant_id = %s
+             )
+             ORDER BY i.id
+            """,
+            [sorted(lesson_ids), tenant_id],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _write_variants(cursor, tenant_id, variants, delete_variants):
+    params = {"tenant_id": tenant_id}
+    upserted = deleted = 0
+    if variants:
+        sync_identity(cursor, "block_variants")
+        cursor.execute(
+            _UPSERT_VARIANTS_SQL.format(tenant_match=_tenant_match(tenant_id)),
+            {
+                **params,
+                "block_ids": [change["block_id"] for change in variants],
+                "data": [json.dumps(change["data"]) for change in variants],
+            },
+        )
+        upserted = len(variants)
+    if delete_variants:
+        cursor.execute(
+            _DELETE_VARIANTS_SQL.format(tenant_match=_tenant_match(tenant_id)),
+            {**params, "block_ids": list(delete_variants)},
+        )
+        deleted = cursor.rowcount
+    return upserted, deleted
+
+
+def _write_lesson_blocks(cursor, lesson_blocks, delete_lesson_blocks):
+    deleted = 0
+    if delete_lesson_blocks:
+        cursor.execute(
+            _DELETE_LESSON_BLOCKS_SQL,
+            [
+                [change["lesson_id"] for change in delete_lesson_blocks],
+                [change["block_id"] for change in delete_lesson_blocks],
+            ],
+        )
+        deleted = cursor.rowcount
+    if lesson_blocks:
+        # Replace rather than update in place, so a batch of moves can swap
+        # positions without tripping UNIQUE (lesson_id, position) midway.
+        columns = [
+            [change[key] for change in lesson_blocks]
+            for key in ("lesson_id", "block_id", "position")
+        ]
+        cursor.execute(_DELETE_LESSON_BLOCKS_SQL, columns[:2])
+        cursor.execute(_INSERT_LESSON_BLOCKS_SQL, columns)
+    return len(lesson_blocks), deleted
+
+
+def apply_content_changes(
+    tenant_id=None,
+    variants=(),
+    delete_variants=(),
+    lesson_blocks=(),
+    delete_lesson_blocks=(),
+):
+    """
+    Apply many content changes in one transaction.
+
+    - variants: [{"block_id", "data"}] — create or replace the variant of
+      each block for `tenant_id` (its override), or the default variant
+      when `tenant_id` is None.
+    - delete_variants: block ids whose variant for `tenant_id` is deleted.
+    - lesson_blocks: [{"lesson_id", "block_id", "position"}] — add blocks
+      to the tenant's lessons, or move them.
+    - delete_lesson_blocks: [{"lesson_id", "block_id"}] — remove blocks.
+
+    Validation is set-based (a query for unknown blocks, one for lessons
+    outside the tenant) and rejects the whole request. Then one statement
+    per kind of change, one re-resolution of the blocks whose variants
+    changed (`refresh_resolved_blocks`), one rebuild of the lessons whose
+    block lists changed, including their progress rollups, and a single
+    invalidation pass after commit. Raises ValidationError or NotFound;
+    returns counts.
+    """
+    variants = list(variants)
+    delete_variants = list(delete_variants)
+    lesson_blocks = list(lesson_blocks)
+    delete_lesson_blocks = list(delete_lesson_blocks)
+
+    if tenant_id is not None and not Tenant.objects.filter(pk=tenant_id).exists():
+        raise NotFound("Tenant not found")
+    errors = _check_changes(
+        tenant_id, variants, delete_variants, lesson_blocks, delete_lesson_blocks
+    )
+    if errors:
+        raise ValidationError(errors)
+
+    using = tenant_database(tenant_id)
+    missing = _missing_blocks(
+        {change["block_id"] for change in variants}
+        | {change["block_id"] for change in lesson_blocks}
+    )
+    if missing:
+        errors["block_id"] = f"Unknown blocks: {missing}"
+    lesson_ids = {change["lesson_id"] for change in lesson_blocks} | {
+        change["lesson_id"] for change in delete_lesson_blocks
+    }
+    foreign = _foreign_lessons(tenant_id, lesson_ids, using)
+    if foreign:
+        errors["lesson_id"] = f"Lessons not found in this tenant: {foreign}"
+    if errors:
+        raise ValidationError(errors)
+
+    try:
+        with transaction.atomic(using="default"), transaction.atomic(using=using):
+            with connections["default"].cursor() as cursor:
+                upserted, deleted = _write_variants(
+                    cursor, tenant_id, variants, delete_variants
+                )
+            affected = refresh_resolved_blocks(
+                [change["block_id"] for change in variants] + delete_variants,
+                tenant_id,
+            )
+            with connections[using].cursor() as cursor:
+                blocks_upserted, blocks_deleted = _write_lesson_blocks(
+                    cursor, lesson_blocks, delete_lesson_blocks
+                )
+            if lesson_ids:
+                rebuild_resolved_lessons(sorted(lesson_ids), using=using)
+                with use_tenant_database(using):
+                    rebuild_progress_rollups(sorted(lesson_ids))
+                affected |= {(tenant_id, lesson_id) for lesson_id in lesson_ids}
+            # Runs once both transactions have committed: "default" commits last.
+            invalidate_lessons(affected, using="default")
+    except IntegrityError as exc:
+        raise ValidationError({"non_field_errors": f"Conflicting change: {exc}"})
+
+    return {
+        "variants_upserted": upserted,
+        "variants_deleted": deleted,
+        "lesson_blocks_upserted": blocks_upserted,
+        "lesson_blocks_deleted": blocks_deleted,
+        "lessons_invalidated": len(affected),
+    }
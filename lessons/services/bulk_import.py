@@ -0,0 +1,252 @@
+import csv
+import datetime
+import io
+import json
+import time
+
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lessons.routers import tenant_database, use_tenant_database
+from lessons.services.rollups import rebuild_progress_rollups
+
+IMPORT_FORMATS = ("ndjson", "csv")
+IMPORT_COLUMNS = ("user_id", "lesson_id", "block_id", "status", "updated_at")
+_STAGING_COLUMNS = ("line_no",) + IMPORT_COLUMNS + ("reason",)
+# Ids are int4 columns: a larger value would abort the whole COPY.
+ID_MIN, ID_MAX = -(2**31), 2**31 - 1
+
+
+class IterStream(io.TextIOBase):
+    """Read-only file object over an iterator of strings, for COPY FROM STDIN."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_rows(cursor, table, columns, rows, batch_rows=5000):
+    """COPY an iterable of tuples into `table` without materialising it."""
+
+    def chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        pending = 0
+        for row in rows:
+            writer.writerow(row)
+            pending += 1
+            if pending >= batch_rows:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue()
+
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        IterStream(chunks()),
+    )
+
+
+def _check_record(record):
+    """
+    Syntax-check one input record. Returns (values, reason); values is the
+    IMPORT_COLUMNS tuple (None where unusable), reason is None when valid.
+    """
+    values = []
+    for column in ("user_id", "lesson_id", "block_id"):
+        value = record.get(column)
+        # Plain ASCII digits only: isdigit() also accepts "²", which int()
+        # rejects.
+        if isinstance(value, str):
+            digits = value.strip()
+            if digits.isascii() and digits.isdecimal():
+                value = int(digits)
+        if not isinstance(value, int) or isinstance(value, bool):
+            return (None,) * len(IMPORT_COLUMNS), f"{column} must be an integer"
+        if not ID_MIN <= value <= ID_MAX:
+            return (None,) * len(IMPORT_COLUMNS), f"{column} is out of range"
+        values.append(value)
+
+    status = record.get("status")
+    if status not in ("seen", "completed"):
+        return (None,) * len(IMPORT_COLUMNS), "status must be seen or completed"
+    values.append(status)
+
+    updated_at = record.get("updated_at") or None
+    if updated_at is not None:
+        parsed = parse_datetime(updated_at) if isinstance(updated_at, str) else None
+        if parsed is None:
+            return (None,) * len(IMPORT_COLUMNS), "updated_at must be ISO 8601"
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+        updated_at = parsed.isoformat()
+    values.append(updated_at)
+    return tuple(values), None
+
+
+def _ndjson_records(source):
+    for line_no, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None, "invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "record must be a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def _csv_records(source):
+    # Checked eagerly: an error raised inside COPY's read() surfaces as a
+    # QueryCanceled instead.
+    reader = csv.DictReader(source)
+    missing = set(IMPORT_COLUMNS[:4]) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+    return ((reader.line_num, record, None) for record in reader)
+
+
+def _staging_rows(records, stats):
+    for line_no, record, reason in records:
+        stats["rows_read"] += 1
+        if reason is None:
+            values, reason = _check_record(record)
+        else:
+            values = (None,) * len(IMPORT_COLUMNS)
+        yield (line_no,) + values + (reason,)
+
+
+def import_progress(source, fmt, tenant_id=None, rejects=None):
+    """
+    Bulk-load progress records from an NDJSON or CSV text stream.
+
+    1. Records are syntax-checked while streaming into a temp staging table
+       via COPY (constant memory).
+    2. One set-based UPDATE marks rows whose user, lesson or block doesn't
+       exist, whose user and lesson belong to different tenants (or not to
+       `tenant_id`), or whose block isn't part of the lesson.
+    3. One INSERT ... ON CONFLICT merges the rest into user_block_progress
+       with the monotonic rule: duplicates collapse to their highest status,
+       and an existing row is only written when 'seen' becomes 'completed',
+       stamped now() so progress sync cursors (`since`) pick it up.
+    4. Analytics rollups are rebuilt for the lessons touched.
+
+    Rejected rows are written to `rejects` as CSV (line_no, reason).
+    Everything runs in one transaction on the tenant's database (the bound
+    one without `tenant_id`): a failed import leaves no trace. Returns a
+    stats dict.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    records = _ndjson_records(source) if fmt == "ndjson" else _csv_records(source)
+    stats = {"rows_read": 0, "rows_merged": 0, "rows_rejected": 0}
+    started = time.perf_counter()
+
+    using = tenant_database(tenant_id)
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE progress_import (
+                line_no     BIGINT NOT NULL,
+                user_id     INTEGER,
+                lesson_id   INTEGER,
+                block_id    INTEGER,
+                status      TEXT,
+                updated_at  TIMESTAMPTZ,
+                reason      TEXT
+            ) ON COMMIT DROP
+            """)
+        copy_rows(
+            cursor, "progress_import", _STAGING_COLUMNS, _staging_rows(records, stats)
+        )
+        cursor.execute("ANALYZE progress_import")
+
+        cursor.execute(
+            """
+            UPDATE progress_import s
+               SET reason = CASE
+                   WHEN u.id IS NULL THEN 'unknown user'
+                   WHEN l.id IS NULL THEN 'unknown lesson'
+                   WHEN u.tenant_id <> l.tenant_id
+                       THEN 'user and lesson belong to different tenants'
+                   WHEN %(tenant_id)s::int IS NOT NULL
+                        AND u.tenant_id <> %(tenant_id)s::int
+                       THEN 'outside tenant'
+                   ELSE 'block not in lesson'
+               END
+              FROM progress_import r
+              LEFT JOIN users u ON u.id = r.user_id
+              LEFT JOIN lessons l ON l.id = r.lesson_id
+              LEFT JOIN lesson_blocks lb
+                ON lb.lesson_id = r.lesson_id AND lb.block_id = r.block_id
+             WHERE s.line_no = r.line_no
+               AND r.reason IS NULL
+               AND (u.id IS NULL
+                    OR l.id IS NULL
+                    OR u.tenant_id <> l.tenant_id
+                    OR (%(tenant_id)s::int IS NOT NULL
+                        AND u.tenant_id <> %(tenant_id)s::int)
+                    OR lb.block_id IS NULL)
+            """,
+            {"tenant_id": tenant_id},
+        )
+
+        cursor.execute("SELECT count(*) FROM progress_import WHERE reason IS NOT NULL")
+        stats["rows_rejected"] = cursor.fetchone()[0]
+        if rejects is not None and stats["rows_rejected"]:
+            cursor.copy_expert(
+                """
+                COPY (SELECT line_no, reason FROM progress_import
+                       WHERE reason IS NOT NULL ORDER BY line_no)
+                TO STDOUT WITH (FORMAT csv, HEADER)
+                """,
+                rejects,
+            )
+
+        cursor.execute("""
+            INSERT INTO user_block_progress AS p
+                (user_id, lesson_id, block_id, status, updated_at)
+            SELECT DISTINCT ON (user_id, lesson_id, block_id)
+                   user_id, lesson_id, block_id, status, coalesce(updated_at, now())
+              FROM progress_import
+             WHERE reason IS NULL
+             ORDER BY user_id, lesson_id, block_id,
+                      status = 'completed' DESC, updated_at DESC NULLS LAST
+            ON CONFLICT (user_id, lesson_id, block_id) DO UPDATE
+               SET status = EXCLUDED.status, updated_at = now()
+             WHERE p.status = 'seen' AND EXCLUDED.status = 'completed'
+            """)
+        stats["rows_merged"] = cursor.rowcount
+
+        cursor.execute(
+            "SELECT DISTINCT lesson_id FROM progress_import WHERE reason IS NULL"
+        )
+        lesson_ids = [row[0] for row in cursor.fetchall()]
+        if lesson_ids:
+            with use_tenant_database(using):
+                rebuild_progress_rollups(lesson_ids)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["rows_per_second"] = stats["rows_read"] / elapsed if elapsed else 0.0
+    return stats
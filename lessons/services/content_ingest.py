@@ -0,0 +1,503 @@
+"""
+Bulk-loading lesson content (lessons, blocks, lesson_blocks, block_variants)
+from NDJSON, one lesson per line:
+
+    {"id": 7001, "tenant_id": 1, "slug": "intro", "title": "Intro",
+     "blocks": [{"id": 501, "type": "markdown",
+                 "variants": [{"data": {...}},
+                              {"tenant_id": 1, "data": {...}}]}]}
+
+Blocks are listed in lesson order and may be shared between lessons; a
+variant without tenant_id is the block's default, one with the lesson's
+tenant_id its override. Lessons and blocks keep their ids; an existing
+lesson gets its title, slug and block list replaced, an existing variant
+its data.
+"""
+
+import json
+import tempfile
+import time
+
+from django.db import connections, transaction
+
+from lessons.models import Lesson
+from lessons.routers import tenant_database, use_tenant_database
+from lessons.services.bulk_content import sync_identity
+from lessons.services.bulk_import import ID_MAX, ID_MIN, copy_rows
+from lessons.services.invalidation import invalidate_lessons
+from lessons.services.resolution import (
+    rebuild_resolved_lessons,
+    refresh_resolved_blocks,
+)
+from lessons.services.rollups import rebuild_progress_rollups
+from lessons.services.validation import forget_not_found
+
+_STAGING_COLUMNS = (
+    "line_no",
+    "kind",
+    "lesson_id",
+    "tenant_id",
+    "slug",
+    "title",
+    "block_id",
+    "block_type",
+    "position",
+    "data",
+    "reason",
+)
+# What the lessons' database needs: accepted lesson and block rows.
+_LESSON_COLUMNS = "line_no, kind, lesson_id, tenant_id, slug, title, block_id, position"
+
+# Checks against the shared tables and the input itself, on "default". Each
+# marks the offending rows; `_SPREAD_REASONS_SQL` then rejects their lines.
+_DEFAULT_CHECKS_SQL = (
+    """
+    UPDATE content_import s
+       SET reason = 'unknown tenant'
+     WHERE s.kind = 'lesson' AND s.reason IS NULL
+       AND NOT EXISTS (SELECT 1 FROM tenants t WHERE t.id = s.tenant_id)
+    """,
+    """
+    UPDATE content_import s
+       SET reason = CASE
+           WHEN f.line_no > f.first_id
+               THEN 'lesson id repeated from line ' || f.first_id
+           ELSE 'slug repeated from line ' || f.first_slug
+       END
+      FROM (
+           SELECT line_no,
+                  min(line_no) OVER (PARTITION BY lesson_id) AS first_id,
+                  min(line_no) OVER (PARTITION BY tenant_id, slug) AS first_slug
+             FROM content_import
+            WHERE kind = 'lesson' AND reason IS NULL
+      ) f
+     WHERE s.line_no = f.line_no AND s.kind = 'lesson'
+       AND (f.line_no > f.first_id OR f.line_no > f.first_slug)
+    """,
+    """
+    UPDATE content_import s
+       SET reason = format('block %s exists with type %s', b.id, b.block_type)
+      FROM blocks b
+     WHERE s.kind = 'block' AND s.reason IS NULL
+       AND b.id = s.block_id AND b.block_type <> s.block_type
+    """,
+    """
+    UPDATE content_import s
+       SET reason = format(
+           'block %s has type %s on line %s', f.block_id, f.block_type, f.line_no
+       )
+      FROM (
+           SELECT DISTINCT ON (block_id) block_id, block_type, line_no
+             FROM content_import
+            WHERE kind = 'block' AND reason IS NULL
+            ORDER BY block_id, line_no
+      ) f
+     WHERE s.kind = 'block' AND s.reason IS NULL
+       AND s.block_id = f.block_id AND s.block_type <> f.block_type
+    """,
+)
+
+_SPREAD_REASONS_SQL = """
+    UPDATE content_import s
+       SET reason = r.reason
+      FROM (
+           SELECT DISTINCT ON (line_no) line_no, reason
+             FROM content_import
+            WHERE reason IS NOT NULL
+            ORDER BY line_no
+      ) r
+     WHERE s.line_no = r.line_no AND s.reason IS NULL
+"""
+
+# Checks against the lessons' database: ids and slugs already taken there.
+_LESSON_CHECKS_SQL = """
+    SELECT s.line_no,
+           CASE WHEN l.tenant_id <> s.tenant_id
+                THEN 'lesson id belongs to another tenant'
+                ELSE 'slug is used by lesson ' || o.id
+           END
+      FROM content_import_lessons s
+      LEFT JOIN lessons l ON l.id = s.lesson_id
+      LEFT JOIN lessons o
+        ON o.tenant_id = s.tenant_id AND o.slug = s.slug AND o.id <> s.lesson_id
+     WHERE s.kind = 'lesson' AND (l.tenant_id <> s.tenant_id OR o.id IS NOT NULL)
+"""
+
+# Later lines win for a variant given more than once.
+_MERGE_VARIANTS_SQL = (
+    """
+    CREATE TEMP TABLE variant_changes ON COMMIT DROP AS
+    SELECT DISTINCT ON (block_id, tenant_id) block_id, tenant_id, data::jsonb AS data
+      FROM content_import
+     WHERE kind = 'variant' AND reason IS NULL
+     ORDER BY block_id, tenant_id, line_no DESC
+    """,
+    """
+    UPDATE block_variants v
+       SET data = c.data, updated_at = now()
+      FROM variant_changes c
+     WHERE v.block_id = c.block_id AND v.tenant_id IS NOT DISTINCT FROM c.tenant_id
+    """,
+    """
+    INSERT INTO block_variants (block_id, tenant_id, data)
+    SELECT c.block_id, c.tenant_id, c.data
+      FROM variant_changes c
+     WHERE NOT EXISTS (
+           SELECT 1 FROM block_variants v
+            WHERE v.block_id = c.block_id
+              AND v.tenant_id IS NOT DISTINCT FROM c.tenant_id
+     )
+    """,
+)
+
+
+def _is_id(value):
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and ID_MIN <= value <= ID_MAX
+    )
+
+
+def _check_variants(block, lesson_tenant_id):
+    variants = block.get("variants", [])
+    if not isinstance(variants, list):
+        return "variants must be a list"
+    seen = set()
+    for variant in variants:
+        if not isinstance(variant, dict) or not isinstance(variant.get("data"), dict):
+            return f"block {block['id']}: each variant needs a data object"
+        tenant_id = variant.get("tenant_id")
+        if tenant_id not in (None, lesson_tenant_id):
+            return f"block {block['id']}: variant tenant_id must be the lesson's"
+        if tenant_id in seen:
+            return f"block {block['id']}: variant given twice"
+        seen.add(tenant_id)
+    return None
+
+
+def _check_lesson(record):
+    """Syntax-check one lesson definition. Returns a reason, or None."""
+    for key in ("id", "tenant_id"):
+        if not _is_id(record.get(key)):
+            return f"{key} must be a 32-bit integer"
+    for key in ("slug", "title"):
+        if not isinstance(record.get(key), str) or not record[key]:
+            return f"{key} must be a non-empty string"
+    blocks = record.get("blocks")
+    if not isinstance(blocks, list):
+        return "blocks must be a list"
+    block_ids = set()
+    for block in blocks:
+        if not isinstance(block, dict) or not _is_id(block.get("id")):
+            return "each block needs a 32-bit integer id"
+        if not isinstance(block.get("type"), str) or not block["type"]:
+            return f"block {block['id']}: type must be a non-empty string"
+        if block["id"] in block_ids:
+            return f"block {block['id']} appears twice"
+        block_ids.add(block["id"])
+        reason = _check_variants(block, record["tenant_id"])
+        if reason is not None:
+            return reason
+    return None
+
+
+def _staging_rows(source, tenant_id, using, stats):
+    """Rows for the content_import staging table, one input line at a time."""
+    blank = (None,) * (len(_STAGING_COLUMNS) - 3)
+    for line_no, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        stats["lines_read"] += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record, reason = None, "invalid JSON"
+        else:
+            if not isinstance(record, dict):
+                reason = "record must be a JSON object"
+            else:
+                reason = _check_lesson(record)
+        if reason is None and tenant_id is not None:
+            if record["tenant_id"] != tenant_id:
+                reason = "outside tenant"
+        if reason is None and tenant_database(record["tenant_id"]) != using:
+            reason = "tenant lives on another database; ingest it with --tenant"
+        if reason is not None:
+            yield (line_no, "lesson") + blank + (reason,)
+            continue
+
+        lesson_id = record["id"]
+        yield (
+            line_no,
+            "lesson",
+            lesson_id,
+            record["tenant_id"],
+            record["slug"],
+            record["title"],
+            None,
+            None,
+            None,
+            None,
+            None,
+        )
+        for position, block in enumerate(record["blocks"], start=1):
+            yield (
+                line_no,
+                "block",
+                lesson_id,
+                None,
+                None,
+                None,
+                block["id"],
+                block["type"],
+                position,
+                None,
+                None,
+            )
+            for variant in block.get("variants", []):
+                yield (
+                    line_no,
+                    "variant",
+                    None,
+                    variant.get("tenant_id"),
+                    None,
+                    None,
+                    block["id"],
+                    None,
+                    None,
+                    json.dumps(variant["data"]),
+                    None,
+                )
+
+
+def _stage(cursor, source, tenant_id, using, stats):
+    cursor.execute("""
+        CREATE TEMP TABLE content_import (
+            line_no     BIGINT NOT NULL,
+            kind        TEXT NOT NULL,
+            lesson_id   INTEGER,
+            tenant_id   INTEGER,
+            slug        TEXT,
+            title       TEXT,
+            block_id    INTEGER,
+            block_type  TEXT,
+            position    INTEGER,
+            data        TEXT,
+            reason      TEXT
+        ) ON COMMIT DROP
+        """)
+    copy_rows(
+        cursor,
+        "content_import",
+        _STAGING_COLUMNS,
+        _staging_rows(source, tenant_id, using, stats),
+    )
+    cursor.execute("CREATE INDEX ON content_import (line_no)")
+    cursor.execute("ANALYZE content_import")
+    cursor.execute("SELECT count(*) FROM content_import")
+    stats["rows_staged"] = cursor.fetchone()[0]
+
+
+def _transfer_lessons(cursor, lesson_cursor, same_database):
+    """
+    Copy the accepted lesson and block rows into content_import_lessons on
+    the lessons' database: in place on "default", else through a temporary
+    file like `move_tenant`.
+    """
+    lesson_cursor.execute("""
+        CREATE TEMP TABLE content_import_lessons (
+            line_no     BIGINT NOT NULL,
+            kind        TEXT NOT NULL,
+            lesson_id   INTEGER NOT NULL,
+            tenant_id   INTEGER,
+            slug        TEXT,
+            title       TEXT,
+            block_id    INTEGER,
+            position    INTEGER
+        ) ON COMMIT DROP
+        """)
+    accepted = (
+        f"SELECT {_LESSON_COLUMNS} FROM content_import "
+        "WHERE kind IN ('lesson', 'block') AND reason IS NULL"
+    )
+    if same_database:
+        cursor.execute(f"INSERT INTO content_import_lessons {accepted}")
+    else:
+        with tempfile.TemporaryFile() as buffer:
+            cursor.copy_expert(
+                f"COPY ({accepted}) TO STDOUT WITH (FORMAT binary)", buffer
+            )
+            buffer.seek(0)
+            lesson_cursor.copy_expert(
+                f"COPY content_import_lessons ({_LESSON_COLUMNS}) "
+                "FROM STDIN WITH (FORMAT binary)",
+                buffer,
+            )
+    lesson_cursor.execute("ANALYZE content_import_lessons")
+
+
+def _check_lessons(cursor, lesson_cursor):
+    lesson_cursor.execute(_LESSON_CHECKS_SQL)
+    rejected = lesson_cursor.fetchall()
+    if not rejected:
+        return
+    line_nos = [line_no for line_no, _ in rejected]
+    lesson_cursor.execute(
+        "DELETE FROM content_import_lessons WHERE line_no = ANY(%s)", [line_nos]
+    )
+    cursor.execute(
+        """
+        UPDATE content_import s
+           SET reason = r.reason
+          FROM unnest(%s::bigint[], %s::text[]) AS r(line_no, reason)
+         WHERE s.line_no = r.line_no AND s.kind = 'lesson'
+        """,
+        [line_nos, [reason for _, reason in rejected]],
+    )
+    cursor.execute(_SPREAD_REASONS_SQL)
+
+
+def _merge_content(cursor, stats):
+    """Blocks and variants, on "default". Returns {tenant_id: [block_id]}."""
+    cursor.execute("""
+        INSERT INTO blocks (id, block_type)
+        SELECT DISTINCT ON (block_id) block_id, block_type
+          FROM content_import
+         WHERE kind = 'block' AND reason IS NULL
+         ORDER BY block_id, line_no
+        ON CONFLICT (id) DO NOTHING
+        """)
+    stats["blocks_created"] = cursor.rowcount
+    sync_identity(cursor, "blocks")
+
+    sync_identity(cursor, "block_variants")
+    create, update, insert = _MERGE_VARIANTS_SQL
+    cursor.execute(create)
+    cursor.execute(update)
+    stats["variants_written"] = cursor.rowcount
+    cursor.execute(insert)
+    stats["variants_written"] += cursor.rowcount
+    cursor.execute(
+        "SELECT tenant_id, array_agg(block_id) FROM variant_changes GROUP BY tenant_id"
+    )
+    return dict(cursor.fetchall())
+
+
+def _merge_lessons(lesson_cursor, stats):
+    """Lessons and their block lists, on the lessons' database."""
+    lesson_cursor.execute("""
+        INSERT INTO lessons (id, tenant_id, slug, title)
+        SELECT lesson_id, tenant_id, slug, title
+          FROM content_import_lessons
+         WHERE kind = 'lesson'
+        ON CONFLICT (id) DO UPDATE SET slug = EXCLUDED.slug, title = EXCLUDED.title
+        RETURNING xmax = 0
+        """)
+    created = [row[0] for row in lesson_cursor.fetchall()]
+    stats["lessons_created"] = sum(created)
+    stats["lessons_updated"] = len(created) - stats["lessons_created"]
+    sync_identity(lesson_cursor, "lessons")
+
+    # Replace each lesson's block list, so positions can move freely under
+    # UNIQUE (lesson_id, position).
+    lesson_cursor.execute("""
+        DELETE FROM lesson_blocks
+         WHERE lesson_id IN (
+               SELECT lesson_id FROM content_import_lessons WHERE kind = 'lesson'
+         )
+        """)
+    lesson_cursor.execute("""
+        INSERT INTO lesson_blocks (lesson_id, block_id, position)
+        SELECT lesson_id, block_id, position
+          FROM content_import_lessons
+         WHERE kind = 'block'
+        """)
+    stats["lesson_blocks"] = lesson_cursor.rowcount
+    lesson_cursor.execute(
+        "SELECT tenant_id, lesson_id FROM content_import_lessons WHERE kind = 'lesson'"
+    )
+    return lesson_cursor.fetchall()
+
+
+def ingest_content(source, tenant_id=None, rejects=None):
+    """
+    Bulk-load lesson definitions from an NDJSON text stream.
+
+    1. Lines are syntax-checked while their rows stream into a temp staging
+       table on "default" via COPY (constant memory): one row per lesson,
+       per lesson block and per variant.
+    2. Set-based UPDATEs reject lines whose tenant doesn't exist, that
+       repeat an earlier line's lesson id or slug, or that give a block a
+       type other than its existing (or first) one; then lines whose lesson
+       id or slug is taken on the lessons' database. A rejected line is
+       skipped as a whole.
+    3. New blocks are inserted, variants replaced or inserted (a later line
+       wins), lessons upserted and their block lists replaced: one
+       statement each.
+    4. Resolved rows are refreshed for the blocks whose variants changed and
+       rebuilt for the lessons loaded, along with their progress rollups;
+       every affected lesson's cache entries, and the loaded lessons'
+       not-found entries (lessons.services.validation), are evicted after
+       commit.
+
+    Without `tenant_id` only tenants on "default" can be loaded; with it,
+    only that tenant, on its own database. Rejected lines are written to
+    `rejects` as CSV (line_no, reason). Everything runs in one transaction
+    per database: a failed ingest leaves no trace. Returns a stats dict.
+    """
+    stats = {"lines_read": 0}
+    started = time.perf_counter()
+
+    using = tenant_database(tenant_id)
+    with transaction.atomic(using="default"), transaction.atomic(using=using):
+        with connections["default"].cursor() as cursor, connections[
+            using
+        ].cursor() as lesson_cursor:
+            _stage(cursor, source, tenant_id, using, stats)
+            for sql in _DEFAULT_CHECKS_SQL:
+                cursor.execute(sql)
+            cursor.execute(_SPREAD_REASONS_SQL)
+            _transfer_lessons(cursor, lesson_cursor, using == "default")
+            _check_lessons(cursor, lesson_cursor)
+
+            cursor.execute(
+                "SELECT count(*) FROM content_import "
+                "WHERE kind = 'lesson' AND reason IS NOT NULL"
+            )
+            stats["lines_rejected"] = cursor.fetchone()[0]
+            if rejects is not None and stats["lines_rejected"]:
+                cursor.copy_expert(
+                    """
+                    COPY (SELECT line_no, reason FROM content_import
+                           WHERE kind = 'lesson' AND reason IS NOT NULL
+                           ORDER BY line_no)
+                    TO STDOUT WITH (FORMAT csv, HEADER)
+                    """,
+                    rejects,
+                )
+
+            changed_blocks = _merge_content(cursor, stats)
+            lessons = _merge_lessons(lesson_cursor, stats)
+            # ON COMMIT DROP only fires at the outermost commit; drop them now
+            # so an enclosing transaction can ingest again.
+            cursor.execute("DROP TABLE content_import, variant_changes")
+            lesson_cursor.execute("DROP TABLE content_import_lessons")
+
+        affected = set(lessons)
+        for variant_tenant_id, block_ids in changed_blocks.items():
+            affected |= refresh_resolved_blocks(block_ids, variant_tenant_id)
+        lesson_ids = sorted(lesson_id for _, lesson_id in lessons)
+        if lesson_ids:
+            rebuild_resolved_lessons(lesson_ids, using=using)
+            with use_tenant_database(using):
+                rebuild_progress_rollups(lesson_ids)
+        # Runs once both transactions have committed: "default" commits last.
+        invalidate_lessons(affected, using="default")
+        forget_not_found(Lesson, lessons, using="default")
+    stats["lessons_invalidated"] = len(affected)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["rows_per_second"] = stats["rows_staged"] / elapsed if elapsed else 0.0
+    return stats
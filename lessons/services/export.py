@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+
+from django.db import connections, transaction
+
+from lessons.routers import tenant_database
+
+EXPORT_COLUMNS = ("user_id", "lesson_id", "block_id", "status", "updated_at")
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_export_cursor(value):
+    """Parse a "user_id:lesson_id:block_id" resume cursor into a key tuple."""
+    parts = value.split(":")
+    if len(parts) != 3:
+        raise ValueError("cursor must be user_id:lesson_id:block_id")
+    return tuple(int(part) for part in parts)
+
+
+def iter_progress_rows(
+    tenant_id,
+    lesson_id=None,
+    updated_from=None,
+    updated_to=None,
+    after=None,
+    chunk_size=EXPORT_CHUNK_SIZE,
+):
+    """
+    Yield a tenant's user_block_progress rows as tuples in EXPORT_COLUMNS
+    order, sorted by primary key.
+
+    Rows stream through a server-side cursor inside one transaction, so
+    memory stays flat at `chunk_size` rows whatever the tenant's size.
+    `after` is the (user_id, lesson_id, block_id) of the last row already
+    received; the export resumes strictly after it (keyset pagination on the
+    primary key).
+    """
+    filters = ["u.tenant_id = %s"]
+    params = [tenant_id]
+    if lesson_id is not None:
+        filters.append("p.lesson_id = %s")
+        params.append(lesson_id)
+    if updated_from is not None:
+        filters.append("p.updated_at >= %s")
+        params.append(updated_from)
+    if updated_to is not None:
+        filters.append("p.updated_at < %s")
+        params.append(updated_to)
+    if after is not None:
+        filters.append("(p.user_id, p.lesson_id, p.block_id) > (%s, %s, %s)")
+        params.extend(after)
+
+    sql = f"""
+        SELECT p.user_id, p.lesson_id, p.block_id, p.status, p.updated_at
+          FROM user_block_progress p
+          JOIN users u ON u.id = p.user_id
+         WHERE {" AND ".join(filters)}
+         ORDER BY p.user_id, p.lesson_id, p.block_id
+    """
+
+    # Exports stream after the request's routing context is gone, so the
+    # tenant's database is looked up here rather than bound.
+    using = tenant_database(tenant_id)
+    with transaction.atomic(using=using):
+        cursor = connections[using].chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def _row_dict(row):
+    record = dict(zip(EXPORT_COLUMNS, row))
+    record["updated_at"] = record["updated_at"].isoformat()
+    return record
+
+
+def encode_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode rows as newline-delimited JSON, yielding one string per chunk."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(_row_dict(row)))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def encode_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode rows as CSV with a header line, yielding one string per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        record = _row_dict(row)
+        writer.writerow(record[column] for column in EXPORT_COLUMNS)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+    "csv": (encode_csv, "text/csv"),
+}
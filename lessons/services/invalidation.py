@@ -0,0 +1,219 @@
+"""
+Evicting cached lesson content after content changes.
+
+Content changes re-resolve lessons inside the writing transaction
+(lessons.services.resolution) but evict the cached structures and bodies
+only once it commits: an eviction before the commit lets a concurrent reader
+re-cache the old content, which is still what it sees. The keys are then
+handed to a per-process pool of worker threads that merges duplicates and
+deletes them in batches, so the saving request doesn't wait on the cache.
+
+A reader that read the old content before the commit may still try to store
+it after the eviction. Fill leases (`get_or_fill` in
+lessons.services.assembly) make that store undo itself, as long as the
+lease keys are deleted before the entries, which `lesson_invalidation_keys`
+orders.
+
+With CACHE_INVALIDATION_WORKERS = 0, keys are deleted on commit by the
+committing thread.
+
+Keys of live content also carry generations of their tenant and lesson
+(`lesson_generations` in lessons.services.assembly). Replacing one
+generation, on commit too, makes every entry built under it unreachable
+with one cache write: that is how a whole tenant is evicted
+(`invalidate_tenants`, and `invalidate_lessons` for a tenant with at least
+CACHE_INVALIDATION_TENANT_THRESHOLD lessons to evict). The old entries age
+out. A reader that read old content keeps storing it under the old
+generation, where nobody looks, so no lease is needed there.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from lessons.services.assembly import (
+    fill_lease_key,
+    lesson_cache_keys,
+    lesson_generation_key,
+    lesson_generations,
+    new_generation,
+    tenant_generation_key,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def lesson_invalidation_keys(pairs):
+    """
+    Cache keys to delete for (tenant_id, lesson_id) pairs: fill leases
+    first, then the entries they guard.
+    """
+    generations = lesson_generations(pairs)
+    keys = [
+        key
+        for (tenant_id, lesson_id), generation in generations.items()
+        for key in lesson_cache_keys(lesson_id, tenant_id, generation)
+    ]
+    return [fill_lease_key(key) for key in keys] + keys
+
+
+class InvalidationQueue:
+    """
+    Pending cache deletes and the threads draining them. Keys queued while
+    a batch is in flight are merged, so a burst of edits to one lesson
+    costs one delete per key. A batch the cache fails to delete is queued
+    again once; keys that fail twice are dropped and left to expire.
+    """
+
+    def __init__(self, workers, batch_size):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pending = {}  # an ordered set: leases stay ahead of entries
+        self._in_flight = 0
+        self._failed = set()  # keys whose delete failed once
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def put(self, keys):
+        if not self.workers:
+            cache.delete_many(list(keys))
+            return
+        with self._condition:
+            self._start()
+            self._pending.update(dict.fromkeys(keys))
+            self._condition.notify()
+
+    def flush(self, timeout=None):
+        """Wait until every queued key is deleted. False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._in_flight, timeout
+            )
+
+    def _start(self):
+        # Threads don't survive a fork: a forked worker process starts its own.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending.clear()
+        self._in_flight = 0
+        self._failed.clear()
+        for index in range(self.workers):
+            threading.Thread(
+                target=self._run, name=f"cache-invalidation-{index}", daemon=True
+            ).start()
+
+    def _take(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending)
+            batch = []
+            for key in self._pending:
+                batch.append(key)
+                if len(batch) == self.batch_size:
+                    break
+            for key in batch:
+                del self._pending[key]
+            self._in_flight += 1
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            try:
+                cache.delete_many(batch)
+            except Exception:
+                logger.exception("Could not evict %d cached lesson keys", len(batch))
+                failed = True
+            else:
+                failed = False
+            with self._condition:
+                self._in_flight -= 1
+                if failed:
+                    self._retry(batch)
+                else:
+                    self._failed.difference_update(batch)
+                self._condition.notify_all()
+
+    def _retry(self, batch):
+        retry = [key for key in batch if key not in self._failed]
+        self._failed.difference_update(batch)
+        self._failed.update(retry)
+        self._pending.update(dict.fromkeys(retry))
+
+
+_queue = InvalidationQueue(
+    settings.CACHE_INVALIDATION_WORKERS, settings.CACHE_INVALIDATION_BATCH_SIZE
+)
+atexit.register(_queue.flush, timeout=5)
+
+
+def invalidate_lessons(pairs, using="default"):
+    """
+    Evict cached content of (tenant_id, lesson_id) pairs once the current
+    transaction on `using` commits (right away outside a transaction).
+    Nothing is evicted if it rolls back. Tenants with many pairs get a new
+    generation instead of one delete per key.
+    """
+    by_tenant = {}
+    for tenant_id, lesson_id in pairs:
+        by_tenant.setdefault(tenant_id, set()).add(lesson_id)
+    threshold = settings.CACHE_INVALIDATION_TENANT_THRESHOLD
+    tenant_ids = [
+        tenant_id
+        for tenant_id, lesson_ids in by_tenant.items()
+        if len(lesson_ids) >= threshold
+    ]
+    if tenant_ids:
+        invalidate_tenants(tenant_ids, using)
+    pairs = [
+        (tenant_id, lesson_id)
+        for tenant_id, lesson_ids in by_tenant.items()
+        if len(lesson_ids) < threshold
+        for lesson_id in sorted(lesson_ids)
+    ]
+    if pairs:
+        transaction.on_commit(partial(_evict, pairs), using=using)
+
+
+def _evict(pairs):
+    # Generations are read once committed: a reader that picked up one
+    # renewed while the transaction was open must find its lease deleted.
+    _queue.put(lesson_invalidation_keys(pairs))
+
+
+def _renew_generations(keys):
+    cache.set_many({key: new_generation() for key in keys}, None)
+
+
+def invalidate_tenants(tenant_ids, using="default"):
+    """
+    Make every cached entry of the tenants' live lesson content unreachable
+    once the current transaction on `using` commits: one cache write.
+    """
+    keys = [tenant_generation_key(tenant_id) for tenant_id in tenant_ids]
+    if keys:
+        transaction.on_commit(partial(_renew_generations, keys), using=using)
+
+
+def invalidate_lesson_ids(lesson_ids, using="default"):
+    """
+    Make the lessons' cached live content unreachable, whichever tenant it
+    was cached for, once the current transaction on `using` commits.
+    """
+    keys = [lesson_generation_key(lesson_id) for lesson_id in lesson_ids]
+    if keys:
+        transaction.on_commit(partial(_renew_generations, keys), using=using)
+
+
+def flush_invalidations(timeout=None):
+    """
+    Wait for queued evictions, e.g. before a command exits. False if some
+    are still queued after `timeout` seconds.
+    """
+    return _queue.flush(timeout)
@@ -0,0 +1,341 @@
+"""
+Lesson GET response bodies assembled from pre-encoded, pre-compressed parts.
+
+Everything in a lesson response except `user_progress` and
+`progress_summary` is the same for every user of a tenant. LessonBody keeps
+that content as JSON byte segments, one per block, ending just before each
+block's `user_progress` value, plus the same segments deflated once as a
+single stream. A response is the segments joined with the user's values:
+no per-request JSON encoding of block content, and for gzip no per-request
+compression of it.
+
+Splicing works because the segments are deflated with one shared window
+(so they compress as well as the whole document would) and the compressor
+is sync-flushed around each `user_progress` slot, which it sees as
+SLOT_WIDTH placeholder bytes. A request replaces each slot's output with a
+stored (uncompressed) block of exactly SLOT_WIDTH bytes: the value padded
+with JSON whitespace. Offsets stay the same, so back-references in later
+segments still land on the right bytes, and none of them can point into a
+slot because the placeholder byte never occurs in encoded JSON (control
+characters are always escaped).
+"""
+
+import json
+import struct
+import zlib
+
+from django.core.cache import cache
+
+from lessons.services.assembly import (
+    SNAPSHOT_CACHE_TTL,
+    acquire_fill_lease,
+    body_cache_key,
+    compute_progress_summary,
+    content_version_cache_key,
+    fetch_lesson_structure,
+    fill_cache,
+    get_lesson_structure,
+    get_or_fill,
+    get_progress_map,
+    lesson_generation,
+    project_structure,
+    projected_body_cache_key,
+    snapshot_body_cache_key,
+)
+from lessons.routers import use_primary
+from lessons.timing import phase, timed
+
+GZIP_LEVEL = 6
+SLOT_WIDTH = len('"completed"')
+_PLACEHOLDER = b"\x01" * SLOT_WIDTH
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+_MAX_STORED = 0xFFFF
+
+
+def encode_json(value):
+    """Encode like the API's JSONRenderer (compact, UTF-8)."""
+    return json.dumps(
+        value, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+    ).encode()
+
+
+def _stored_length(data):
+    return struct.pack("<HH", len(data), len(data) ^ 0xFFFF)
+
+
+def _stored_blocks(data):
+    # Byte-aligned, non-final stored blocks: each a zero header byte, LEN,
+    # NLEN, then at most 65535 bytes of the data (LEN is 16 bits).
+    return b"".join(
+        b"\x00" + _stored_length(chunk) + chunk
+        for chunk in (
+            data[start : start + _MAX_STORED]
+            for start in range(0, len(data), _MAX_STORED)
+        )
+    )
+
+
+# A sync flush ends with an empty stored block; its LEN and NLEN.
+_SYNC_MARKER = _stored_length(b"")
+
+
+# Each progress value as JSON text (identity), padded to SLOT_WIDTH (the
+# uncompressed gzip body) and as the stored block filling its slot. Segments
+# are cut just before the LEN and NLEN of the empty stored block their sync
+# flush ends with, so a slot reuses that block's header.
+_SLOT_VALUES = {status: encode_json(status) for status in (None, "seen", "completed")}
+_SLOT_PADDED = {status: text.ljust(SLOT_WIDTH) for status, text in _SLOT_VALUES.items()}
+_SLOT_BLOCKS = {
+    status: _stored_length(padded) + padded for status, padded in _SLOT_PADDED.items()
+}
+
+
+class LessonBody:
+    """
+    Pre-encoded block content of one lesson for one tenant.
+
+    `segments[i]` is block i's JSON up to its `user_progress` value,
+    preceded by the `},` closing block i - 1. `deflated[i]` is the raw
+    deflate output for `segments[i]`, cut before the LEN and NLEN of its
+    sync flush. `bare_segments` and `bare_deflated` are the same without
+    `variant.data`, for clients that already hold content `version`.
+    """
+
+    __slots__ = (
+        "block_ids",
+        "version",
+        "segments",
+        "deflated",
+        "bare_segments",
+        "bare_deflated",
+    )
+
+    def __init__(
+        self,
+        block_ids=(),
+        version=0,
+        segments=(),
+        deflated=(),
+        bare_segments=(),
+        bare_deflated=(),
+    ):
+        self.block_ids = tuple(block_ids)
+        self.version = version
+        self.segments = tuple(segments)
+        self.deflated = tuple(deflated)
+        self.bare_segments = tuple(bare_segments)
+        self.bare_deflated = tuple(bare_deflated)
+
+    def __reduce__(self):
+        return (
+            LessonBody,
+            (
+                self.block_ids,
+                self.version,
+                self.segments,
+                self.deflated,
+                self.bare_segments,
+                self.bare_deflated,
+            ),
+        )
+
+    def __len__(self):
+        return len(self.block_ids)
+
+
+def _encode_segments(structure, include_data):
+    segments = []
+    for index, (
+        block_id,
+        block_type,
+        position,
+        variant_id,
+        variant_tenant_id,
+        variant_data,
+    ) in enumerate(structure.rows()):
+        variant = {"id": variant_id, "tenant_id": variant_tenant_id}
+        if include_data:
+            variant["data"] = variant_data
+        block = encode_json(
+            {
+                "id": block_id,
+                "type": block_type,
+                "position": position,
+                "variant": variant,
+            }
+        )
+        # Reopen the object to append the per-user key.
+        segments.append((b"}," if index else b"") + block[:-1] + b',"user_progress":')
+    return segments
+
+
+def _deflate_segments(segments):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = []
+    for segment in segments:
+        output = compressor.compress(segment) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        deflated.append(output[: -len(_SYNC_MARKER)])
+        # Keep the window's offsets right; this output is replaced per request.
+        compressor.compress(_PLACEHOLDER)
+        compressor.flush(zlib.Z_SYNC_FLUSH)
+    return deflated
+
+
+def build_lesson_body(structure):
+    """Encode and deflate the shared content of a LessonStructure."""
+    segments = _encode_segments(structure, include_data=True)
+    bare_segments = _encode_segments(structure, include_data=False)
+    return LessonBody(
+        structure.block_ids,
+        structure.version,
+        segments,
+        _deflate_segments(segments),
+        bare_segments,
+        _deflate_segments(bare_segments),
+    )
+
+
+@timed("structure")
+def get_lesson_body(lesson_id, tenant_id, fields=None, published_version=None):
+    """
+    Return the LessonBody for a lesson, served from cache when available.
+
+    Keys of live content carry the lesson's cache generation, which costs
+    one more cache read up front.
+
+    With `fields`, variant data is projected to those keys. A miss fetches
+    the projection straight from the primary (not the full structure); a hit
+    costs two cache reads after the generation: the content version, then
+    the projected body built from it.
+
+    With `published_version`, the body is built from the published snapshot
+    (and projected in Python): one cache read, or on a miss one primary-key
+    lookup.
+    """
+    if published_version is not None:
+        return _get_snapshot_body(lesson_id, tenant_id, published_version, fields)
+    generation = lesson_generation(lesson_id, tenant_id)
+    if not fields:
+        return get_or_fill(
+            body_cache_key(lesson_id, tenant_id, generation),
+            lambda: build_lesson_body(get_lesson_structure(lesson_id, tenant_id)),
+        )
+
+    version_key = content_version_cache_key(lesson_id, tenant_id, generation)
+    version = cache.get(version_key)
+    if version is not None:
+        body = cache.get(
+            projected_body_cache_key(lesson_id, tenant_id, generation, version, fields)
+        )
+        if body is not None:
+            return body
+    token = acquire_fill_lease(version_key)
+    if token is None:
+        return build_lesson_body(fetch_lesson_structure(lesson_id, tenant_id, fields))
+    with use_primary():
+        body = build_lesson_body(fetch_lesson_structure(lesson_id, tenant_id, fields))
+    fill_cache(
+        version_key,
+        token,
+        {
+            version_key: body.version,
+            projected_body_cache_key(
+                lesson_id, tenant_id, generation, body.version, fields
+            ): body,
+        },
+    )
+    return body
+
+
+def _get_snapshot_body(lesson_id, tenant_id, version, fields):
+    # Snapshots never change, so neither do bodies built from them: no fill
+    # lease or generation needed.
+    key = snapshot_body_cache_key(lesson_id, tenant_id, version, fields)
+    body = cache.get(key)
+    if body is None:
+        structure = get_lesson_structure(lesson_id, tenant_id, version)
+        if fields:
+            structure = project_structure(structure, fields)
+        body = build_lesson_body(structure)
+        cache.set(key, body, SNAPSHOT_CACHE_TTL)
+    return body
+
+
+def _head_and_tail(lesson, body, summary):
+    head = (
+        b'{"lesson":'
+        + encode_json(
+            {
+                "id": lesson.id,
+                "slug": lesson.slug,
+                "title": lesson.title,
+                "content_version": body.version,
+            }
+        )
+        + b',"blocks":['
+    )
+    tail = (
+        (b"}]" if body.segments else b"]")
+        + b',"progress_summary":'
+        + encode_json(summary)
+        + b"}"
+    )
+    return head, tail
+
+
+def render_lesson(
+    lesson, tenant_id, user_id, gzip=False, known_version=None, fields=None
+):
+    """
+    Return the lesson GET response body as bytes: the same document as
+    `assemble_lesson`, gzip-compressed when `gzip` is set, with variant
+    data projected to `fields` when given, and without variant data when
+    `known_version` is the current content version. A published lesson is
+    rendered from its snapshot.
+    Cache hit: 1 query (progress).
+    """
+    body = get_lesson_body(lesson.id, tenant_id, fields, lesson.published_version)
+    progress_map = get_progress_map(user_id, lesson.id)
+    summary = compute_progress_summary(body, progress_map)
+    with phase("render"):
+        return encode_lesson_response(
+            lesson,
+            body,
+            progress_map,
+            summary,
+            gzip=gzip,
+            include_data=known_version != body.version,
+        )
+
+
+def encode_lesson_response(
+    lesson, body, progress_map, summary, gzip=False, include_data=True
+):
+    """Splice one user's response out of a LessonBody. No queries."""
+    head, tail = _head_and_tail(lesson, body, summary)
+    statuses = [progress_map.get(block_id) for block_id in body.block_ids]
+    if include_data:
+        segments, deflated_segments = body.segments, body.deflated
+    else:
+        segments, deflated_segments = body.bare_segments, body.bare_deflated
+    if not gzip:
+        parts = [head]
+        for segment, status in zip(segments, statuses):
+            parts.append(segment)
+            parts.append(_SLOT_VALUES[status])
+        parts.append(tail)
+        return b"".join(parts)
+
+    raw = [head]
+    stream = [_GZIP_HEADER, _stored_blocks(head)]
+    for segment, deflated, status in zip(segments, deflated_segments, statuses):
+        raw.append(segment)
+        raw.append(_SLOT_PADDED[status])
+        stream.append(deflated)
+        stream.append(_SLOT_BLOCKS[status])
+    raw.append(tail)
+    # zlib.compress ends the stream with the final block.
+    stream.append(zlib.compress(tail, GZIP_LEVEL, -zlib.MAX_WBITS))
+    raw = b"".join(raw)
+    stream.append(struct.pack("<II", zlib.crc32(raw), len(raw) & 0xFFFFFFFF))
+    return b"".join(stream)
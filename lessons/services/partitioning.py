@@ -0,0 +1,169 @@
+"""
+Online migration of user_block_progress to a hash-partitioned table.
+
+1. `prepare_partitioned_table` creates user_block_progress_partitioned,
+   PARTITION BY HASH (user_id), plus a trigger on the live table that mirrors
+   every insert, update and delete into it.
+2. `copy_batch` backfills existing rows in primary-key order, one short
+   transaction per batch. Rows are locked FOR KEY SHARE while copied so a
+   concurrent delete can't be resurrected, and ON CONFLICT DO NOTHING keeps
+   whatever the trigger already wrote, which is never older.
+3. `swap_partitioned_table` drops the trigger and renames the tables in one
+   short ACCESS EXCLUSIVE transaction. The old table is kept as
+   user_block_progress_unpartitioned until it is dropped by hand.
+
+Every query the API runs filters on user_id, so each one is pruned to a
+single partition. The partitioned table has no separate (user_id, lesson_id)
+index: the primary key's leading columns serve those lookups.
+"""
+
+from django.db import connection, transaction
+
+TABLE = "user_block_progress"
+PARTITIONED_TABLE = "user_block_progress_partitioned"
+LEGACY_TABLE = "user_block_progress_unpartitioned"
+DEFAULT_PARTITIONS = 16
+
+
+def partition_name(remainder):
+    return f"{TABLE}_p{remainder}"
+
+
+_MIRROR_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION {PARTITIONED_TABLE}_mirror() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {PARTITIONED_TABLE}
+             WHERE user_id = OLD.user_id
+               AND lesson_id = OLD.lesson_id
+               AND block_id = OLD.block_id;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+        INSERT INTO {PARTITIONED_TABLE}
+            (user_id, lesson_id, block_id, status, updated_at)
+        VALUES (NEW.user_id, NEW.lesson_id, NEW.block_id, NEW.status, NEW.updated_at)
+        ON CONFLICT (user_id, lesson_id, block_id) DO UPDATE
+           SET status = EXCLUDED.status, updated_at = EXCLUDED.updated_at;
+        RETURN NEW;
+    END
+    $$
+"""
+
+
+def _relkind(cursor, name):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [name])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        return _relkind(cursor, TABLE) == "p"
+
+
+def prepare_partitioned_table(partitions=DEFAULT_PARTITIONS):
+    """
+    Create the partitioned table and start mirroring writes into it.
+    Does nothing if it already exists, so an interrupted migration can be
+    re-run. Returns False when there was nothing to do.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if _relkind(cursor, TABLE) == "p" or _relkind(cursor, PARTITIONED_TABLE):
+            return False
+        cursor.execute(f"""
+            CREATE TABLE {PARTITIONED_TABLE} (
+              user_id      INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+              lesson_id    INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+              block_id     INTEGER NOT NULL REFERENCES blocks(id) ON DELETE CASCADE,
+              status       TEXT NOT NULL CHECK (status IN ('seen', 'completed')),
+              updated_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+              PRIMARY KEY (user_id, lesson_id, block_id)
+            ) PARTITION BY HASH (user_id)
+            """)
+        for remainder in range(partitions):
+            cursor.execute(f"""
+                CREATE TABLE {partition_name(remainder)}
+                PARTITION OF {PARTITIONED_TABLE}
+                FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})
+                """)
+        cursor.execute(_MIRROR_FUNCTION_SQL)
+        cursor.execute(f"""
+            CREATE TRIGGER {PARTITIONED_TABLE}_mirror
+            AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+            FOR EACH ROW EXECUTE FUNCTION {PARTITIONED_TABLE}_mirror()
+            """)
+    return True
+
+
+def copy_batch(after=None, batch_size=10000):
+    """
+    Copy the next `batch_size` rows after the (user_id, lesson_id, block_id)
+    key `after` into the partitioned table. Returns (rows_copied, last_key);
+    last_key is None once the table is exhausted.
+    """
+    condition = "(user_id, lesson_id, block_id) > (%s, %s, %s)" if after else "TRUE"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH batch AS (
+                SELECT user_id, lesson_id, block_id, status, updated_at
+                  FROM {TABLE}
+                 WHERE {condition}
+                 ORDER BY user_id, lesson_id, block_id
+                 LIMIT %s
+                   FOR KEY SHARE
+            ), copied AS (
+                INSERT INTO {PARTITIONED_TABLE}
+                    (user_id, lesson_id, block_id, status, updated_at)
+                SELECT * FROM batch
+                ON CONFLICT (user_id, lesson_id, block_id) DO NOTHING
+            )
+            SELECT count(*) OVER (), user_id, lesson_id, block_id
+              FROM batch
+             ORDER BY user_id DESC, lesson_id DESC, block_id DESC
+             LIMIT 1
+            """,
+            [*(after or ()), batch_size],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return 0, None
+    return row[0], tuple(row[1:])
+
+
+def missing_rows():
+    """Rows of the live table not yet in the partitioned one (full scan)."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT count(*)
+              FROM {TABLE} o
+             WHERE NOT EXISTS (
+                   SELECT 1 FROM {PARTITIONED_TABLE} n
+                    WHERE n.user_id = o.user_id
+                      AND n.lesson_id = o.lesson_id
+                      AND n.block_id = o.block_id)
+            """)
+        return cursor.fetchone()[0]
+
+
+def swap_partitioned_table():
+    """
+    Put the partitioned table in place of the live one. Holds an ACCESS
+    EXCLUSIVE lock only for the catalog changes (milliseconds). Check
+    `missing_rows()` first: rows the backfill skipped would be lost.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"DROP TRIGGER {PARTITIONED_TABLE}_mirror ON {TABLE}")
+        cursor.execute(f"DROP FUNCTION {PARTITIONED_TABLE}_mirror()")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}")
+        cursor.execute(f"ALTER INDEX {TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey")
+        cursor.execute(
+            f"ALTER INDEX IF EXISTS idx_{TABLE}_user_lesson "
+            f"RENAME TO idx_{LEGACY_TABLE}_user_lesson"
+        )
+        cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {TABLE}")
+        cursor.execute(f"ALTER INDEX {PARTITIONED_TABLE}_pkey RENAME TO {TABLE}_pkey")
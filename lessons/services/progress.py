@@ -1,49 +1,88 @@
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connections, transaction
 from django.utils import timezone
 
-from lessons.models import UserBlockProgress
+from lessons.prepared import PreparedStatement
+from lessons.routers import tenant_database
+from lessons.services.rollups import record_progress_change
+from lessons.timing import timed
 
 STATUS_RANK = {"seen": 1, "completed": 2}
 
+_LOCK_PROGRESS = PreparedStatement(
+    "lessons_lock_progress",
+    """
+    SELECT status
+      FROM user_block_progress
+     WHERE user_id = %(user_id)s
+       AND lesson_id = %(lesson_id)s
+       AND block_id = %(block_id)s
+       FOR UPDATE
+    """,
+)
+_UPDATE_PROGRESS = PreparedStatement(
+    "lessons_update_progress",
+    """
+    UPDATE user_block_progress
+       SET status = %(status)s, updated_at = %(updated_at)s
+     WHERE user_id = %(user_id)s
+       AND lesson_id = %(lesson_id)s
+       AND block_id = %(block_id)s
+    """,
+)
+_INSERT_PROGRESS = PreparedStatement(
+    "lessons_insert_progress",
+    """
+    INSERT INTO user_block_progress
+        (user_id, lesson_id, block_id, status, updated_at)
+    VALUES (%(user_id)s, %(lesson_id)s, %(block_id)s, %(status)s, %(updated_at)s)
+    """,
+)
 
+
+@timed("upsert")
 def upsert_progress(user_id, lesson_id, block_id, status):
     """
     Upsert user progress for a block.
 
     - Idempotent
     - Monotonic: 'completed' never downgrades to 'seen'
-    - Concurrency-safe: select_for_update on existing rows,
+    - Concurrency-safe: the existing row is locked (FOR UPDATE),
       IntegrityError retry on concurrent inserts
+    - Every actual transition is folded into the analytics rollups in the
+      same transaction (lessons.services.rollups)
+
+    Writes go to the bound tenant database (lessons.routers), as prepared
+    statements (lessons.prepared).
 
     Returns the stored_status after upsert.
     """
-    with transaction.atomic():
-        existing = (
-            UserBlockProgress.objects.select_for_update()
-            .filter(user_id=user_id, lesson_id=lesson_id, block_id=block_id)
-            .first()
-        )
+    using = tenant_database()
+    row = {
+        "user_id": user_id,
+        "lesson_id": lesson_id,
+        "block_id": block_id,
+        "status": status,
+        "updated_at": timezone.now(),
+    }
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        _LOCK_PROGRESS.execute(cursor, row)
+        existing = cursor.fetchone()
 
         if existing is not None:
-            if STATUS_RANK.get(status, 0) <= STATUS_RANK.get(existing.status, 0):
-                return existing.status
+            (existing_status,) = existing
+            if STATUS_RANK.get(status, 0) <= STATUS_RANK.get(existing_status, 0):
+                return existing_status
 
-            UserBlockProgress.objects.filter(
-                user_id=user_id, lesson_id=lesson_id, block_id=block_id
-            ).update(status=status, updated_at=timezone.now())
+            _UPDATE_PROGRESS.execute(cursor, row)
+            record_progress_change(user_id, lesson_id, existing_status, status)
             return status
 
     # Row doesn't exist — insert outside the lock to keep the txn short.
     # Handle race: if another request inserts first, retry as update.
     try:
-        with transaction.atomic():
-            UserBlockProgress.objects.create(
-                user_id=user_id,
-                lesson_id=lesson_id,
-                block_id=block_id,
-                status=status,
-                updated_at=timezone.now(),
-            )
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            _INSERT_PROGRESS.execute(cursor, row)
+            record_progress_change(user_id, lesson_id, None, status)
             return status
     except IntegrityError:
         # Concurrent insert won — fall through to update path
@@ -0,0 +1,190 @@
+"""
+Progress-only reads for clients that already hold the lesson content, e.g.
+to sync progress across devices.
+
+A client passes back the `cursor` of its previous response as `since` and
+gets only the rows updated after it. Rows are timestamped in the writing
+transaction before it commits, so a write can become visible with an
+updated_at slightly older than a cursor already handed out. Changes are
+therefore selected from SYNC_OVERLAP before `since`: a client may see a row
+again, which is harmless because statuses only move forward.
+"""
+
+from datetime import timedelta
+
+from django.db import connections, router
+
+from lessons.models import UserBlockProgress
+from lessons.services.assembly import compute_progress_summary, get_lesson_structure
+from lessons.timing import timed
+
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# The user's progress rows in lessons with a change, each with its block's
+# position in the lesson (NULL for a block no longer in it) and the lesson's
+# block count. A published lesson's blocks are those of its snapshot.
+_USER_DELTA_SQL = """
+    WITH changed AS (
+        SELECT DISTINCT lesson_id
+          FROM user_block_progress
+         WHERE user_id = %(user_id)s {changed_filter}
+    ),
+    lesson_block_list AS (
+        SELECT lb.lesson_id, lb.block_id, lb.position
+          FROM changed c
+          JOIN lessons l ON l.id = c.lesson_id AND l.published_version IS NULL
+          JOIN lesson_blocks lb ON lb.lesson_id = c.lesson_id
+        UNION ALL
+        SELECT s.lesson_id, (b.value ->> 0)::int, (b.value ->> 2)::int
+          FROM changed c
+          JOIN lessons l ON l.id = c.lesson_id
+          JOIN lesson_snapshots s
+            ON s.tenant_id = l.tenant_id
+           AND s.lesson_id = l.id
+           AND s.version = l.published_version
+         CROSS JOIN LATERAL jsonb_array_elements(s.blocks) b
+    ),
+    totals AS (
+        SELECT lesson_id, count(*) AS total_blocks
+          FROM lesson_block_list
+         GROUP BY lesson_id
+    )
+    SELECT p.lesson_id, p.block_id, p.status, p.updated_at, lbl.position,
+           coalesce(t.total_blocks, 0)
+      FROM user_block_progress p
+      JOIN changed c ON c.lesson_id = p.lesson_id
+      LEFT JOIN lesson_block_list lbl
+        ON lbl.lesson_id = p.lesson_id AND lbl.block_id = p.block_id
+      LEFT JOIN totals t ON t.lesson_id = p.lesson_id
+     WHERE p.user_id = %(user_id)s
+     ORDER BY p.lesson_id, p.block_id
+"""
+
+
+def _progress_entry(block_id, status, updated_at):
+    return {"block_id": block_id, "status": status, "updated_at": updated_at}
+
+
+def _changed_since(since):
+    return None if since is None else since - SYNC_OVERLAP
+
+
+def _lesson_delta(lesson_id, rows, changed_after, summary):
+    """
+    rows: (block_id, status, updated_at, ...) for every block the user
+    touched.
+    """
+    return {
+        "lesson_id": lesson_id,
+        "progress": [
+            _progress_entry(*row[:3])
+            for row in rows
+            if changed_after is None or row[2] > changed_after
+        ],
+        "progress_summary": summary,
+    }
+
+
+def _positioned_summary(rows, total_blocks):
+    """
+    compute_progress_summary without the lesson structure. rows: (block_id,
+    status, updated_at, position) for every block the user touched,
+    position None for a block no longer in the lesson.
+    """
+    in_lesson = [
+        (position, block_id, status)
+        for block_id, status, _updated_at, position in rows
+        if position is not None
+    ]
+    completed = sum(1 for _, _, status in in_lesson if status == "completed")
+    last_seen = max(in_lesson, default=None)
+    return {
+        "total_blocks": total_blocks,
+        "seen_blocks": len(in_lesson),
+        "completed_blocks": completed,
+        "last_seen_block_id": last_seen[1] if last_seen else None,
+        "completed": total_blocks > 0 and completed == total_blocks,
+    }
+
+
+@timed("progress")
+def _lesson_progress_rows(user_id, lesson_id):
+    return list(
+        UserBlockProgress.objects.filter(user_id=user_id, lesson_id=lesson_id)
+        .order_by("block_id")
+        .values_list("block_id", "status", "updated_at")
+    )
+
+
+@timed("progress")
+def _user_delta_rows(user_id, changed_after):
+    changed_filter = "" if changed_after is None else "AND updated_at > %(after)s"
+    using = router.db_for_read(UserBlockProgress)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            _USER_DELTA_SQL.format(changed_filter=changed_filter),
+            {"user_id": user_id, "after": changed_after},
+        )
+        return cursor.fetchall()
+
+
+def _cursor(updated_ats, since):
+    latest = max(updated_ats, default=None)
+    if since is not None and (latest is None or since > latest):
+        return since
+    return latest
+
+
+def lesson_progress_delta(
+    tenant_id, user_id, lesson_id, since=None, published_version=None
+):
+    """
+    The user's progress rows for one lesson updated after `since` (all rows
+    without it), the lesson's current progress_summary and the next cursor.
+
+    1 query: a range scan of the primary key on (user_id, lesson_id). The
+    summary's block list comes from the cached lesson structure, or its
+    published snapshot given the lesson's `published_version`.
+    """
+    rows = _lesson_progress_rows(user_id, lesson_id)
+    summary = compute_progress_summary(
+        get_lesson_structure(lesson_id, tenant_id, published_version),
+        {block_id: status for block_id, status, _updated_at in rows},
+    )
+    delta = _lesson_delta(lesson_id, rows, _changed_since(since), summary)
+    delta["cursor"] = _cursor((row[2] for row in rows), since)
+    return delta
+
+
+def user_progress_delta(tenant_id, user_id, since=None):
+    """
+    Like `lesson_progress_delta` for every lesson the user has progress in,
+    leaving out lessons with no change after `since`.
+
+    1 query, however many lessons changed: the user's rows in those lessons
+    (range scans of the primary key on user_id), each joined to its block's
+    position in the lesson's block list, with the lists' block counts. The
+    list is lesson_blocks, or the published snapshot's blocks for a lesson
+    with a published_version. No lesson structures are loaded.
+    """
+    changed_after = _changed_since(since)
+    rows = _user_delta_rows(user_id, changed_after)
+    by_lesson = {}
+    totals = {}
+    for lesson_id, block_id, status, updated_at, position, total_blocks in rows:
+        by_lesson.setdefault(lesson_id, []).append(
+            (block_id, status, updated_at, position)
+        )
+        totals[lesson_id] = total_blocks
+    return {
+        "lessons": [
+            _lesson_delta(
+                lesson_id,
+                lesson_rows,
+                changed_after,
+                _positioned_summary(lesson_rows, totals[lesson_id]),
+            )
+            for lesson_id, lesson_rows in by_lesson.items()
+        ],
+        "cursor": _cursor((row[3] for row in rows), since),
+    }
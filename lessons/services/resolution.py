@@ -0,0 +1,246 @@
+from django.db import connections
+
+from lessons.routers import tenant_database, tenant_databases
+
+# Variant chosen for one lesson block: the tenant's own override if it
+# exists, otherwise the nearest ancestor's (tenant_chains, see
+# lessons.services.tenant_chains), otherwise the default (tenant_id IS NULL).
+# The block's few variants come from idx_block_variants_block_tenant and are
+# ranked by their tenant's place in the chain.
+_CHOSEN_VARIANT_SQL = """
+    SELECT v.id
+      FROM block_variants v
+      LEFT JOIN tenant_chains c
+             ON c.tenant_id = {tenant_id} AND c.ancestor_id = v.tenant_id
+     WHERE v.block_id = {block_id}
+       AND (v.tenant_id = {tenant_id} OR c.rank IS NOT NULL OR v.tenant_id IS NULL)
+     ORDER BY CASE WHEN v.tenant_id = {tenant_id} THEN 0 ELSE c.rank END NULLS LAST
+     LIMIT 1
+"""
+
+# Every content change goes through here or `refresh_resolved_block`, so
+# both bump lesson_content_versions in the statement that changes the rows.
+_BUMP_VERSIONS_CTE = """
+    bumped AS (
+        INSERT INTO lesson_content_versions AS v (lesson_id, tenant_id)
+        SELECT id, tenant_id FROM lessons WHERE id = ANY(%s)
+        ON CONFLICT (lesson_id) DO UPDATE SET version = v.version + 1
+    )
+"""
+
+_DELETE_RESOLVED_SQL = f"""
+    WITH {_BUMP_VERSIONS_CTE}
+    DELETE FROM resolved_lesson_blocks
+     WHERE (tenant_id, lesson_id) IN (
+           SELECT tenant_id, id FROM lessons WHERE id = ANY(%s)
+     )
+"""
+
+_INSERT_RESOLVED_SQL = """
+    INSERT INTO resolved_lesson_blocks
+        (tenant_id, lesson_id, position, block_id, variant_id)
+    SELECT * FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[], %s::int[])
+"""
+
+
+def choose_variants(pairs):
+    """
+    Resolve (block_id, tenant_id) pairs against the shared block_variants
+    table on "default". Returns {(block_id, tenant_id): variant_id or None}.
+    1 query.
+    """
+    pairs = list(set(pairs))
+    if not pairs:
+        return {}
+    chosen = _CHOSEN_VARIANT_SQL.format(block_id="p.block_id", tenant_id="p.tenant_id")
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT p.block_id, p.tenant_id, ({chosen})
+              FROM unnest(%s::int[], %s::int[]) AS p(block_id, tenant_id)
+            """,
+            [
+                [block_id for block_id, _ in pairs],
+                [tenant_id for _, tenant_id in pairs],
+            ],
+        )
+        return {
+            (block_id, tenant_id): chosen_id
+            for block_id, tenant_id, chosen_id in cursor
+        }
+
+
+def rebuild_resolved_lessons(lesson_ids, using=None):
+    """
+    Recompute every resolved_lesson_blocks row for the given lessons.
+
+    Used when a lesson's block list or ordering changes: positions may shift,
+    so the lesson's rows are replaced wholesale, and its content version is
+    bumped. 2 queries on "default"; a
+    tenant database can't join block_variants, so there the lesson blocks
+    are read first and resolved with `choose_variants` (4 queries).
+    `using` defaults to the bound tenant database.
+    """
+    lesson_ids = list(lesson_ids)
+    if not lesson_ids:
+        return
+    using = using or tenant_database()
+    if using != "default":
+        _rebuild_resolved_lessons_remote(lesson_ids, using)
+        return
+    chosen = _CHOSEN_VARIANT_SQL.format(block_id="lb.block_id", tenant_id="l.tenant_id")
+    with connections[using].cursor() as cursor:
+        cursor.execute(_DELETE_RESOLVED_SQL, [lesson_ids, lesson_ids])
+        cursor.execute(
+            f"""
+            INSERT INTO resolved_lesson_blocks
+                (tenant_id, lesson_id, position, block_id, variant_id)
+            SELECT l.tenant_id, lb.lesson_id, lb.position, lb.block_id, ({chosen})
+              FROM lesson_blocks lb
+              JOIN lessons l ON l.id = lb.lesson_id
+             WHERE lb.lesson_id = ANY(%s)
+            """,
+            [lesson_ids],
+        )
+
+
+def _rebuild_resolved_lessons_remote(lesson_ids, using):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT l.tenant_id, lb.lesson_id, lb.position, lb.block_id
+              FROM lesson_blocks lb
+              JOIN lessons l ON l.id = lb.lesson_id
+             WHERE lb.lesson_id = ANY(%s)
+            """,
+            [lesson_ids],
+        )
+        rows = cursor.fetchall()
+        chosen = choose_variants(
+            (block_id, tenant_id) for tenant_id, _, _, block_id in rows
+        )
+        cursor.execute(_DELETE_RESOLVED_SQL, [lesson_ids, lesson_ids])
+        if rows:
+            columns = [list(column) for column in zip(*rows)]
+            variant_ids = [
+                chosen[(block_id, tenant_id)] for tenant_id, _, _, block_id in rows
+            ]
+            cursor.execute(_INSERT_RESOLVED_SQL, [*columns, variant_ids])
+
+
+def refresh_resolved_block(block_id, tenant_id=None):
+    """
+    Re-resolve the rows that use `block_id` after one of its variants changed.
+
+    A tenant override only affects the rows of that tenant and the tenants
+    inheriting from it (`tenant_subtree`, on their databases); a default
+    variant can be the fallback for any tenant, on any database. Only rows
+    whose chosen variant actually changes are written. Returns every
+    (tenant_id, lesson_id) using the block, since a data-only edit changes
+    their content without changing the resolution; all of them get their
+    content version bumped. 1 query per database for "default", 3 for a
+    tenant database, plus 1 for the subtree of a tenant override.
+    """
+    return refresh_resolved_blocks([block_id], tenant_id)
+
+
+def refresh_resolved_blocks(block_ids, tenant_id=None):
+    """
+    `refresh_resolved_block` for many blocks whose variants for `tenant_id`
+    (None: the defaults) changed, in the same number of queries.
+    """
+    block_ids = sorted(set(block_ids))
+    if not block_ids:
+        return set()
+    if tenant_id is None:
+        tenant_ids = None
+        aliases = tenant_databases()
+    else:
+        tenant_ids = tenant_subtree(tenant_id)
+        aliases = {tenant_database(tenant) for tenant in tenant_ids}
+    affected = set()
+    for using in sorted(aliases):
+        if using == "default":
+            affected |= _refresh_resolved_blocks_local(block_ids, tenant_ids)
+        else:
+            affected |= _refresh_resolved_blocks_remote(block_ids, tenant_ids, using)
+    return affected
+
+
+def tenant_subtree(tenant_id):
+    """The tenant followed by every tenant inheriting from it. 1 query."""
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            "SELECT tenant_id FROM tenant_chains WHERE ancestor_id = %s", [tenant_id]
+        )
+        return [tenant_id] + sorted(row[0] for row in cursor.fetchall())
+
+
+def _refresh_resolved_blocks_local(block_ids, tenant_ids):
+    chosen = _CHOSEN_VARIANT_SQL.format(block_id="r.block_id", tenant_id="r.tenant_id")
+    tenant_filter = "" if tenant_ids is None else "AND r.tenant_id = ANY(%s)"
+    params = [block_ids] if tenant_ids is None else [block_ids, tenant_ids]
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH affected AS (
+                SELECT r.tenant_id, r.lesson_id, r.position, r.variant_id,
+                       ({chosen}) AS chosen_id
+                  FROM resolved_lesson_blocks r
+                 WHERE r.block_id = ANY(%s) {tenant_filter}
+            ), changed AS (
+                UPDATE resolved_lesson_blocks r
+                   SET variant_id = a.chosen_id
+                  FROM affected a
+                 WHERE r.tenant_id = a.tenant_id
+                   AND r.lesson_id = a.lesson_id
+                   AND r.position = a.position
+                   AND a.variant_id IS DISTINCT FROM a.chosen_id
+            ), bumped AS (
+                INSERT INTO lesson_content_versions AS v (lesson_id, tenant_id)
+                SELECT DISTINCT lesson_id, tenant_id FROM affected
+                ON CONFLICT (lesson_id) DO UPDATE SET version = v.version + 1
+            )
+            SELECT DISTINCT tenant_id, lesson_id FROM affected
+            """,
+            params,
+        )
+        return {(row[0], row[1]) for row in cursor.fetchall()}
+
+
+def _refresh_resolved_blocks_remote(block_ids, tenant_ids, using):
+    tenant_filter = "" if tenant_ids is None else "AND tenant_id = ANY(%s)"
+    params = [block_ids] if tenant_ids is None else [block_ids, tenant_ids]
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT DISTINCT tenant_id, lesson_id, block_id
+              FROM resolved_lesson_blocks
+             WHERE block_id = ANY(%s) {tenant_filter}
+            """,
+            params,
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return set()
+        pairs = sorted({(block_id, tenant) for tenant, _, block_id in rows})
+        chosen = choose_variants(pairs)
+        cursor.execute(
+            f"""
+            WITH {_BUMP_VERSIONS_CTE}
+            UPDATE resolved_lesson_blocks r
+               SET variant_id = c.variant_id
+              FROM unnest(%s::int[], %s::int[], %s::int[])
+                   AS c(block_id, tenant_id, variant_id)
+             WHERE r.block_id = c.block_id
+               AND r.tenant_id = c.tenant_id
+               AND r.variant_id IS DISTINCT FROM c.variant_id
+            """,
+            [
+                sorted({lesson for _, lesson, _ in rows}),
+                [block_id for block_id, _ in pairs],
+                [tenant for _, tenant in pairs],
+                [chosen[pair] for pair in pairs],
+            ],
+        )
+    return {(tenant, lesson) for tenant, lesson, _ in rows}
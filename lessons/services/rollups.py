@@ -0,0 +1,209 @@
+from django.db import connections, transaction
+
+from lessons.models import Lesson
+from lessons.prepared import PreparedStatement
+from lessons.routers import tenant_database
+
+# One statement per progress transition: bump the user's per-lesson counts,
+# then fold the change into the lesson's totals. The user row's lock (taken by
+# ON CONFLICT) serialises concurrent transitions for the same user+lesson, so
+# "started" (row was inserted) and "just completed" (this transition brought
+# completed_blocks up to the lesson's block count) are exact without reading
+# the previous counts.
+_RECORD_TRANSITION = PreparedStatement(
+    "lessons_record_transition",
+    """
+    WITH total AS (
+        SELECT count(*) AS blocks FROM lesson_blocks WHERE lesson_id = %(lesson_id)s
+    ), user_counts AS (
+        INSERT INTO user_lesson_progress AS p
+            (user_id, lesson_id, seen_blocks, completed_blocks, updated_at)
+        VALUES (%(user_id)s, %(lesson_id)s, %(seen)s, %(completed)s, now())
+        ON CONFLICT (user_id, lesson_id) DO UPDATE
+           SET seen_blocks = p.seen_blocks + EXCLUDED.seen_blocks,
+               completed_blocks = p.completed_blocks + EXCLUDED.completed_blocks,
+               updated_at = EXCLUDED.updated_at
+        RETURNING (xmax = 0) AS started, completed_blocks
+    )
+    INSERT INTO lesson_progress_rollups AS r
+        (lesson_id, tenant_id, users_started, users_completed,
+         completed_blocks_total, updated_at)
+    SELECT l.id,
+           l.tenant_id,
+           u.started::int,
+           (%(completed)s = 1 AND u.completed_blocks = total.blocks)::int,
+           %(completed)s,
+           now()
+      FROM user_counts u, total, lessons l
+     WHERE l.id = %(lesson_id)s
+    ON CONFLICT (lesson_id) DO UPDATE
+       SET users_started = r.users_started + EXCLUDED.users_started,
+           users_completed = r.users_completed + EXCLUDED.users_completed,
+           completed_blocks_total =
+               r.completed_blocks_total + EXCLUDED.completed_blocks_total,
+           updated_at = EXCLUDED.updated_at
+    """,
+)
+
+
+def record_progress_change(user_id, lesson_id, previous_status, status):
+    """
+    Fold one user_block_progress transition into the analytics rollups.
+
+    Call inside the transaction that wrote the progress row, and only when
+    the stored status actually changed. 1 query.
+    """
+    seen = 1 if previous_status is None else 0
+    completed = 1 if status == "completed" and previous_status != "completed" else 0
+    with connections[tenant_database()].cursor() as cursor:
+        _RECORD_TRANSITION.execute(
+            cursor,
+            {
+                "user_id": user_id,
+                "lesson_id": lesson_id,
+                "seen": seen,
+                "completed": completed,
+            },
+        )
+
+
+def rebuild_progress_rollups(lesson_ids=None, since=None):
+    """
+    Recompute rollups from user_block_progress.
+
+    - lesson_ids: restrict to these lessons (default: every lesson).
+    - since: only recompute (user, lesson) pairs with progress updated at or
+      after this timestamp, then re-aggregate the lessons they belong to.
+
+    Fixes drift the online counters can't see: progress written outside
+    upsert_progress, or lessons whose block list changed (a user who had
+    completed every block may no longer have). Without `since`, rows of
+    lessons or users whose progress is gone are dropped as well. Runs on
+    the bound tenant database. Returns the lesson ids refreshed.
+    """
+    filters = []
+    params = {}
+    if lesson_ids is not None:
+        filters.append("p.lesson_id = ANY(%(lesson_ids)s)")
+        params["lesson_ids"] = list(lesson_ids)
+    if since is not None:
+        filters.append("p.updated_at >= %(since)s")
+        params["since"] = since
+    where = ("WHERE " + " AND ".join(filters)) if filters else ""
+
+    if since is not None:
+        # Only the pairs found are recomputed, and their lessons re-aggregated.
+        lessons_sql = "SELECT DISTINCT lesson_id FROM rollup_pairs"
+        stale_sql = """
+            DELETE FROM user_lesson_progress u
+             USING rollup_pairs t
+             WHERE u.user_id = t.user_id AND u.lesson_id = t.lesson_id
+            """
+    else:
+        # Every pair of the lessons is recomputed, including pairs (and
+        # lessons) left without progress, which the pairs found don't cover.
+        lessons_sql = "SELECT l.id FROM lessons l" + (
+            " WHERE l.id = ANY(%(lesson_ids)s)" if lesson_ids is not None else ""
+        )
+        stale_sql = """
+            DELETE FROM user_lesson_progress u
+             USING rollup_lessons t
+             WHERE u.lesson_id = t.lesson_id
+            """
+
+    using = tenant_database()
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE rollup_pairs ON COMMIT DROP AS
+            SELECT DISTINCT p.user_id, p.lesson_id
+              FROM user_block_progress p
+            {where}
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE rollup_lessons (lesson_id) ON COMMIT DROP AS
+            {lessons_sql}
+            """,
+            params,
+        )
+        cursor.execute(stale_sql)
+        cursor.execute("""
+            INSERT INTO user_lesson_progress
+                (user_id, lesson_id, seen_blocks, completed_blocks, updated_at)
+            SELECT p.user_id, p.lesson_id, count(*),
+                   count(*) FILTER (WHERE p.status = 'completed'), now()
+              FROM rollup_pairs t
+              JOIN user_block_progress p
+                ON p.user_id = t.user_id AND p.lesson_id = t.lesson_id
+              JOIN lesson_blocks lb
+                ON lb.lesson_id = p.lesson_id AND lb.block_id = p.block_id
+             GROUP BY p.user_id, p.lesson_id
+            """)
+        cursor.execute("""
+            DELETE FROM lesson_progress_rollups
+             WHERE lesson_id IN (SELECT lesson_id FROM rollup_lessons)
+            RETURNING lesson_id
+            """)
+        refreshed = {row[0] for row in cursor.fetchall()}
+        cursor.execute("""
+            INSERT INTO lesson_progress_rollups
+                (lesson_id, tenant_id, users_started, users_completed,
+                 completed_blocks_total, updated_at)
+            SELECT l.id, l.tenant_id, count(*),
+                   count(*) FILTER (WHERE u.completed_blocks >= total.blocks),
+                   sum(u.completed_blocks), now()
+              FROM rollup_lessons t
+              JOIN lessons l ON l.id = t.lesson_id
+              JOIN user_lesson_progress u ON u.lesson_id = l.id
+             CROSS JOIN LATERAL (
+                   SELECT count(*) AS blocks
+                     FROM lesson_blocks lb WHERE lb.lesson_id = l.id
+             ) total
+             GROUP BY l.id, l.tenant_id
+            RETURNING lesson_id
+            """)
+        refreshed.update(row[0] for row in cursor.fetchall())
+        # Dropped now too, as callers may run this again in one transaction.
+        cursor.execute("DROP TABLE rollup_pairs, rollup_lessons")
+    return refreshed
+
+
+def lesson_completion_stats(tenant_id):
+    """
+    Per-lesson completion analytics for a tenant, read from the rollups.
+
+    1 query — an index scan on lessons(tenant_id) joined to the rollup row by
+    primary key, independent of how many progress rows the tenant has.
+    """
+    rows = (
+        Lesson.objects.filter(tenant_id=tenant_id)
+        .order_by("id")
+        .values_list(
+            "id",
+            "slug",
+            "title",
+            "progress_rollup__users_started",
+            "progress_rollup__users_completed",
+            "progress_rollup__completed_blocks_total",
+        )
+    )
+
+    stats = []
+    for lesson_id, slug, title, started, completed, completed_blocks in rows:
+        started = started or 0
+        stats.append(
+            {
+                "lesson_id": lesson_id,
+                "slug": slug,
+                "title": title,
+                "users_started": started,
+                "users_completed": completed or 0,
+                "average_completed_blocks": (
+                    round(completed_blocks / started, 2) if started else 0.0
+                ),
+            }
+        )
+    return stats
@@ -0,0 +1,83 @@
+"""
+Publishing lessons as immutable snapshots.
+
+A cold read of live content joins resolved_lesson_blocks, blocks and
+block_variants for every block of the lesson. Publishing freezes that
+result once into a lesson_snapshots row keyed by (tenant, lesson, content
+version) and points Lesson.published_version at it; from then on the lesson
+is served from the snapshot with one primary-key lookup
+(`fetch_lesson_snapshot` in lessons.services.assembly). Content edits keep
+re-resolving the live rows as before, which become the lesson's draft until
+it is published again. Lessons never published are served live.
+"""
+
+import json
+
+from django.db import connections, transaction
+from rest_framework.exceptions import NotFound
+
+from lessons.models import Lesson
+from lessons.routers import tenant_database
+from lessons.services.assembly import fetch_lesson_structure
+
+_INSERT_SNAPSHOT_SQL = """
+    INSERT INTO lesson_snapshots (tenant_id, lesson_id, version, blocks)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+
+def publish_lesson(lesson_id, tenant_id):
+    """
+    Publish the lesson's current content. Publishing a version that already
+    has a snapshot (e.g. rolling back to it after a later publish) reuses it.
+    Raises NotFound; returns {"lesson_id", "published_version", "created"}.
+    """
+    using = tenant_database(tenant_id)
+    with transaction.atomic(using=using):
+        try:
+            # Locked, so concurrent publishes of one lesson queue up.
+            lesson = (
+                Lesson.objects.using(using)
+                .select_for_update()
+                .get(pk=lesson_id, tenant_id=tenant_id)
+            )
+        except Lesson.DoesNotExist:
+            raise NotFound("Lesson not found in this tenant")
+        structure = fetch_lesson_structure(lesson_id, tenant_id)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                _INSERT_SNAPSHOT_SQL,
+                [
+                    tenant_id,
+                    lesson_id,
+                    structure.version,
+                    json.dumps(
+                        [list(row) for row in structure.rows()], ensure_ascii=False
+                    ),
+                ],
+            )
+            created = cursor.rowcount == 1
+        if lesson.published_version != structure.version:
+            lesson.published_version = structure.version
+            lesson.save(using=using, update_fields=["published_version"])
+    return {
+        "lesson_id": lesson_id,
+        "published_version": structure.version,
+        "created": created,
+    }
+
+
+def unpublish_lesson(lesson_id, tenant_id):
+    """
+    Serve the lesson's live content again. Its snapshots are kept, so
+    republishing an unchanged lesson is cheap. Raises NotFound.
+    """
+    using = tenant_database(tenant_id)
+    updated = (
+        Lesson.objects.using(using)
+        .filter(pk=lesson_id, tenant_id=tenant_id)
+        .update(published_version=None)
+    )
+    if not updated:
+        raise NotFound("Lesson not found in this tenant")
@@ -0,0 +1,107 @@
+"""
+Tenant inheritance chains.
+
+A tenant may have a parent (tenants.parent_id): a reseller's sub-tenant uses
+its own variant of a block, otherwise its parent's, and so on up the chain,
+otherwise the default. Each tenant's chain is precomputed into
+tenant_chains, one row per ancestor ranked by distance, so resolution
+(lessons.services.resolution) picks the nearest variant in the same query
+that reads the candidates, and the tenants below an override are one index
+scan away when it changes.
+
+Chains only change in `set_tenant_parent`, which rebuilds them for the
+tenant and everything below it and re-resolves their lessons. Edit
+tenants.parent_id only through it.
+"""
+
+from django.db import connections, transaction
+
+from lessons.models import Lesson, Tenant
+from lessons.routers import tenant_database
+from lessons.services.invalidation import invalidate_tenants
+from lessons.services.resolution import rebuild_resolved_lessons, tenant_subtree
+
+REBUILD_BATCH_SIZE = 500
+
+# Walks parent_id up from each tenant; tenants without a parent get no rows.
+_INSERT_CHAINS_SQL = """
+    WITH RECURSIVE chain (tenant_id, ancestor_id, rank) AS (
+        SELECT id, parent_id, 1
+          FROM tenants
+         WHERE id = ANY(%s) AND parent_id IS NOT NULL
+        UNION ALL
+        SELECT c.tenant_id, t.parent_id, c.rank + 1
+          FROM chain c
+          JOIN tenants t ON t.id = c.ancestor_id
+         WHERE t.parent_id IS NOT NULL
+    )
+    INSERT INTO tenant_chains (tenant_id, ancestor_id, rank)
+    SELECT tenant_id, ancestor_id, rank FROM chain
+"""
+
+
+def tenant_chain(tenant_id):
+    """The tenant's ancestors, nearest first. 1 query."""
+    with connections["default"].cursor() as cursor:
+        cursor.execute(
+            "SELECT ancestor_id FROM tenant_chains WHERE tenant_id = %s ORDER BY rank",
+            [tenant_id],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def set_tenant_parent(tenant_id, parent_id):
+    """
+    Make `tenant_id` inherit from `parent_id` (None: from the defaults only).
+
+    Rebuilds the chains of the tenant and its descendants, re-resolves all
+    their lessons (bumping their content versions) and drops their cached
+    content once committed. Raises ValueError for an unknown tenant or a
+    parent that would close a cycle. Returns the number of lessons
+    re-resolved.
+    """
+    with transaction.atomic(using="default"):
+        with connections["default"].cursor() as cursor:
+            # One hierarchy change at a time, so two can't close a cycle.
+            cursor.execute("LOCK TABLE tenant_chains IN SHARE ROW EXCLUSIVE MODE")
+            if not Tenant.objects.filter(pk=tenant_id).exists():
+                raise ValueError(f"Tenant {tenant_id} not found")
+            subtree = tenant_subtree(tenant_id)
+            if parent_id is not None:
+                if parent_id in subtree:
+                    raise ValueError(
+                        f"Tenant {parent_id} inherits from tenant {tenant_id}"
+                    )
+                if not Tenant.objects.filter(pk=parent_id).exists():
+                    raise ValueError(f"Tenant {parent_id} not found")
+            cursor.execute(
+                "UPDATE tenants SET parent_id = %s WHERE id = %s",
+                [parent_id, tenant_id],
+            )
+            cursor.execute(
+                "DELETE FROM tenant_chains WHERE tenant_id = ANY(%s)", [subtree]
+            )
+            cursor.execute(_INSERT_CHAINS_SQL, [subtree])
+        return _re_resolve_tenants(subtree)
+
+
+def _re_resolve_tenants(tenant_ids):
+    by_alias = {}
+    for tenant_id in tenant_ids:
+        by_alias.setdefault(tenant_database(tenant_id), []).append(tenant_id)
+    total = 0
+    for using, tenants in sorted(by_alias.items()):
+        lesson_ids = list(
+            Lesson.objects.using(using)
+            .filter(tenant_id__in=tenants)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        with transaction.atomic(using=using):
+            for start in range(0, len(lesson_ids), REBUILD_BATCH_SIZE):
+                rebuild_resolved_lessons(
+                    lesson_ids[start : start + REBUILD_BATCH_SIZE], using=using
+                )
+            invalidate_tenants(tenants, using=using)
+        total += len(lesson_ids)
+    return total
@@ -0,0 +1,161 @@
+"""
+Provisioning tenant databases and moving tenants between them.
+
+A tenant database has the tenant-scoped tables of db/*.sql (without seed
+data) and none of the shared ones: tenants, blocks and block_variants stay on
+"default", and tenant rows refer to them by id without foreign keys.
+
+Moving a tenant (see NOTES.md for the full procedure):
+1. `move_tenant` copies its rows to the target database with COPY, replacing
+   any earlier partial copy, and checks the row counts.
+2. Point TENANT_DATABASES at the target and deploy.
+3. `purge_tenant` deletes the leftover rows from the source.
+Writes made to the source between 1 and 2 are not carried over, so move a
+tenant while it is quiet.
+"""
+
+import tempfile
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from lessons.routers import tenant_database
+
+SCHEMA_FILES = (
+    "00-schema.sql",
+    "02-resolved-lesson-blocks.sql",
+    "03-progress-rollups.sql",
+    "04-lesson-content-versions.sql",
+    "05-lesson-snapshots.sql",
+)
+SHARED_TABLES = ("tenants", "blocks", "block_variants")
+
+_TENANT_USERS = "SELECT id FROM users WHERE tenant_id = {tenant_id}"
+_TENANT_LESSONS = "SELECT id FROM lessons WHERE tenant_id = {tenant_id}"
+
+# Tenant-scoped tables in foreign-key order: (table, columns, row filter).
+TENANT_TABLES = (
+    ("users", "id, tenant_id, email, created_at", "tenant_id = {tenant_id}"),
+    (
+        "lessons",
+        "id, tenant_id, slug, title, created_at, published_version",
+        "tenant_id = {tenant_id}",
+    ),
+    (
+        "lesson_blocks",
+        "lesson_id, block_id, position",
+        f"lesson_id IN ({_TENANT_LESSONS})",
+    ),
+    (
+        "resolved_lesson_blocks",
+        "tenant_id, lesson_id, position, block_id, variant_id",
+        "tenant_id = {tenant_id}",
+    ),
+    (
+        "user_block_progress",
+        "user_id, lesson_id, block_id, status, updated_at",
+        f"user_id IN ({_TENANT_USERS})",
+    ),
+    (
+        "user_lesson_progress",
+        "user_id, lesson_id, seen_blocks, completed_blocks, updated_at",
+        f"user_id IN ({_TENANT_USERS})",
+    ),
+    (
+        "lesson_progress_rollups",
+        "lesson_id, tenant_id, users_started, users_completed, "
+        "completed_blocks_total, updated_at",
+        "tenant_id = {tenant_id}",
+    ),
+    (
+        "lesson_content_versions",
+        "lesson_id, tenant_id, version",
+        "tenant_id = {tenant_id}",
+    ),
+    (
+        "lesson_snapshots",
+        "tenant_id, lesson_id, version, blocks, published_at",
+        "tenant_id = {tenant_id}",
+    ),
+)
+
+
+def provision_tenant_database(alias):
+    """
+    Create the tenant-scoped schema on `alias`. Returns False if it already
+    exists.
+    """
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute("SELECT to_regclass('users') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            return False
+        for name in SCHEMA_FILES:
+            cursor.execute((settings.BASE_DIR / "db" / name).read_text())
+        # CASCADE drops the foreign keys pointing at the shared tables.
+        cursor.execute(f"DROP TABLE {', '.join(SHARED_TABLES)} CASCADE")
+    return True
+
+
+def _delete_tenant_rows(cursor, tenant_id):
+    # Everything else cascades from lessons and users.
+    cursor.execute("DELETE FROM lessons WHERE tenant_id = %s", [tenant_id])
+    cursor.execute("DELETE FROM users WHERE tenant_id = %s", [tenant_id])
+
+
+def tenant_row_counts(tenant_id, alias):
+    """{table: rows} for one tenant's rows on `alias`."""
+    counts = {}
+    with connections[alias].cursor() as cursor:
+        for table, _columns, condition in TENANT_TABLES:
+            cursor.execute(
+                f"SELECT count(*) FROM {table} "
+                f"WHERE {condition.format(tenant_id=int(tenant_id))}"
+            )
+            counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def move_tenant(tenant_id, target, source=None):
+    """
+    Copy a tenant's rows from `source` (default: where TENANT_DATABASES
+    places it now) to `target`, one COPY per table through a temporary file.
+    Returns {table: rows copied}; raises ValueError if the counts differ.
+    """
+    source = source or tenant_database(tenant_id)
+    if source == target:
+        raise ValueError(f"Tenant {tenant_id} is already on {target}")
+    tenant_id = int(tenant_id)
+
+    with transaction.atomic(using=target):
+        with connections[target].cursor() as target_cursor:
+            _delete_tenant_rows(target_cursor, tenant_id)
+            with connections[source].cursor() as source_cursor:
+                for table, columns, condition in TENANT_TABLES:
+                    with tempfile.TemporaryFile() as buffer:
+                        source_cursor.copy_expert(
+                            f"COPY (SELECT {columns} FROM {table} "
+                            f"WHERE {condition.format(tenant_id=tenant_id)}) "
+                            f"TO STDOUT WITH (FORMAT binary)",
+                            buffer,
+                        )
+                        buffer.seek(0)
+                        target_cursor.copy_expert(
+                            f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT binary)",
+                            buffer,
+                        )
+
+        copied = tenant_row_counts(tenant_id, target)
+        expected = tenant_row_counts(tenant_id, source)
+        if copied != expected:
+            raise ValueError(
+                f"Row counts differ: {source} {expected}, {target} {copied}"
+            )
+    return copied
+
+
+def purge_tenant(tenant_id, alias):
+    """Delete a tenant's rows from a database it no longer lives on."""
+    if tenant_database(tenant_id) == alias:
+        raise ValueError(f"Tenant {tenant_id} is still placed on {alias}")
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        _delete_tenant_rows(cursor, tenant_id)
@@ -1,8 +1,133 @@
-from rest_framework.exceptions import NotFound, ValidationError
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from rest_framework.exceptions import NotFound, Throttled, ValidationError
 
 from lessons.models import Lesson, User
+from lessons.prepared import PreparedStatement
+from lessons.routers import use_primary
+from lessons.timing import timed
+
+USER_NOT_FOUND = "Tenant, user, or relationship not found"
+LESSON_NOT_FOUND = "Lesson not found in this tenant"
+NOT_FOUND_WINDOW = 60  # seconds; VALIDATION_NOT_FOUND_PER_MINUTE's window
+
+
+def _lookup_statement(model):
+    columns = ", ".join(field.column for field in model._meta.concrete_fields)
+    return PreparedStatement(
+        f"lessons_validate_{model._meta.model_name}",
+        f"""
+        SELECT {columns}
+          FROM {model._meta.db_table}
+         WHERE {model._meta.pk.column} = %(pk)s AND tenant_id = %(tenant_id)s
+        """,
+    )
+
 
+_LOOKUPS = {model: _lookup_statement(model) for model in (User, Lesson)}
+
+
+def _get_in_tenant(model, pk, tenant_id):
+    """
+    model.objects.get(pk=pk, tenant_id=tenant_id), as a prepared statement
+    (lessons.prepared), or None.
+    """
+    using = router.db_for_read(model)
+    with connections[using].cursor() as cursor:
+        _LOOKUPS[model].execute(cursor, {"pk": pk, "tenant_id": tenant_id})
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    fields = [field.attname for field in model._meta.concrete_fields]
+    return model.from_db(using, fields, row)
+
+
+def not_found_cache_key(model, tenant_id, pk):
+    """Negative cache entry: `pk` was not found in the tenant."""
+    return f"missing-{model._meta.model_name}:{tenant_id}:{pk}"
+
+
+def not_found_count_key(tenant_id, now):
+    """The tenant's count of 404s in the budget window holding `now`."""
+    return f"not-found:{tenant_id}:{int(now // NOT_FOUND_WINDOW)}"
+
+
+def forget_not_found(model, pairs, using="default"):
+    """
+    Drop the negative cache entries of (tenant_id, pk) pairs once the
+    current transaction on `using` commits, e.g. after creating the rows.
+    """
+    keys = [not_found_cache_key(model, tenant_id, pk) for tenant_id, pk in pairs]
+    if keys:
+        transaction.on_commit(partial(cache.delete_many, keys), using=using)
 
+
+def _count_not_found(count_key):
+    cache.add(count_key, 0, 2 * NOT_FOUND_WINDOW)
+    try:
+        cache.incr(count_key)
+    except ValueError:
+        pass  # evicted between add and incr; the count restarts
+
+
+def _validate(tenant_id, lookups):
+    """
+    `_get_in_tenant` for each (model, pk, message), in order; the first
+    missing one raises NotFound(message).
+
+    Misses are remembered for VALIDATION_NOT_FOUND_TTL seconds, and the
+    negative entries (and the tenant's 404 count, when it has a budget) are
+    read in one cache call before any query, so a repeated miss costs no
+    queries. A miss on a replica is checked again on the primary before it
+    is remembered. Only 404s that took a query count against the budget;
+    once a tenant has spent it, such misses raise Throttled instead.
+    Lookups that find their rows are never throttled.
+    """
+    ttl = settings.VALIDATION_NOT_FOUND_TTL
+    budget = settings.VALIDATION_TENANT_NOT_FOUND_PER_MINUTE.get(
+        tenant_id, settings.VALIDATION_NOT_FOUND_PER_MINUTE
+    )
+    missing_keys = [
+        not_found_cache_key(model, tenant_id, pk) for model, pk, _ in lookups
+    ]
+    now = time.time()
+    count_key = not_found_count_key(tenant_id, now)
+    spent = 0
+    if ttl or budget:
+        cached = cache.get_many(missing_keys + ([count_key] if budget else []))
+        for key, (_model, _pk, message) in zip(missing_keys, lookups):
+            if key in cached:
+                raise NotFound(message)
+        spent = cached.get(count_key, 0)
+
+    found = []
+    for key, (model, pk, message) in zip(missing_keys, lookups):
+        row = _get_in_tenant(model, pk, tenant_id)
+        if row is None and router.db_for_read(model) != router.db_for_write(model):
+            # A lagging replica may not have the row yet: only a miss on the
+            # primary is remembered and counted.
+            with use_primary():
+                row = _get_in_tenant(model, pk, tenant_id)
+        if row is None:
+            if ttl:
+                cache.set(key, True, ttl)
+            if budget and spent >= budget:
+                raise Throttled(
+                    wait=NOT_FOUND_WINDOW - now % NOT_FOUND_WINDOW,
+                    detail="Too many requests for missing users or lessons",
+                )
+            if budget:
+                _count_not_found(count_key)
+            raise NotFound(message)
+        found.append(row)
+    return found
+
+
+@timed("validate")
 def validate_tenant_user_lesson(tenant_id, user_id, lesson_id):
     """
     Validate that tenant, user, and lesson exist and are properly related.
@@ -13,20 +138,28 @@ def validate_tenant_user_lesson(tenant_id, user_id, lesson_id):
     2 queries total:
       1. User by (pk, tenant_id) — proves both user and tenant exist
       2. Lesson by (pk, tenant_id) — proves lesson belongs to tenant
+    None for a user or lesson recently found missing: that raises NotFound
+    from the negative cache entry (`_validate`).
 
-    Raises DRF NotFound (handled by custom_exception_handler).
+    Raises DRF NotFound (handled by custom_exception_handler), or Throttled
+    instead for a miss in a tenant past its 404 budget.
     """
-    try:
-        user = User.objects.get(pk=user_id, tenant_id=tenant_id)
-    except User.DoesNotExist:
-        raise NotFound("Tenant, user, or relationship not found")
+    user, lesson = _validate(
+        tenant_id,
+        [(User, user_id, USER_NOT_FOUND), (Lesson, lesson_id, LESSON_NOT_FOUND)],
+    )
+    return user, lesson
 
-    try:
-        lesson = Lesson.objects.get(pk=lesson_id, tenant_id=tenant_id)
-    except Lesson.DoesNotExist:
-        raise NotFound("Lesson not found in this tenant")
 
-    return user, lesson
+@timed("validate")
+def validate_tenant_user(tenant_id, user_id):
+    """
+    Validate that the user exists in the tenant. 1 query, none for a user
+    recently found missing. Raises DRF NotFound, or Throttled for a miss
+    past the tenant's 404 budget.
+    """
+    (user,) = _validate(tenant_id, [(User, user_id, USER_NOT_FOUND)])
+    return user
 
 
 def validate_block_in_lesson(structure, lesson_id, block_id):
@@ -34,7 +167,7 @@ def validate_block_in_lesson(structure, lesson_id, block_id):
     Check that block_id belongs to the lesson using the cached structure.
     Zero queries — uses the already-fetched block list.
     """
-    if not any(b["block_id"] == block_id for b in structure):
+    if block_id not in structure.block_ids:
         raise ValidationError(
             {"block_id": f"Block {block_id} is not part of lesson {lesson_id}"}
         )
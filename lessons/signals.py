@@ -1,38 +1,44 @@
-from django.core.cache import cache
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from lessons.models import BlockVariant, LessonBlock
-
-
-def _invalidate_lesson_cache(lesson_id, tenant_id):
-    """Delete the cached structure for a specific lesson+tenant."""
-    cache.delete(f"lesson:{tenant_id}:{lesson_id}")
+from lessons.models import BlockVariant, Lesson, LessonBlock, User
+from lessons.services.invalidation import invalidate_lessons
+from lessons.services.resolution import (
+    rebuild_resolved_lessons,
+    refresh_resolved_block,
+)
+from lessons.services.validation import forget_not_found
 
 
 @receiver([post_save, post_delete], sender=LessonBlock)
 def invalidate_on_lesson_block_change(sender, instance, **kwargs):
-    """A block was added/removed/reordered in a lesson — invalidate that lesson's cache."""
-    _invalidate_lesson_cache(instance.lesson_id, instance.lesson.tenant_id)
+    """A block was added/removed/reordered — rebuild and invalidate that lesson."""
+    rebuild_resolved_lessons([instance.lesson_id], using=instance._state.db)
+    invalidate_lessons(
+        [(instance.lesson.tenant_id, instance.lesson_id)], using=instance._state.db
+    )
 
 
 @receiver([post_save, post_delete], sender=BlockVariant)
 def invalidate_on_variant_change(sender, instance, **kwargs):
     """
-    A variant changed — invalidate cache for every lesson containing this block.
-
-    A default variant (tenant_id=NULL) could affect any tenant, so we invalidate
-    all lessons containing the block. A tenant-specific variant only affects that
-    tenant's cache entries.
+    A variant changed — re-resolve and invalidate every lesson using this block.
+
+    A default variant (tenant_id=NULL) could affect any tenant, so every
+    resolved row for the block is re-evaluated. A tenant-specific variant only
+    affects the rows of that tenant and of the tenants inheriting from it
+    (lessons.services.tenant_chains). The refresh reports which (tenant, lesson)
+    pairs use the block, so no separate LessonBlock lookup is needed. Their
+    cache entries are evicted after the save commits, off the request thread.
     """
-    lesson_blocks = LessonBlock.objects.filter(
-        block_id=instance.block_id,
-    ).select_related("lesson")
-
-    for lb in lesson_blocks:
-        if instance.tenant_id is not None:
-            _invalidate_lesson_cache(lb.lesson_id, instance.tenant_id)
-        else:
-            # Default variant — invalidate for ALL tenants viewing this lesson.
-            # Since a lesson belongs to exactly one tenant, this is just one key.
-            _invalidate_lesson_cache(lb.lesson_id, lb.lesson.tenant_id)
+    affected = refresh_resolved_block(instance.block_id, instance.tenant_id)
+    invalidate_lessons(affected, using=instance._state.db)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Lesson)
+def forget_not_found_on_save(sender, instance, **kwargs):
+    """A user or lesson now exists in its tenant: drop its negative entry."""
+    forget_not_found(
+        sender, [(instance.tenant_id, instance.pk)], using=instance._state.db
+    )
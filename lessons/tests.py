@@ -6,19 +6,101 @@ Django's TestCase wraps each test in a transaction that rolls back, so seed
 data is never permanently altered.
 """
 
+import csv
+import gzip
+import io
+import json
+import os
+import pickle
+import pstats
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from lessons.models import UserBlockProgress
+from lessons.api.views import accepts_gzip
+from lessons.cache_backends.shared_memory import SharedMemoryCache
+from lessons.cache_backends.tinylfu import MAX_COUNT, FrequencySketch, TinyLFUCache
+from lessons.models import (
+    Block,
+    BlockVariant,
+    Lesson,
+    LessonBlock,
+    LessonProgressRollup,
+    LessonSnapshot,
+    ResolvedLessonBlock,
+    Tenant,
+    User,
+    UserBlockProgress,
+    UserLessonProgress,
+)
+from lessons.prepared import PreparedStatement
+from lessons.profiling import make_profile_token
+from lessons.routers import bind_read_alias, unbind_read_alias, use_tenant_database
 from lessons.services.assembly import (
+    LessonStructure,
+    acquire_fill_lease,
+    assemble_lesson,
+    body_cache_key,
+    build_lesson_response,
     compute_progress_summary,
     fetch_lesson_structure,
+    get_lesson_structure,
     get_progress_map,
+    lesson_cache_keys,
+    lesson_generation,
+    structure_cache_key,
+    tenant_generation_key,
+)
+from lessons.services.bulk_import import import_progress
+from lessons.services.content_ingest import ingest_content
+from lessons.services.export import iter_progress_rows
+from lessons.services.invalidation import (
+    InvalidationQueue,
+    flush_invalidations,
+    invalidate_lesson_ids,
+    invalidate_tenants,
+    lesson_invalidation_keys,
+)
+from lessons.services.lesson_body import build_lesson_body, encode_lesson_response
+from lessons.services.partitioning import (
+    PARTITIONED_TABLE,
+    copy_batch,
+    is_partitioned,
+    missing_rows,
+    prepare_partitioned_table,
+    swap_partitioned_table,
 )
 from lessons.services.progress import upsert_progress
+from lessons.services.tenant_databases import (
+    move_tenant,
+    provision_tenant_database,
+    purge_tenant,
+    tenant_row_counts,
+)
+from lessons.services.resolution import rebuild_resolved_lessons, tenant_subtree
+from lessons.services.rollups import rebuild_progress_rollups
+from lessons.services.tenant_chains import set_tenant_parent, tenant_chain
 from lessons.services.validation import (
+    LESSON_NOT_FOUND,
+    NOT_FOUND_WINDOW,
+    USER_NOT_FOUND,
+    not_found_cache_key,
     validate_block_in_lesson,
+    validate_tenant_user,
     validate_tenant_user_lesson,
 )
 
@@ -40,6 +122,16 @@ class BaseTestCase(TestCase):
     def setUp(self):
         cache.clear()
 
+    @contextmanager
+    def committed(self):
+        """
+        Run the on_commit callbacks queued in the block, as if its writes
+        committed, and wait for the cache evictions they hand off.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        flush_invalidations()
+
 
 class GetLessonTests(BaseTestCase):
     def setUp(self):
@@ -129,6 +221,22 @@ class GetLessonTests(BaseTestCase):
         self.assertIsNone(summary["last_seen_block_id"])
         self.assertFalse(summary["completed"])
 
+    def test_get_lesson_gzip(self):
+        url = self._url(ACME_TENANT, ALICE, ACME_LESSON)
+        plain = self.client.get(url)
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="br;q=1.0, gzip;q=0.8")
+
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(resp.content)), plain.json())
+
+    def test_get_lesson_gzip_refused(self):
+        resp = self.client.get(
+            self._url(ACME_TENANT, ALICE, ACME_LESSON),
+            HTTP_ACCEPT_ENCODING="gzip;q=0, identity",
+        )
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(resp.json()["lesson"]["id"], ACME_LESSON)
 
     def test_user_not_in_tenant_returns_404(self):
         """Charlie (tenant 2) accessing tenant 1 → 404."""
@@ -322,6 +430,137 @@ class PutProgressTests(BaseTestCase):
         self.assertIn("message", data["error"])
 
 
+class ProgressSyncTests(BaseTestCase):
+    """GET progress deltas for clients that already hold the content."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.hour_ago = timezone.now() - timedelta(hours=1)
+        UserBlockProgress.objects.filter(user_id=ALICE).update(updated_at=self.hour_ago)
+
+    def _lesson_url(self, user_id=ALICE, lesson_id=ACME_LESSON):
+        return f"/tenants/{ACME_TENANT}/users/{user_id}/lessons/{lesson_id}/progress"
+
+    def _user_url(self, user_id=ALICE):
+        return f"/tenants/{ACME_TENANT}/users/{user_id}/progress"
+
+    def test_lesson_progress_without_since(self):
+        data = self.client.get(self._lesson_url()).json()
+
+        self.assertEqual(
+            [(row["block_id"], row["status"]) for row in data["progress"]],
+            [(200, "completed"), (201, "seen")],
+        )
+        self.assertEqual(data["progress_summary"]["seen_blocks"], 2)
+        self.assertEqual(data["progress_summary"]["last_seen_block_id"], 201)
+        self.assertEqual(
+            datetime.fromisoformat(data["cursor"].replace("Z", "+00:00")),
+            self.hour_ago,
+        )
+
+    def test_lesson_progress_since_returns_changed_rows_only(self):
+        since = timezone.now() - timedelta(minutes=10)
+        params = {"since": since.isoformat()}
+        data = self.client.get(self._lesson_url(), params).json()
+        self.assertEqual(data["progress"], [])
+        self.assertEqual(data["progress_summary"]["seen_blocks"], 2)
+
+        upsert_progress(ALICE, ACME_LESSON, 202, "seen")
+        data = self.client.get(self._lesson_url(), params).json()
+        self.assertEqual([row["block_id"] for row in data["progress"]], [202])
+        self.assertEqual(data["progress_summary"]["seen_blocks"], 3)
+
+    def test_rows_just_before_since_are_repeated(self):
+        """Writes committed after a cursor was issued may carry older stamps."""
+        since = self.hour_ago + timedelta(seconds=2)
+        data = self.client.get(self._lesson_url(), {"since": since.isoformat()})
+        self.assertEqual(len(data.json()["progress"]), 2)
+
+    def test_lesson_progress_is_one_query_after_validation(self):
+        self.client.get(self._lesson_url())  # warm the structure cache
+        with self.assertNumQueries(3):  # validate (2) + progress (1)
+            self.client.get(self._lesson_url())
+
+    def test_user_progress_lists_changed_lessons(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO lessons (id, tenant_id, slug, title) "
+                "VALUES (101, %s, 'second', 'Second')",
+                [ACME_TENANT],
+            )
+            cursor.execute(
+                "INSERT INTO lesson_blocks (lesson_id, block_id, position) "
+                "VALUES (101, 200, 1), (101, 201, 2)"
+            )
+        rebuild_resolved_lessons([101])
+        upsert_progress(ALICE, 101, 201, "completed")
+
+        data = self.client.get(self._user_url()).json()
+        self.assertEqual(
+            [lesson["lesson_id"] for lesson in data["lessons"]], [100, 101]
+        )
+
+        since = timezone.now() - timedelta(minutes=10)
+        data = self.client.get(self._user_url(), {"since": since.isoformat()}).json()
+        [lesson] = data["lessons"]
+        self.assertEqual(lesson["lesson_id"], 101)
+        self.assertEqual(lesson["progress"][0]["status"], "completed")
+        self.assertEqual(lesson["progress_summary"]["completed_blocks"], 1)
+        self.assertEqual(lesson["progress_summary"]["total_blocks"], 2)
+
+    def test_user_progress_summaries_take_one_query(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO lessons (id, tenant_id, slug, title) "
+                "VALUES (101, %s, 'second', 'Second')",
+                [ACME_TENANT],
+            )
+            cursor.execute(
+                "INSERT INTO lesson_blocks (lesson_id, block_id, position) "
+                "VALUES (101, 201, 1), (101, 200, 2)"
+            )
+        rebuild_resolved_lessons([101])
+        upsert_progress(ALICE, 101, 200, "completed")
+        upsert_progress(ALICE, 101, 201, "completed")
+        # A block since removed from the lesson doesn't count.
+        upsert_progress(ALICE, 101, 202, "seen")
+        cache.clear()
+
+        with self.assertNumQueries(2):  # validate (1) + progress (1)
+            data = self.client.get(self._user_url()).json()
+        summaries = {
+            lesson["lesson_id"]: lesson["progress_summary"]
+            for lesson in data["lessons"]
+        }
+        for lesson_id in (ACME_LESSON, 101):
+            lesson = self.client.get(self._lesson_url(lesson_id=lesson_id)).json()
+            self.assertEqual(summaries[lesson_id], lesson["progress_summary"])
+        self.assertEqual(
+            summaries[101],
+            {
+                "total_blocks": 2,
+                "seen_blocks": 2,
+                "completed_blocks": 2,
+                "last_seen_block_id": 200,
+                "completed": True,
+            },
+        )
+
+    def test_user_progress_without_changes(self):
+        since = timezone.now()
+        data = self.client.get(self._user_url(), {"since": since.isoformat()}).json()
+        self.assertEqual(data["lessons"], [])
+        self.assertIsNotNone(data["cursor"])
+
+    def test_user_in_other_tenant_returns_404(self):
+        self.assertEqual(self.client.get(self._user_url(CHARLIE)).status_code, 404)
+
+    def test_invalid_since_returns_400(self):
+        resp = self.client.get(self._lesson_url(), {"since": "yesterday"})
+        self.assertEqual(resp.status_code, 400)
+
+
 class ValidationServiceTests(BaseTestCase):
     def test_valid_tenant_user_lesson(self):
         user, lesson = validate_tenant_user_lesson(ACME_TENANT, ALICE, ACME_LESSON)
@@ -359,32 +598,155 @@ class ValidationServiceTests(BaseTestCase):
             validate_block_in_lesson(structure, ACME_LESSON, 999)
 
 
+class NotFoundCacheTests(BaseTestCase):
+    """Missing users and lessons are remembered, and budgeted per tenant."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _url(self, user_id, lesson_id, tenant_id=ACME_TENANT):
+        return f"/tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}"
+
+    def test_repeated_miss_costs_no_queries(self):
+        with self.assertNumQueries(1), self.assertRaises(NotFound):
+            validate_tenant_user_lesson(ACME_TENANT, 999, ACME_LESSON)
+        with self.assertNumQueries(0), self.assertRaises(NotFound) as raised:
+            validate_tenant_user_lesson(ACME_TENANT, 999, ACME_LESSON)
+        self.assertEqual(str(raised.exception.detail), USER_NOT_FOUND)
+
+        with self.assertNumQueries(2), self.assertRaises(NotFound):
+            validate_tenant_user_lesson(ACME_TENANT, ALICE, 999)
+        with self.assertNumQueries(0), self.assertRaises(NotFound) as raised:
+            validate_tenant_user_lesson(ACME_TENANT, ALICE, 999)
+        self.assertEqual(str(raised.exception.detail), LESSON_NOT_FOUND)
+
+    def test_entries_are_per_tenant(self):
+        self.client.get(self._url(ALICE, GLOBEX_LESSON))
+        self.assertIsNotNone(cache.get(not_found_cache_key(Lesson, ACME_TENANT, 200)))
+        resp = self.client.get(self._url(CHARLIE, GLOBEX_LESSON, GLOBEX_TENANT))
+        self.assertEqual(resp.status_code, 200)
+
+    @override_settings(VALIDATION_NOT_FOUND_TTL=0)
+    def test_ttl_zero_turns_it_off(self):
+        for _ in range(2):
+            with self.assertNumQueries(1), self.assertRaises(NotFound):
+                validate_tenant_user(ACME_TENANT, 999)
+
+    def test_creating_the_user_forgets_the_miss(self):
+        self.assertEqual(self.client.get(self._url(12, ACME_LESSON)).status_code, 404)
+        with self.committed():
+            User.objects.create(
+                id=12,
+                tenant_id=ACME_TENANT,
+                email="dana@acme.example",
+                created_at=timezone.now(),
+            )
+        self.assertEqual(self.client.get(self._url(12, ACME_LESSON)).status_code, 200)
+
+    def test_creating_the_lesson_forgets_the_miss(self):
+        self.assertEqual(self.client.get(self._url(ALICE, 101)).status_code, 404)
+        with self.committed():
+            Lesson.objects.create(
+                id=101,
+                tenant_id=ACME_TENANT,
+                slug="more-ai",
+                title="More AI",
+                created_at=timezone.now(),
+            )
+        self.assertEqual(self.client.get(self._url(ALICE, 101)).status_code, 200)
+
+    def test_ingested_lesson_forgets_the_miss(self):
+        self.assertEqual(self.client.get(self._url(ALICE, 101)).status_code, 404)
+        line = {
+            "id": 101,
+            "tenant_id": ACME_TENANT,
+            "slug": "more-ai",
+            "title": "More AI",
+            "blocks": [{"id": 200, "type": "markdown"}],
+        }
+        with self.committed():
+            ingest_content(io.StringIO(json.dumps(line) + "\n"))
+        self.assertEqual(self.client.get(self._url(ALICE, 101)).status_code, 200)
+
+    @override_settings(
+        VALIDATION_NOT_FOUND_PER_MINUTE=3,
+        VALIDATION_TENANT_NOT_FOUND_PER_MINUTE={GLOBEX_TENANT: None},
+    )
+    def test_misses_past_the_budget_are_throttled(self):
+        for user_id in range(1000, 1003):
+            resp = self.client.get(self._url(user_id, ACME_LESSON))
+            self.assertEqual(resp.status_code, 404)
+        # Known misses are still answered from the cache.
+        with self.assertNumQueries(0):
+            resp = self.client.get(self._url(1000, ACME_LESSON))
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(self._url(1003, ACME_LESSON))
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.json()["error"]["code"], "throttled")
+        self.assertIn("Retry-After", resp)
+        resp = self.client.get(self._url(ALICE, 999))
+        self.assertEqual(resp.status_code, 429)
+
+        # Other tenants keep their own budgets.
+        for user_id in range(1000, 1005):
+            resp = self.client.get(self._url(user_id, GLOBEX_LESSON, GLOBEX_TENANT))
+            self.assertEqual(resp.status_code, 404)
+
+    @override_settings(VALIDATION_NOT_FOUND_PER_MINUTE=1)
+    def test_valid_lookups_are_never_throttled(self):
+        self.assertEqual(self.client.get(self._url(999, ACME_LESSON)).status_code, 404)
+        self.assertEqual(self.client.get(self._url(998, ACME_LESSON)).status_code, 429)
+        self.assertEqual(
+            self.client.get(self._url(ALICE, ACME_LESSON)).status_code, 200
+        )
+        self.assertEqual(validate_tenant_user(ACME_TENANT, ALICE).id, ALICE)
+
+    @override_settings(VALIDATION_NOT_FOUND_PER_MINUTE=1)
+    def test_budget_resets_with_the_window(self):
+        self.client.get(self._url(999, ACME_LESSON))
+        self.assertEqual(self.client.get(self._url(998, ACME_LESSON)).status_code, 429)
+        later = time.time() + NOT_FOUND_WINDOW
+        with mock.patch("lessons.services.validation.time.time", return_value=later):
+            resp = self.client.get(self._url(997, ACME_LESSON))
+        self.assertEqual(resp.status_code, 404)
+
+
 class AssemblyServiceTests(BaseTestCase):
     def test_fetch_lesson_structure_block_order(self):
         """Acme lesson blocks ordered by position: 200, 201, 202."""
         structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
         self.assertEqual(len(structure), 3)
-        self.assertEqual([s["block_id"] for s in structure], [200, 201, 202])
-        self.assertEqual([s["position"] for s in structure], [1, 2, 3])
+        self.assertEqual(list(structure.block_ids), [200, 201, 202])
+        self.assertEqual(list(structure.positions), [1, 2, 3])
 
     def test_fetch_lesson_structure_globex_order(self):
         """Globex lesson blocks: 200, 202, 201 (different order)."""
         structure = fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT)
-        self.assertEqual([s["block_id"] for s in structure], [200, 202, 201])
+        self.assertEqual(list(structure.block_ids), [200, 202, 201])
 
     def test_variant_selection_tenant_override(self):
         """Acme has override for block 200 → variant 1100."""
         structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
-        block_200 = structure[0]
-        self.assertEqual(block_200["variant_id"], 1100)
-        self.assertEqual(block_200["variant_tenant_id"], ACME_TENANT)
+        self.assertEqual(structure.variant_ids[0], 1100)
+        self.assertEqual(structure.variant_tenant_ids[0], ACME_TENANT)
 
     def test_variant_selection_falls_back_to_default(self):
         """Acme has no override for block 201 → default variant 1001."""
         structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
-        block_201 = structure[1]
-        self.assertEqual(block_201["variant_id"], 1001)
-        self.assertIsNone(block_201["variant_tenant_id"])
+        self.assertEqual(structure.variant_ids[1], 1001)
+        self.assertIsNone(structure.variant_tenant_ids[1])
+
+    def test_structure_survives_pickling(self):
+        """The cache stores structures pickled."""
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        restored = pickle.loads(pickle.dumps(structure, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(restored, structure)
+        self.assertEqual(
+            restored.variant_data[1],
+            {"question": "In one sentence, what is a neural network?"},
+        )
 
     def test_get_progress_map(self):
         """Alice has progress on blocks 200 and 201 in Acme lesson."""
@@ -439,6 +801,58 @@ class AssemblyServiceTests(BaseTestCase):
         self.assertEqual(summary["last_seen_block_id"], 202)
 
 
+class LessonBodyTests(BaseTestCase):
+    """Spliced response bodies match what DRF renders for the same data."""
+
+    def _check(self, lesson, structure, progress_map):
+        body = build_lesson_body(structure)
+        summary = compute_progress_summary(structure, progress_map)
+        expected = build_lesson_response(lesson, structure, progress_map)
+
+        self.assertEqual(
+            encode_lesson_response(lesson, body, progress_map, summary),
+            JSONRenderer().render(expected),
+        )
+        compressed = encode_lesson_response(
+            lesson, body, progress_map, summary, gzip=True
+        )
+        self.assertEqual(json.loads(gzip.decompress(compressed)), expected)
+
+    def test_every_progress_value(self):
+        lesson = Lesson.objects.get(pk=ACME_LESSON)
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self._check(lesson, structure, {200: "completed", 201: "seen"})
+
+    def test_lesson_without_blocks(self):
+        lesson = Lesson.objects.get(pk=ACME_LESSON)
+        self._check(lesson, LessonStructure(), {})
+
+    def test_head_longer_than_a_stored_block(self):
+        lesson = Lesson.objects.get(pk=ACME_LESSON)
+        lesson.title = "Ünïcode title " * 10000  # > 65535 bytes of head
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self._check(lesson, structure, {200: "completed"})
+
+    def test_long_lesson_with_repeated_content(self):
+        """Back-references span many slots and the 32 KB window."""
+        lesson = Lesson.objects.get(pk=ACME_LESSON)
+        text = "Neural networks learn weights from examples. " * 20
+        structure = LessonStructure.from_rows(
+            (n, "markdown", n, n, None, {"markdown": text if n % 2 else f"{n}"})
+            for n in range(1, 301)
+        )
+        progress_map = {n: ("seen", "completed")[n % 2] for n in range(1, 301, 3)}
+        self._check(lesson, structure, progress_map)
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(accepts_gzip("GZIP;q=0.5"))
+        self.assertTrue(accepts_gzip("*"))
+        self.assertFalse(accepts_gzip(""))
+        self.assertFalse(accepts_gzip("br, identity"))
+        self.assertFalse(accepts_gzip("gzip;q=0, *"))
+
+
 class ProgressUpsertServiceTests(BaseTestCase):
     def test_insert_new_progress(self):
         """Bob has no progress — insert 'seen' for block 200."""
@@ -472,3 +886,2815 @@ class ProgressUpsertServiceTests(BaseTestCase):
     def test_idempotent_seen_on_seen(self):
         result = upsert_progress(ALICE, ACME_LESSON, 201, "seen")
         self.assertEqual(result, "seen")
+
+
+class PreparedStatementTests(BaseTestCase):
+    """Hot-path queries run as statements prepared once per connection."""
+
+    statement = PreparedStatement(
+        "lessons_test_user_email",
+        "SELECT email FROM users WHERE id = %(id)s AND tenant_id = %(tenant_id)s",
+    )
+
+    def _hot_path_queries(self):
+        client = APIClient()
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        client.get(url)  # cache the structure
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+            client.put(
+                url + "/progress",
+                {"block_id": 201, "status": "completed"},
+                format="json",
+            )
+        return [
+            query["sql"]
+            for query in queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+
+    def test_parameters_become_positional(self):
+        statement = PreparedStatement("s", "SELECT %(a)s, %(b)s, %(a)s")
+        self.assertEqual(statement.prepare_sql, "PREPARE s AS SELECT $1, $2, $1")
+        self.assertEqual(statement.execute_sql, "EXECUTE s (%(a)s, %(b)s)")
+
+    def test_hot_path_executes_prepared_statements(self):
+        statements = [sql.split(" (")[0] for sql in self._hot_path_queries()]
+        self.assertEqual(
+            statements,
+            [
+                # GET: validation, progress
+                "EXECUTE lessons_validate_user",
+                "EXECUTE lessons_validate_lesson",
+                "EXECUTE lessons_progress_map",
+                # PUT: validation, upsert with its rollup, progress
+                "EXECUTE lessons_validate_user",
+                "EXECUTE lessons_validate_lesson",
+                "EXECUTE lessons_lock_progress",
+                "EXECUTE lessons_update_progress",
+                "EXECUTE lessons_record_transition",
+                "EXECUTE lessons_progress_map",
+            ],
+        )
+
+    @override_settings(DATABASE_PREPARED_STATEMENTS=False)
+    def test_can_run_unprepared(self):
+        queries = self._hot_path_queries()
+        self.assertEqual(len(queries), 9)
+        self.assertFalse(any(sql.startswith("EXECUTE") for sql in queries))
+        self.assertEqual(
+            upsert_progress(BOB, ACME_LESSON, 200, "completed"), "completed"
+        )
+
+    def test_lookups_match_the_orm(self):
+        user, lesson = validate_tenant_user_lesson(ACME_TENANT, ALICE, ACME_LESSON)
+        orm_user = User.objects.get(pk=ALICE)
+        orm_lesson = Lesson.objects.get(pk=ACME_LESSON)
+        for field in User._meta.concrete_fields:
+            self.assertEqual(
+                getattr(user, field.attname), getattr(orm_user, field.attname)
+            )
+        for field in Lesson._meta.concrete_fields:
+            self.assertEqual(
+                getattr(lesson, field.attname), getattr(orm_lesson, field.attname)
+            )
+        self.assertEqual(user._state.db, "default")
+        self.assertFalse(user._state.adding)
+
+    def test_new_connection_prepares_again(self):
+        other = connections.create_connection("default")
+        self.addCleanup(other.close)
+        params = {"id": ALICE, "tenant_id": ACME_TENANT}
+        for _ in range(2):
+            with other.cursor() as cursor:
+                self.statement.execute(cursor, params)
+                self.assertEqual(cursor.fetchone(), ("alice@acme.example",))
+            other.close()
+
+    def test_reset_session_prepares_again_transparently(self):
+        other = connections.create_connection("default")
+        self.addCleanup(other.close)
+        params = {"id": ALICE, "tenant_id": ACME_TENANT}
+        with other.cursor() as cursor:
+            self.statement.execute(cursor, params)
+            cursor.execute("DISCARD ALL")
+            self.statement.execute(cursor, params)
+            self.assertEqual(cursor.fetchone(), ("alice@acme.example",))
+
+    def test_reset_session_in_a_transaction_raises_then_prepares_again(self):
+        other = connections.create_connection("default")
+        self.addCleanup(other.close)
+        params = {"id": ALICE, "tenant_id": ACME_TENANT}
+        with other.cursor() as cursor:
+            self.statement.execute(cursor, params)
+            cursor.execute("DEALLOCATE ALL")
+            cursor.execute("BEGIN")
+            # The failed EXECUTE aborted the transaction: no retry in it.
+            with self.assertRaises(DatabaseError):
+                self.statement.execute(cursor, params)
+            cursor.execute("ROLLBACK")
+            self.statement.execute(cursor, params)
+            self.assertEqual(cursor.fetchone(), ("alice@acme.example",))
+
+
+def _server_timing_phases(response):
+    """Parse a Server-Timing header into {name: duration_ms}."""
+    phases = {}
+    for entry in response["Server-Timing"].split(","):
+        name, dur = entry.strip().split(";dur=")
+        phases[name] = float(dur)
+    return phases
+
+
+@override_settings(SERVER_TIMING_ENABLED=True)
+class ServerTimingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _url(self, tenant_id, user_id, lesson_id):
+        return f"/tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}"
+
+    def test_get_lesson_reports_phases(self):
+        resp = self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.assertEqual(resp.status_code, 200)
+        phases = _server_timing_phases(resp)
+        for name in ("validate", "structure", "progress", "summary", "render", "total"):
+            self.assertIn(name, phases)
+        self.assertNotIn("upsert", phases)
+
+    def test_put_progress_reports_upsert_phase(self):
+        resp = self.client.put(
+            self._url(ACME_TENANT, BOB, ACME_LESSON) + "/progress",
+            {"block_id": 200, "status": "seen"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        phases = _server_timing_phases(resp)
+        for name in ("validate", "structure", "upsert", "progress", "summary"):
+            self.assertIn(name, phases)
+
+    def test_not_found_reports_validate_phase(self):
+        resp = self.client.get(self._url(ACME_TENANT, 999, ACME_LESSON))
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn("validate", _server_timing_phases(resp))
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_header_absent_when_disabled(self):
+        client = APIClient()
+        resp = client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("Server-Timing", resp)
+
+
+class ProfilingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+
+    def _url(self, tenant_id, user_id, lesson_id):
+        return f"/tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}"
+
+    def _profiles(self):
+        return sorted(os.listdir(self.profile_dir.name))
+
+    def _settings(self, **overrides):
+        values = {
+            "PROFILING_SECRET": "test-secret",
+            "PROFILING_TENANT_SAMPLE_RATES": {},
+            "PROFILING_DIR": self.profile_dir.name,
+        }
+        values.update(overrides)
+        return override_settings(**values)
+
+    def test_sampled_tenant_writes_readable_profile(self):
+        with self._settings(PROFILING_TENANT_SAMPLE_RATES={ACME_TENANT: 1.0}):
+            resp = APIClient().get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.assertEqual(resp.status_code, 200)
+
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 1)
+        stats = pstats.Stats(os.path.join(self.profile_dir.name, profiles[0]))
+        functions = {name for _file, _line, name in stats.stats}
+        self.assertIn("render_lesson", functions)
+
+    def test_unsampled_tenant_is_not_profiled(self):
+        with self._settings(PROFILING_TENANT_SAMPLE_RATES={ACME_TENANT: 1.0}):
+            APIClient().get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON))
+        self.assertEqual(self._profiles(), [])
+
+    def test_signed_header_profiles_put(self):
+        with self._settings():
+            client = APIClient(HTTP_X_PROFILE_TOKEN=make_profile_token(ACME_TENANT))
+            resp = client.put(
+                self._url(ACME_TENANT, BOB, ACME_LESSON) + "/progress",
+                {"block_id": 200, "status": "seen"},
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 200)
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 1)
+        stats = pstats.Stats(os.path.join(self.profile_dir.name, profiles[0]))
+        functions = {name for _file, _line, name in stats.stats}
+        self.assertIn("upsert_progress", functions)
+
+    def test_token_for_other_tenant_is_rejected(self):
+        with self._settings():
+            client = APIClient(HTTP_X_PROFILE_TOKEN=make_profile_token(GLOBEX_TENANT))
+            client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.assertEqual(self._profiles(), [])
+
+    def test_tampered_token_is_rejected(self):
+        with self._settings():
+            token = make_profile_token(ACME_TENANT) + "x"
+            APIClient(HTTP_X_PROFILE_TOKEN=token).get(
+                self._url(ACME_TENANT, ALICE, ACME_LESSON)
+            )
+        self.assertEqual(self._profiles(), [])
+
+    def test_profile_directory_is_capped(self):
+        with self._settings(
+            PROFILING_TENANT_SAMPLE_RATES={ACME_TENANT: 1.0}, PROFILING_MAX_BYTES=1
+        ):
+            client = APIClient()
+            client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+            client.get(self._url(ACME_TENANT, BOB, ACME_LESSON))
+        # Over budget: only the newest dump survives.
+        self.assertEqual(len(self._profiles()), 1)
+
+
+class ResolvedLessonBlockTests(BaseTestCase):
+    """Signals keep resolved_lesson_blocks in step with content edits."""
+
+    def _resolved_variants(self, tenant_id, lesson_id):
+        return list(
+            ResolvedLessonBlock.objects.filter(tenant_id=tenant_id, lesson_id=lesson_id)
+            .order_by("position")
+            .values_list("block_id", "variant_id")
+        )
+
+    def _create_variant(self, variant_id, block_id, tenant_id):
+        now = timezone.now()
+        return BlockVariant.objects.create(
+            id=variant_id,
+            block_id=block_id,
+            tenant_id=tenant_id,
+            data={"markdown": f"variant {variant_id}"},
+            created_at=now,
+            updated_at=now,
+        )
+
+    def test_seed_rows_match_variant_selection(self):
+        self.assertEqual(
+            self._resolved_variants(ACME_TENANT, ACME_LESSON),
+            [(200, 1100), (201, 1001), (202, 1002)],
+        )
+        self.assertEqual(
+            self._resolved_variants(GLOBEX_TENANT, GLOBEX_LESSON),
+            [(200, 1000), (202, 1200), (201, 1001)],
+        )
+
+    def test_structure_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+
+    def test_new_override_is_resolved_for_its_tenant_only(self):
+        self._create_variant(5000, 201, ACME_TENANT)
+
+        self.assertIn((201, 5000), self._resolved_variants(ACME_TENANT, ACME_LESSON))
+        self.assertIn(
+            (201, 1001), self._resolved_variants(GLOBEX_TENANT, GLOBEX_LESSON)
+        )
+
+    def test_deleting_override_falls_back_to_default(self):
+        BlockVariant.objects.get(pk=1100).delete()
+
+        self.assertEqual(
+            self._resolved_variants(ACME_TENANT, ACME_LESSON)[0], (200, 1000)
+        )
+
+    def test_variant_change_invalidates_cached_structure(self):
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        client = APIClient()
+        client.get(url)  # warm the cache
+
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": "Edited"}
+        with self.committed():
+            variant.save()
+
+        blocks = client.get(url).json()["blocks"]
+        self.assertEqual(blocks[1]["variant"]["data"], {"question": "Edited"})
+
+    def test_new_lesson_block_is_resolved(self):
+        now = timezone.now()
+        Block.objects.create(id=5000, block_type="markdown", created_at=now)
+        self._create_variant(5001, 5000, None)
+        LessonBlock.objects.create(lesson_id=ACME_LESSON, block_id=5000, position=4)
+
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self.assertEqual(list(structure.block_ids), [200, 201, 202, 5000])
+        self.assertEqual(structure.variant_ids[3], 5001)
+
+    def test_rebuild_restores_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM resolved_lesson_blocks WHERE lesson_id = %s", [ACME_LESSON]
+            )
+        rebuild_resolved_lessons([ACME_LESSON])
+        self.assertEqual(
+            self._resolved_variants(ACME_TENANT, ACME_LESSON),
+            [(200, 1100), (201, 1001), (202, 1002)],
+        )
+
+
+class TenantChainTests(BaseTestCase):
+    """
+    Acme -> Globex -> Initech: Globex inherits Acme's overrides and Initech
+    both. Initech's lesson uses blocks 200, 201 and 202.
+    """
+
+    INITECH_TENANT = 3
+    INITECH_LESSON = 300
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        Tenant.objects.create(id=self.INITECH_TENANT, name="Initech")
+        Lesson.objects.create(
+            id=self.INITECH_LESSON,
+            tenant_id=self.INITECH_TENANT,
+            slug="ai-basics",
+            title="AI Basics (Initech)",
+            created_at=now,
+        )
+        for position, block_id in enumerate([200, 201, 202], start=1):
+            LessonBlock.objects.create(
+                lesson_id=self.INITECH_LESSON, block_id=block_id, position=position
+            )
+        set_tenant_parent(GLOBEX_TENANT, ACME_TENANT)
+        set_tenant_parent(self.INITECH_TENANT, GLOBEX_TENANT)
+
+    def _variants(self, tenant_id, lesson_id):
+        return list(fetch_lesson_structure(lesson_id, tenant_id).variant_ids)
+
+    def _create_variant(self, variant_id, block_id, tenant_id):
+        now = timezone.now()
+        return BlockVariant.objects.create(
+            id=variant_id,
+            block_id=block_id,
+            tenant_id=tenant_id,
+            data={"markdown": f"variant {variant_id}"},
+            created_at=now,
+            updated_at=now,
+        )
+
+    def test_chains_are_precomputed(self):
+        self.assertEqual(
+            tenant_chain(self.INITECH_TENANT), [GLOBEX_TENANT, ACME_TENANT]
+        )
+        self.assertEqual(tenant_chain(GLOBEX_TENANT), [ACME_TENANT])
+        self.assertEqual(tenant_chain(ACME_TENANT), [])
+        self.assertEqual(
+            tenant_subtree(ACME_TENANT),
+            [ACME_TENANT, GLOBEX_TENANT, self.INITECH_TENANT],
+        )
+
+    def test_nearest_variant_in_the_chain_wins(self):
+        # 200: Acme's override; 201: the default; 202: Globex's override.
+        self.assertEqual(
+            self._variants(self.INITECH_TENANT, self.INITECH_LESSON),
+            [1100, 1001, 1200],
+        )
+        self.assertEqual(
+            self._variants(GLOBEX_TENANT, GLOBEX_LESSON), [1100, 1200, 1001]
+        )
+        self._create_variant(5000, 200, self.INITECH_TENANT)
+        self.assertEqual(
+            self._variants(self.INITECH_TENANT, self.INITECH_LESSON)[0], 5000
+        )
+        self.assertEqual(self._variants(GLOBEX_TENANT, GLOBEX_LESSON)[0], 1100)
+
+    def test_structure_is_still_a_single_query(self):
+        with self.assertNumQueries(1):
+            fetch_lesson_structure(self.INITECH_LESSON, self.INITECH_TENANT)
+
+    def test_ancestor_override_reaches_every_descendant(self):
+        get_lesson_structure(self.INITECH_LESSON, self.INITECH_TENANT)
+        get_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT)
+        version = fetch_lesson_structure(
+            self.INITECH_LESSON, self.INITECH_TENANT
+        ).version
+
+        with self.committed():
+            self._create_variant(5000, 201, ACME_TENANT)
+
+        for tenant_id, lesson_id in [
+            (ACME_TENANT, ACME_LESSON),
+            (GLOBEX_TENANT, GLOBEX_LESSON),
+            (self.INITECH_TENANT, self.INITECH_LESSON),
+        ]:
+            structure = get_lesson_structure(lesson_id, tenant_id)
+            self.assertIn(5000, structure.variant_ids)
+        self.assertGreater(
+            fetch_lesson_structure(self.INITECH_LESSON, self.INITECH_TENANT).version,
+            version,
+        )
+
+    def test_override_below_does_not_reach_ancestors(self):
+        self._create_variant(5000, 201, GLOBEX_TENANT)
+        self.assertEqual(self._variants(ACME_TENANT, ACME_LESSON)[1], 1001)
+        self.assertEqual(
+            self._variants(self.INITECH_TENANT, self.INITECH_LESSON)[1], 5000
+        )
+
+    def test_deleting_ancestor_override_falls_back_along_the_chain(self):
+        with self.committed():
+            BlockVariant.objects.get(pk=1100).delete()
+        self.assertEqual(
+            get_lesson_structure(self.INITECH_LESSON, self.INITECH_TENANT).variant_ids[
+                0
+            ],
+            1000,
+        )
+
+    def test_reparenting_re_resolves_and_invalidates_the_subtree(self):
+        get_lesson_structure(self.INITECH_LESSON, self.INITECH_TENANT)
+
+        with self.committed():
+            lessons = set_tenant_parent(GLOBEX_TENANT, None)
+
+        self.assertEqual(lessons, 2)
+        self.assertEqual(tenant_chain(self.INITECH_TENANT), [GLOBEX_TENANT])
+        self.assertEqual(
+            list(
+                get_lesson_structure(
+                    self.INITECH_LESSON, self.INITECH_TENANT
+                ).variant_ids
+            ),
+            [1000, 1001, 1200],
+        )
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            set_tenant_parent(ACME_TENANT, self.INITECH_TENANT)
+        with self.assertRaises(ValueError):
+            set_tenant_parent(ACME_TENANT, ACME_TENANT)
+        with self.assertRaises(ValueError):
+            set_tenant_parent(ACME_TENANT, 999)
+        self.assertIsNone(Tenant.objects.get(pk=ACME_TENANT).parent_id)
+
+    def test_command(self):
+        out = io.StringIO()
+        with self.committed():
+            call_command(
+                "set_tenant_parent", str(self.INITECH_TENANT), "--root", stdout=out
+            )
+        self.assertIn(
+            "Tenant chain: 3 -> defaults. Re-resolved 1 lessons", out.getvalue()
+        )
+        self.assertEqual(
+            self._variants(self.INITECH_TENANT, self.INITECH_LESSON), [1000, 1001, 1002]
+        )
+        with self.assertRaises(CommandError):
+            call_command("set_tenant_parent", str(self.INITECH_TENANT))
+        with self.assertRaises(CommandError):
+            call_command("set_tenant_parent", str(ACME_TENANT), str(GLOBEX_TENANT))
+
+
+class ContentVersionTests(BaseTestCase):
+    """Content versions move on every content change and gate variant data."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+
+    def _version(self):
+        return self.client.get(self.url).json()["lesson"]["content_version"]
+
+    def test_seeded_lessons_start_at_version_1(self):
+        self.assertEqual(self._version(), 1)
+        self.assertEqual(
+            fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT).version, 1
+        )
+
+    def test_current_version_omits_variant_data(self):
+        resp = self.client.get(self.url, {"content_version": 1})
+        data = resp.json()
+
+        self.assertTrue(all("data" not in b["variant"] for b in data["blocks"]))
+        self.assertEqual(
+            data["blocks"][0]["variant"], {"id": 1100, "tenant_id": ACME_TENANT}
+        )
+        self.assertEqual(
+            [b["user_progress"] for b in data["blocks"]], ["completed", "seen", None]
+        )
+        self.assertEqual(data["progress_summary"]["seen_blocks"], 2)
+
+        compressed = self.client.get(
+            self.url, {"content_version": 1}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), data)
+
+    def test_stale_version_gets_variant_data(self):
+        blocks = self.client.get(self.url, {"content_version": 0}).json()["blocks"]
+        self.assertIn("data", blocks[0]["variant"])
+
+    def test_variant_edit_bumps_every_lesson_using_the_block(self):
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": "Edited"}
+        variant.save()
+
+        self.assertEqual(self._version(), 2)
+        self.assertEqual(
+            fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT).version, 2
+        )
+        blocks = self.client.get(self.url, {"content_version": 1}).json()["blocks"]
+        self.assertEqual(blocks[1]["variant"]["data"], {"question": "Edited"})
+
+    def test_override_edit_bumps_its_tenant_only(self):
+        variant = BlockVariant.objects.get(pk=1100)
+        variant.data = {"markdown": "Edited"}
+        variant.save()
+
+        self.assertEqual(self._version(), 2)
+        self.assertEqual(
+            fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT).version, 1
+        )
+
+    def test_lesson_block_change_bumps_version(self):
+        LessonBlock.objects.filter(lesson_id=ACME_LESSON, block_id=202).update(
+            position=4
+        )
+        rebuild_resolved_lessons([ACME_LESSON])
+        self.assertEqual(fetch_lesson_structure(ACME_LESSON, ACME_TENANT).version, 2)
+
+    def test_invalid_content_version_returns_400(self):
+        resp = self.client.get(self.url, {"content_version": "latest"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class FieldProjectionTests(BaseTestCase):
+    """`?fields=` projects variant data, in Postgres on a miss."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+
+    def _data(self, **params):
+        blocks = self.client.get(self.url, params).json()["blocks"]
+        return [block["variant"]["data"] for block in blocks]
+
+    def test_data_is_projected_to_requested_keys(self):
+        self.assertEqual(
+            self._data(fields="markdown,title"),
+            [
+                {
+                    "markdown": "Welcome Acme team — this intro is customised "
+                    "for your organisation."
+                },
+                {},
+                {
+                    "markdown": "Summary: You have completed the basics. "
+                    "(Default summary)"
+                },
+            ],
+        )
+
+    def test_projection_is_done_by_postgres(self):
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT, ("question",))
+        self.assertEqual(
+            structure.variant_data,
+            ({}, {"question": "In one sentence, what is a neural network?"}, {}),
+        )
+        self.assertEqual(structure.version, 1)
+
+    def test_warm_projection_skips_the_structure_query(self):
+        self.client.get(self.url, {"fields": "markdown"})
+        with self.assertNumQueries(3):  # validate (2) + progress (1)
+            resp = self.client.get(self.url, {"fields": "markdown"})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_projection_does_not_fill_the_full_body(self):
+        self.client.get(self.url, {"fields": "markdown"})
+        generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        self.assertIsNone(
+            cache.get(body_cache_key(ACME_LESSON, ACME_TENANT, generation))
+        )
+        self.assertIn("question", self._data()[1])
+
+    def test_field_order_and_duplicates_share_a_projection(self):
+        self.client.get(self.url, {"fields": "question,markdown"})
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"fields": "markdown, question,markdown"})
+
+    def test_variant_edit_reaches_cached_projection(self):
+        self._data(fields="question")
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": "Edited", "hint": "Think layers"}
+        with self.committed():
+            variant.save()
+        self.assertEqual(self._data(fields="question")[1], {"question": "Edited"})
+
+    def test_projection_with_gzip_and_content_version(self):
+        identity = self.client.get(self.url, {"fields": "markdown"})
+        compressed = self.client.get(
+            self.url, {"fields": "markdown"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(
+            json.loads(gzip.decompress(compressed.content)), identity.json()
+        )
+        self.assertTrue(
+            all(
+                "data" not in block["variant"]
+                for block in self.client.get(
+                    self.url, {"fields": "markdown", "content_version": 1}
+                ).json()["blocks"]
+            )
+        )
+
+    def test_invalid_fields_return_400(self):
+        for value in (" , ", ",".join(f"k{i}" for i in range(33))):
+            resp = self.client.get(self.url, {"fields": value})
+            self.assertEqual(resp.status_code, 400, value)
+
+
+class LessonSnapshotTests(BaseTestCase):
+    """Published lessons are served from their snapshot; edits are drafts."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        self.publish_url = f"/tenants/{ACME_TENANT}/lessons/{ACME_LESSON}/publish"
+
+    def _edit_quiz(self, question):
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": question}
+        with self.committed():
+            variant.save()
+
+    def test_publish_freezes_the_current_content(self):
+        live = self.client.get(self.url).json()
+        resp = self.client.post(self.publish_url)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(
+            resp.json(),
+            {"lesson_id": ACME_LESSON, "published_version": 1, "created": True},
+        )
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).json(), live)
+
+    def test_edits_are_drafts_until_republished(self):
+        self.client.post(self.publish_url)
+        self._edit_quiz("Draft question")
+        body = self.client.get(self.url).json()
+        self.assertEqual(body["lesson"]["content_version"], 1)
+        self.assertEqual(
+            body["blocks"][1]["variant"]["data"],
+            {"question": "In one sentence, what is a neural network?"},
+        )
+
+        resp = self.client.post(self.publish_url)
+        self.assertEqual(resp.json()["published_version"], 2)
+        body = self.client.get(self.url).json()
+        self.assertEqual(body["lesson"]["content_version"], 2)
+        self.assertEqual(
+            body["blocks"][1]["variant"]["data"], {"question": "Draft question"}
+        )
+
+    def test_cold_read_is_one_primary_key_lookup(self):
+        self.client.post(self.publish_url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp.status_code, 200)
+        content = [
+            q["sql"] for q in ctx.captured_queries if "lesson_snapshots" in q["sql"]
+        ]
+        self.assertEqual(
+            len(ctx.captured_queries), 4
+        )  # validate (2) + snapshot + progress
+        self.assertEqual(len(content), 1)
+        self.assertIn('"version" = 1', content[0])
+        self.assertFalse(
+            any("resolved_lesson_blocks" in q["sql"] for q in ctx.captured_queries)
+        )
+
+    def test_republishing_an_unchanged_lesson_reuses_its_snapshot(self):
+        self.client.post(self.publish_url)
+        resp = self.client.post(self.publish_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.json()["created"])
+        self.assertEqual(LessonSnapshot.objects.count(), 1)
+
+    def test_unpublish_serves_the_draft(self):
+        self.client.post(self.publish_url)
+        self._edit_quiz("Draft question")
+        self.assertEqual(self.client.delete(self.publish_url).status_code, 204)
+        self.assertIsNone(Lesson.objects.get(pk=ACME_LESSON).published_version)
+        body = self.client.get(self.url).json()
+        self.assertEqual(
+            body["blocks"][1]["variant"]["data"], {"question": "Draft question"}
+        )
+        self.assertEqual(LessonSnapshot.objects.count(), 1)
+
+    def test_progress_follows_the_published_blocks(self):
+        self.client.post(self.publish_url)
+        with self.committed():
+            LessonBlock.objects.filter(lesson_id=ACME_LESSON, block_id=202).delete()
+        resp = self.client.put(
+            f"{self.url}/progress", {"block_id": 202, "status": "seen"}, format="json"
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["progress_summary"]["total_blocks"], 3)
+        sync = self.client.get(f"/tenants/{ACME_TENANT}/users/{ALICE}/progress")
+        self.assertEqual(
+            sync.json()["lessons"][0]["progress_summary"]["total_blocks"], 3
+        )
+
+    def test_projection_matches_the_live_projection(self):
+        live = self.client.get(self.url, {"fields": "markdown"}).json()
+        self.client.post(self.publish_url)
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, {"fields": "markdown"}).json(), live)
+
+    def test_publish_unknown_lesson_returns_404(self):
+        resp = self.client.post(
+            f"/tenants/{ACME_TENANT}/lessons/{GLOBEX_LESSON}/publish"
+        )
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(
+            self.client.delete(
+                f"/tenants/{ACME_TENANT}/lessons/{GLOBEX_LESSON}/publish"
+            ).status_code,
+            404,
+        )
+
+
+class CacheInvalidationTests(BaseTestCase):
+    """
+    Evictions wait for the commit and run on worker threads; a fill that read
+    content from before a change must not outlive the change's eviction.
+    """
+
+    @property
+    def key(self):
+        generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        return structure_cache_key(ACME_LESSON, ACME_TENANT, generation)
+
+    def _edit_variant(self, text="Edited"):
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": text}
+        variant.save()
+
+    def _question(self, structure):
+        return structure.variant_data[1]["question"]
+
+    def test_eviction_waits_for_commit(self):
+        get_lesson_structure(ACME_LESSON, ACME_TENANT)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._edit_variant()
+            # Evicting now would let a reader re-cache the committed content.
+            self.assertIsNotNone(cache.get(self.key))
+        self.assertIsNotNone(cache.get(self.key))
+
+        for callback in callbacks:
+            callback()
+        flush_invalidations()
+        self.assertIsNone(cache.get(self.key))
+
+    def test_rolled_back_change_evicts_nothing(self):
+        get_lesson_structure(ACME_LESSON, ACME_TENANT)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self._edit_variant()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(cache.get(self.key))
+
+    def test_fill_that_read_before_the_commit_is_not_cached(self):
+        """
+        A reader misses, reads the old content, and the edit commits and is
+        evicted before the reader stores it. Without fill leases the old
+        content would stay cached for STRUCTURE_CACHE_TTL.
+        """
+        old = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+
+        def read_then_edit(lesson_id, tenant_id):
+            with self.committed():
+                self._edit_variant()
+            return old
+
+        with mock.patch(
+            "lessons.services.assembly.fetch_lesson_structure",
+            side_effect=read_then_edit,
+        ):
+            served = get_lesson_structure(ACME_LESSON, ACME_TENANT)
+
+        self.assertEqual(served, old)  # this response was already in flight
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(
+            self._question(get_lesson_structure(ACME_LESSON, ACME_TENANT)), "Edited"
+        )
+
+    def test_stale_body_fill_is_not_cached(self):
+        client = APIClient()
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        old = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+
+        def read_then_edit(lesson_id, tenant_id):
+            with self.committed():
+                self._edit_variant()
+            return old
+
+        with mock.patch(
+            "lessons.services.assembly.fetch_lesson_structure",
+            side_effect=read_then_edit,
+        ):
+            client.get(url)
+
+        blocks = client.get(url).json()["blocks"]
+        self.assertEqual(blocks[1]["variant"]["data"], {"question": "Edited"})
+
+    def test_miss_during_another_fill_reads_without_caching(self):
+        token = acquire_fill_lease(self.key)
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_fill_lease(self.key))
+
+        structure = get_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self.assertEqual(list(structure.block_ids), [200, 201, 202])
+        self.assertIsNone(cache.get(self.key))
+
+    def test_leases_are_deleted_before_entries(self):
+        keys = lesson_invalidation_keys([(ACME_TENANT, ACME_LESSON)])
+        self.assertEqual(keys.index(f"{self.key}:fill"), 0)
+        self.assertLess(keys.index(f"{self.key}:fill"), keys.index(self.key))
+
+    def test_queue_merges_keys_queued_while_a_batch_is_in_flight(self):
+        batches = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def delete_many(keys):
+            batches.append(keys)
+            started.set()
+            release.wait(5)
+
+        queue = InvalidationQueue(workers=1, batch_size=2)
+        with mock.patch("lessons.services.invalidation.cache") as fake_cache:
+            fake_cache.delete_many.side_effect = delete_many
+            queue.put(["a"])
+            self.assertTrue(started.wait(5))
+            queue.put(["b", "c"])
+            queue.put(["c", "b", "d"])
+            release.set()
+            self.assertTrue(queue.flush(timeout=5))
+
+        self.assertEqual(batches, [["a"], ["b", "c"], ["d"]])
+
+    def test_worker_survives_a_failing_delete(self):
+        real_delete_many = cache.delete_many
+        calls = []
+
+        def delete_many(keys):
+            calls.append(list(keys))
+            if len(calls) == 1:
+                raise ConnectionError("cache unavailable")
+            real_delete_many(keys)
+
+        cache.set_many({"a": 1, "b": 1})
+        queue = InvalidationQueue(workers=1, batch_size=10)
+        with mock.patch("lessons.services.invalidation.cache") as fake_cache:
+            fake_cache.delete_many.side_effect = delete_many
+            with self.assertLogs("lessons.services.invalidation", "ERROR"):
+                queue.put(["a"])
+                self.assertTrue(queue.flush(timeout=5))
+            queue.put(["b"])
+            self.assertTrue(queue.flush(timeout=5))
+
+        self.assertEqual(calls, [["a"], ["a"], ["b"]])
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_keys_failing_twice_are_dropped(self):
+        queue = InvalidationQueue(workers=1, batch_size=10)
+        with mock.patch("lessons.services.invalidation.cache") as fake_cache:
+            fake_cache.delete_many.side_effect = ConnectionError("cache unavailable")
+            with self.assertLogs("lessons.services.invalidation", "ERROR") as logs:
+                queue.put(["a"])
+                self.assertTrue(queue.flush(timeout=5))
+        self.assertEqual(fake_cache.delete_many.call_count, 2)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_commands_report_a_flush_timeout(self):
+        err = io.StringIO()
+        with mock.patch(
+            "lessons.management.commands.rebuild_resolved_lessons."
+            "flush_invalidations",
+            return_value=False,
+        ) as flush:
+            call_command(
+                "rebuild_resolved_lessons",
+                str(ACME_LESSON),
+                stdout=io.StringIO(),
+                stderr=err,
+            )
+        flush.assert_called_once_with(settings.CACHE_INVALIDATION_FLUSH_TIMEOUT)
+        self.assertIn("Timed out waiting for cache evictions", err.getvalue())
+
+    def test_synchronous_queue_deletes_on_put(self):
+        cache.set("some-key", 1)
+        InvalidationQueue(workers=0, batch_size=10).put(["some-key"])
+        self.assertIsNone(cache.get("some-key"))
+
+
+class CacheGenerationTests(BaseTestCase):
+    """
+    Live content keys carry tenant and lesson generations: renewing one
+    evicts a whole tenant, or a lesson, with one write.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _url(self, tenant_id, user_id, lesson_id):
+        return f"/tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}"
+
+    def _cached_keys(self, lesson_id, tenant_id):
+        generation = lesson_generation(lesson_id, tenant_id)
+        return [
+            key
+            for key in lesson_cache_keys(lesson_id, tenant_id, generation)
+            if cache.get(key) is not None
+        ]
+
+    def _warm(self):
+        self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON))
+        self.assertEqual(len(self._cached_keys(ACME_LESSON, ACME_TENANT)), 2)
+        self.assertEqual(len(self._cached_keys(GLOBEX_LESSON, GLOBEX_TENANT)), 2)
+
+    def _edit_variant(self, text="Edited"):
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": text}
+        variant.save()
+
+    def test_generation_is_stable_until_renewed(self):
+        generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        self.assertEqual(lesson_generation(ACME_LESSON, ACME_TENANT), generation)
+        self.assertNotEqual(lesson_generation(GLOBEX_LESSON, GLOBEX_TENANT), generation)
+        with self.committed():
+            invalidate_tenants([ACME_TENANT])
+        self.assertNotEqual(lesson_generation(ACME_LESSON, ACME_TENANT), generation)
+
+    def test_renewing_a_tenant_evicts_only_that_tenant(self):
+        self._warm()
+        with self.committed():
+            invalidate_tenants([ACME_TENANT])
+        self.assertEqual(self._cached_keys(ACME_LESSON, ACME_TENANT), [])
+        self.assertEqual(len(self._cached_keys(GLOBEX_LESSON, GLOBEX_TENANT)), 2)
+
+    def test_renewing_a_lesson_evicts_its_projections(self):
+        url = self._url(ACME_TENANT, ALICE, ACME_LESSON)
+        self.client.get(url, {"fields": "question"})
+        with self.assertNumQueries(3):  # validate (2) + progress (1)
+            self.client.get(url, {"fields": "question"})
+        with self.committed():
+            invalidate_lesson_ids([ACME_LESSON])
+        with self.assertNumQueries(4):  # + the projection
+            self.client.get(url, {"fields": "question"})
+
+    def test_renewal_waits_for_the_commit(self):
+        self._warm()
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_tenants([ACME_TENANT])
+            self.assertEqual(len(self._cached_keys(ACME_LESSON, ACME_TENANT)), 2)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._cached_keys(ACME_LESSON, ACME_TENANT), [])
+
+    def test_rolled_back_renewal_evicts_nothing(self):
+        self._warm()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                invalidate_tenants([ACME_TENANT])
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(len(self._cached_keys(ACME_LESSON, ACME_TENANT)), 2)
+
+    def test_evicted_generation_never_comes_back(self):
+        self._warm()
+        generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        cache.delete(tenant_generation_key(ACME_TENANT))
+        self.assertNotEqual(lesson_generation(ACME_LESSON, ACME_TENANT), generation)
+        self.assertEqual(self._cached_keys(ACME_LESSON, ACME_TENANT), [])
+
+    def test_signal_invalidation_after_a_renewal(self):
+        """Edits evict the keys of the current generation."""
+        self._warm()
+        with self.committed():
+            invalidate_tenants([ACME_TENANT])
+        self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON))
+        self.assertEqual(len(self._cached_keys(ACME_LESSON, ACME_TENANT)), 2)
+
+        with self.committed():
+            self._edit_variant()
+        self.assertEqual(self._cached_keys(ACME_LESSON, ACME_TENANT), [])
+        body = self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON)).json()
+        self.assertEqual(body["blocks"][1]["variant"]["data"], {"question": "Edited"})
+
+    def test_fill_under_a_renewed_generation_is_not_served(self):
+        """
+        A reader misses, reads the content, and the tenant is renewed before
+        it stores it: what it stores is under the old generation.
+        """
+        old = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+
+        def read_then_renew(lesson_id, tenant_id):
+            with self.committed():
+                self._edit_variant()
+                invalidate_tenants([ACME_TENANT])
+            return old
+
+        with mock.patch(
+            "lessons.services.assembly.fetch_lesson_structure",
+            side_effect=read_then_renew,
+        ):
+            self.assertEqual(get_lesson_structure(ACME_LESSON, ACME_TENANT), old)
+        structure = get_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self.assertEqual(structure.variant_data[1], {"question": "Edited"})
+
+    def test_edit_evicts_a_generation_renewed_while_it_was_open(self):
+        """
+        The tenant is renewed while an edit's transaction is open, and a
+        reader fills under the new generation from the old content. The
+        edit's eviction must cover the new generation.
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._edit_variant()
+        with self.committed():
+            invalidate_tenants([ACME_TENANT])
+        stale = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        stale.variant_data = ({}, {"question": "Stale"}, {})
+        key = structure_cache_key(
+            ACME_LESSON, ACME_TENANT, lesson_generation(ACME_LESSON, ACME_TENANT)
+        )
+        cache.set(key, stale)
+
+        for callback in callbacks:
+            callback()
+        flush_invalidations()
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(CACHE_INVALIDATION_TENANT_THRESHOLD=1)
+    def test_large_changes_renew_the_tenant(self):
+        self._warm()
+        generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        with mock.patch("lessons.services.invalidation._queue") as queue:
+            with self.committed():
+                resp = self.client.post(
+                    f"/tenants/{ACME_TENANT}/content/bulk",
+                    {"variants": [{"block_id": 201, "data": {"question": "Bulk"}}]},
+                    format="json",
+                )
+        self.assertEqual(resp.status_code, 200)
+        queue.put.assert_not_called()
+        self.assertNotEqual(lesson_generation(ACME_LESSON, ACME_TENANT), generation)
+        self.assertEqual(len(self._cached_keys(GLOBEX_LESSON, GLOBEX_TENANT)), 2)
+        body = self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON)).json()
+        self.assertEqual(body["blocks"][1]["variant"]["data"], {"question": "Bulk"})
+
+    def test_clear_lesson_cache_command(self):
+        self._warm()
+        out = io.StringIO()
+        with self.committed():
+            call_command(
+                "clear_lesson_cache", "--tenant", str(GLOBEX_TENANT), stdout=out
+            )
+        self.assertIn("1 tenants", out.getvalue())
+        self.assertEqual(self._cached_keys(GLOBEX_LESSON, GLOBEX_TENANT), [])
+        with self.committed():
+            call_command("clear_lesson_cache", str(ACME_LESSON), stdout=out)
+        self.assertEqual(self._cached_keys(ACME_LESSON, ACME_TENANT), [])
+
+
+class SharedMemoryCacheTests(BaseTestCase):
+    """One memory-mapped cache file, read without locks by every process."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache")
+        self.cache = self._open()
+
+    def _open(self, size=2**20, slots=256):
+        return SharedMemoryCache(
+            self.path, {"TIMEOUT": 300, "OPTIONS": {"SIZE": size, "SLOTS": slots}}
+        )
+
+    def test_set_get_add_delete(self):
+        self.cache.set("a", {"blocks": [1, 2]})
+        self.assertEqual(self.cache.get("a"), {"blocks": [1, 2]})
+        self.assertFalse(self.cache.add("a", "other"))
+        self.assertTrue(self.cache.add("b", "other"))
+        self.assertTrue(self.cache.delete("a"))
+        self.assertIsNone(self.cache.get("a"))
+        self.assertTrue(self.cache.add("a", "again"))
+        self.assertEqual(self.cache.get("a"), "again")
+
+    def test_expired_entries_miss(self):
+        self.cache.set("a", 1, timeout=0.01)
+        self.cache.set("b", 2, timeout=None)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertTrue(self.cache.add("a", 3))
+        self.assertEqual(self.cache.get("b"), 2)
+
+    def test_compaction_keeps_the_newest_entries(self):
+        for i in range(2000):
+            self.cache.set(f"k{i}", "v" * 500)
+        stats = self.cache.stats()
+        self.assertGreater(stats["compactions"], 0)
+        self.assertLessEqual(stats["bytes_used"], stats["bytes"])
+        self.assertEqual(self.cache.get("k1999"), "v" * 500)
+        self.assertIsNone(self.cache.get("k0"))
+
+    def test_entries_too_large_are_not_stored(self):
+        self.cache.set("a", "small")
+        self.cache.set("a", b"x" * 2**19)
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_processes_share_entries(self):
+        self.cache.set("parent", "from parent")
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = self._open()
+                ok = child.get("parent") == "from parent"
+                child.set("child", "from child")
+            finally:
+                os._exit(0 if ok else 1)
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(self.cache.get("child"), "from child")
+        self.assertEqual(self._open().get("child"), "from child")
+
+    def test_incr_keeps_the_expiry(self):
+        self.cache.set("n", 1, timeout=0.05)
+        self.assertEqual(self.cache.incr("n", 2), 3)
+        self.assertEqual(self.cache.get("n"), 3)
+        time.sleep(0.06)
+        with self.assertRaises(ValueError):
+            self.cache.incr("n")
+
+    def test_concurrent_incr_loses_no_increments(self):
+        self.cache.set("n", 0)
+        pids = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    child = self._open()
+                    for _ in range(200):
+                        child.incr("n")
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            _pid, status = os.waitpid(pid, 0)
+            self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(self.cache.get("n"), 800)
+
+    def test_read_of_an_overwritten_arena_retries(self):
+        """
+        Two compactions land while a reader is unpickling: the second one
+        overwrites the arena the reader is in, so it reads again.
+        """
+        writer = self._open()
+        self.cache.set("a", "old")
+        loads = pickle.loads
+        calls = []
+
+        def compact_during_first_read(data):
+            if not calls:
+                writer.clear()
+                writer.set("a", "new")
+                writer.clear()
+                writer.set("a", "newer")
+            calls.append(data)
+            return loads(data)
+
+        with mock.patch(
+            "lessons.cache_backends.shared_memory.pickle.loads",
+            compact_during_first_read,
+        ):
+            self.assertEqual(self.cache.get("a"), "newer")
+        self.assertEqual(len(calls), 2)
+
+    def test_lessons_are_cached_in_the_shared_file(self):
+        caches = {
+            "default": {
+                "BACKEND": "lessons.cache_backends.shared_memory.SharedMemoryCache",
+                "LOCATION": self.path,
+                "OPTIONS": {"SIZE": 2**20, "SLOTS": 256},
+            }
+        }
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        with override_settings(CACHES=caches):
+            first = APIClient().get(url).json()
+            with self.assertNumQueries(3):  # validate (2) + progress (1)
+                self.assertEqual(APIClient().get(url).json(), first)
+            generation = lesson_generation(ACME_LESSON, ACME_TENANT)
+        key = structure_cache_key(ACME_LESSON, ACME_TENANT, generation)
+        structure = self.cache.get(key)
+        self.assertEqual(structure.block_ids, (200, 201, 202))
+
+
+class TinyLFUCacheTests(BaseTestCase):
+    """A byte budget, filled by how often entries are read."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = self._open(max_bytes=100_000)
+
+    def _open(self, **options):
+        options = {key.upper(): value for key, value in options.items()}
+        return TinyLFUCache(self.id(), {"TIMEOUT": 300, "OPTIONS": options})
+
+    def _fill(self, key, size):
+        # What get_or_fill does: a read that misses, then the store.
+        if self.cache.get(key) is None:
+            self.cache.set(key, b"x" * size)
+
+    def test_set_get_add_delete(self):
+        self.cache.set("a", {"blocks": [1, 2]})
+        self.assertEqual(self.cache.get("a"), {"blocks": [1, 2]})
+        self.assertFalse(self.cache.add("a", "other"))
+        self.assertTrue(self.cache.add("b", "other"))
+        self.assertTrue(self.cache.delete("a"))
+        self.assertFalse(self.cache.has_key("a"))
+        self.cache.set("c", 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("c"))
+        self.cache.set("n", 1)
+        self.assertEqual(self.cache.incr("n", 2), 3)
+
+    def test_stays_within_the_byte_budget(self):
+        for i in range(500):
+            self._fill(f"k{i}", 100 + (i * 37) % 5000)
+            self.assertLessEqual(self.cache.stats()["bytes_used"], 100_000)
+        self.cache.set("huge", b"x" * 200_000)
+        self.assertIsNone(self.cache.get("huge"))
+
+    def test_scan_does_not_evict_popular_entries(self):
+        hot = [f"hot{i}" for i in range(30)]
+        for _ in range(5):
+            for key in hot:
+                self._fill(key, 2000)
+        for i in range(300):
+            self._fill(f"cold{i}", 2000)
+        self.assertTrue(all(self.cache.has_key(key) for key in hot))
+        self.assertGreater(self.cache.stats()["rejected"], 250)
+
+    def test_large_rare_entry_does_not_evict_many_small_popular_ones(self):
+        hot = [f"hot{i}" for i in range(80)]
+        for _ in range(3):
+            for key in hot:
+                self._fill(key, 1000)
+        self._fill("big", 60_000)
+        self.assertFalse(self.cache.has_key("big"))
+        self.assertTrue(all(self.cache.has_key(key) for key in hot))
+
+    def test_entries_that_become_popular_are_admitted(self):
+        for i in range(40):
+            for _ in range(2):
+                self._fill(f"old{i}", 2400)
+        for _ in range(4):
+            self._fill("new", 2400)
+        self.assertTrue(self.cache.has_key("new"))
+
+    def test_stats(self):
+        self._fill("a", 10)
+        self.cache.get("a")
+        self.cache.get("a")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["bytes"], 100_000)
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["hits"], 0)
+
+    def test_frequencies_fade(self):
+        sketch = FrequencySketch(16)
+        for _ in range(MAX_COUNT + 5):
+            sketch.increment("a")
+        self.assertEqual(sketch.frequency("a"), MAX_COUNT)
+        for i in range(10 * sketch.width):
+            sketch.increment(f"other{i}")
+        self.assertLess(sketch.frequency("a"), MAX_COUNT)
+
+    def test_stats_endpoint(self):
+        caches = {
+            "default": {
+                "BACKEND": "lessons.cache_backends.tinylfu.TinyLFUCache",
+                "LOCATION": self.id(),
+            }
+        }
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        with override_settings(CACHES=caches):
+            client = APIClient()
+            client.get(url)
+            client.get(url)
+            stats = client.get("/cache/stats").json()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["bytes_used"], 0)
+        self.assertEqual(APIClient().get("/cache/stats").status_code, 404)
+
+
+class ContentBulkTests(BaseTestCase):
+    """Bulk content edits: set-based writes, one invalidation pass."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.lesson_url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+
+    def _post(self, payload, tenant_id=ACME_TENANT):
+        url = (
+            "/content/bulk"
+            if tenant_id is None
+            else f"/tenants/{tenant_id}/content/bulk"
+        )
+        with self.committed():
+            return self.client.post(url, payload, format="json")
+
+    def _blocks(self, url=None):
+        return self.client.get(url or self.lesson_url).json()["blocks"]
+
+    def test_override_rollout(self):
+        self._blocks()  # warm the cache
+        resp = self._post(
+            {
+                "variants": [
+                    {"block_id": 201, "data": {"question": "Acme quiz"}},
+                    {"block_id": 202, "data": {"markdown": "Acme summary"}},
+                ]
+            }
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["variants_upserted"], 2)
+        self.assertEqual(resp.json()["lessons_invalidated"], 1)
+
+        blocks = self._blocks()
+        self.assertEqual(blocks[1]["variant"]["data"], {"question": "Acme quiz"})
+        self.assertEqual(blocks[1]["variant"]["tenant_id"], ACME_TENANT)
+        self.assertEqual(blocks[2]["variant"]["data"], {"markdown": "Acme summary"})
+        # Globex keeps the default quiz.
+        globex = fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT)
+        self.assertIsNone(globex.variant_tenant_ids[2])
+
+    def test_new_variants_get_ids_past_explicitly_loaded_ones(self):
+        # The seed rows were loaded with ids 1000+, leaving the sequence at 1.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('block_variants', 'id'), 1)"
+            )
+        resp = self._post(
+            {"variants": [{"block_id": 201, "data": {"question": "Acme quiz"}}]}
+        )
+        self.assertEqual(resp.status_code, 200)
+        variant = BlockVariant.objects.get(block_id=201, tenant_id=ACME_TENANT)
+        self.assertGreater(variant.id, 1200)
+
+    def test_existing_override_is_replaced_in_place(self):
+        resp = self._post(
+            {"variants": [{"block_id": 200, "data": {"markdown": "New"}}]}
+        )
+        self.assertEqual(resp.status_code, 200)
+        variant = BlockVariant.objects.get(block_id=200, tenant_id=ACME_TENANT)
+        self.assertEqual((variant.id, variant.data), (1100, {"markdown": "New"}))
+
+    def test_default_variant_update_reaches_every_tenant(self):
+        resp = self._post(
+            {"variants": [{"block_id": 201, "data": {"question": "Everyone"}}]},
+            tenant_id=None,
+        )
+        self.assertEqual(resp.json()["lessons_invalidated"], 2)
+        self.assertEqual(
+            BlockVariant.objects.filter(block_id=201, tenant_id=None).count(), 1
+        )
+        for tenant_id, lesson_id, index in (
+            (ACME_TENANT, ACME_LESSON, 1),
+            (GLOBEX_TENANT, GLOBEX_LESSON, 2),
+        ):
+            structure = fetch_lesson_structure(lesson_id, tenant_id)
+            self.assertEqual(structure.variant_data[index], {"question": "Everyone"})
+            self.assertEqual(structure.version, 2)
+
+    def test_deleting_an_override_falls_back_to_the_default(self):
+        self._blocks()
+        resp = self._post({"delete_variants": [200]})
+        self.assertEqual(resp.json()["variants_deleted"], 1)
+        self.assertEqual(self._blocks()[0]["variant"]["id"], 1000)
+
+    def test_lesson_blocks_can_swap_positions(self):
+        self._blocks()
+        resp = self._post(
+            {
+                "lesson_blocks": [
+                    {"lesson_id": ACME_LESSON, "block_id": 201, "position": 3},
+                    {"lesson_id": ACME_LESSON, "block_id": 202, "position": 2},
+                ],
+                "delete_lesson_blocks": [{"lesson_id": ACME_LESSON, "block_id": 200}],
+            }
+        )
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json()["lesson_blocks_upserted"], 2)
+        self.assertEqual(resp.json()["lesson_blocks_deleted"], 1)
+        blocks = self._blocks()
+        self.assertEqual([b["id"] for b in blocks], [202, 201])
+        self.assertEqual([b["variant"]["id"] for b in blocks], [1002, 1001])
+
+    def test_block_list_change_rebuilds_rollups(self):
+        resp = self._post(
+            {"delete_lesson_blocks": [{"lesson_id": ACME_LESSON, "block_id": 202}]}
+        )
+        self.assertEqual(resp.status_code, 200)
+        rollup = LessonProgressRollup.objects.get(lesson_id=ACME_LESSON)
+        # Alice completed 200 and saw 201; only the completed one still counts.
+        self.assertEqual(rollup.completed_blocks_total, 1)
+
+    def test_invalidates_once_after_commit(self):
+        with mock.patch(
+            "lessons.services.bulk_content.invalidate_lessons"
+        ) as invalidate:
+            self._post(
+                {
+                    "variants": [{"block_id": 201, "data": {"question": "Q"}}],
+                    "lesson_blocks": [
+                        {"lesson_id": ACME_LESSON, "block_id": 202, "position": 4}
+                    ],
+                }
+            )
+        invalidate.assert_called_once_with(
+            {(ACME_TENANT, ACME_LESSON)}, using="default"
+        )
+
+    def test_invalid_changes_write_nothing(self):
+        for payload, tenant_id in (
+            ({"variants": [{"block_id": 9999, "data": {}}]}, ACME_TENANT),
+            (
+                {
+                    "lesson_blocks": [
+                        {"lesson_id": GLOBEX_LESSON, "block_id": 200, "position": 9}
+                    ]
+                },
+                ACME_TENANT,
+            ),
+            (
+                {"variants": [{"block_id": 201, "data": {}}], "delete_variants": [201]},
+                ACME_TENANT,
+            ),
+            (
+                {"delete_lesson_blocks": [{"lesson_id": ACME_LESSON, "block_id": 200}]},
+                None,
+            ),
+            (
+                # Position 1 is still held by block 200.
+                {
+                    "lesson_blocks": [
+                        {"lesson_id": ACME_LESSON, "block_id": 202, "position": 1}
+                    ]
+                },
+                ACME_TENANT,
+            ),
+            ({"variants": [{"block_id": 201, "data": "text"}]}, ACME_TENANT),
+        ):
+            resp = self._post(payload, tenant_id)
+            self.assertEqual(resp.status_code, 400, payload)
+            self.assertIn("error", resp.json())
+        self.assertEqual([b["id"] for b in self._blocks()], [200, 201, 202])
+        self.assertFalse(
+            BlockVariant.objects.filter(block_id=201, tenant_id=ACME_TENANT).exists()
+        )
+
+    def test_unknown_tenant_returns_404(self):
+        resp = self._post({"delete_variants": [200]}, tenant_id=999)
+        self.assertEqual(resp.status_code, 404)
+
+
+class ProgressRollupTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _analytics(self, tenant_id):
+        resp = self.client.get(f"/tenants/{tenant_id}/analytics/lessons")
+        self.assertEqual(resp.status_code, 200)
+        return {row["lesson_id"]: row for row in resp.json()["lessons"]}
+
+    def _rollup(self, lesson_id):
+        return LessonProgressRollup.objects.values(
+            "users_started", "users_completed", "completed_blocks_total"
+        ).get(lesson_id=lesson_id)
+
+    def test_seed_analytics(self):
+        row = self._analytics(ACME_TENANT)[ACME_LESSON]
+        self.assertEqual(row["slug"], "ai-basics")
+        self.assertEqual(row["users_started"], 1)
+        self.assertEqual(row["users_completed"], 0)
+        self.assertEqual(row["average_completed_blocks"], 1.0)
+
+    def test_lesson_without_progress_reports_zeros(self):
+        row = self._analytics(GLOBEX_TENANT)[GLOBEX_LESSON]
+        self.assertEqual(row["users_started"], 0)
+        self.assertEqual(row["users_completed"], 0)
+        self.assertEqual(row["average_completed_blocks"], 0.0)
+
+    def test_unknown_tenant_returns_404(self):
+        resp = self.client.get("/tenants/999/analytics/lessons")
+        self.assertEqual(resp.status_code, 404)
+        self.assertIn("error", resp.json())
+
+    def test_analytics_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(f"/tenants/{ACME_TENANT}/analytics/lessons")
+
+    def test_first_progress_starts_user(self):
+        upsert_progress(BOB, ACME_LESSON, 200, "seen")
+        self.assertEqual(
+            self._rollup(ACME_LESSON),
+            {"users_started": 2, "users_completed": 0, "completed_blocks_total": 1},
+        )
+        counts = UserLessonProgress.objects.get(user_id=BOB, lesson_id=ACME_LESSON)
+        self.assertEqual((counts.seen_blocks, counts.completed_blocks), (1, 0))
+
+    def test_completing_every_block_completes_user(self):
+        upsert_progress(ALICE, ACME_LESSON, 201, "completed")
+        upsert_progress(ALICE, ACME_LESSON, 202, "completed")
+        self.assertEqual(
+            self._rollup(ACME_LESSON),
+            {"users_started": 1, "users_completed": 1, "completed_blocks_total": 3},
+        )
+
+    def test_noop_upserts_leave_rollups_alone(self):
+        before = self._rollup(ACME_LESSON)
+        upsert_progress(ALICE, ACME_LESSON, 200, "seen")
+        upsert_progress(ALICE, ACME_LESSON, 200, "completed")
+        upsert_progress(ALICE, ACME_LESSON, 201, "seen")
+        self.assertEqual(self._rollup(ACME_LESSON), before)
+
+    def test_rebuild_matches_online_counters(self):
+        upsert_progress(BOB, ACME_LESSON, 200, "completed")
+        upsert_progress(BOB, ACME_LESSON, 201, "seen")
+        upsert_progress(ALICE, ACME_LESSON, 201, "completed")
+        upsert_progress(ALICE, ACME_LESSON, 202, "completed")
+        online = self._rollup(ACME_LESSON)
+
+        rebuild_progress_rollups()
+        self.assertEqual(self._rollup(ACME_LESSON), online)
+
+    def test_incremental_rebuild_repairs_out_of_band_writes(self):
+        marker = timezone.now()
+        UserBlockProgress.objects.create(
+            user_id=BOB,
+            lesson_id=ACME_LESSON,
+            block_id=202,
+            status="completed",
+            updated_at=timezone.now(),
+        )
+        self.assertEqual(self._rollup(ACME_LESSON)["users_started"], 1)
+
+        self.assertEqual(rebuild_progress_rollups(since=marker), {ACME_LESSON})
+        self.assertEqual(
+            self._rollup(ACME_LESSON),
+            {"users_started": 2, "users_completed": 0, "completed_blocks_total": 2},
+        )
+
+    def test_rebuild_drops_rows_of_lessons_without_progress(self):
+        UserBlockProgress.objects.filter(lesson_id=ACME_LESSON).delete()
+
+        self.assertEqual(rebuild_progress_rollups([ACME_LESSON]), {ACME_LESSON})
+        self.assertFalse(
+            LessonProgressRollup.objects.filter(lesson_id=ACME_LESSON).exists()
+        )
+        self.assertFalse(
+            UserLessonProgress.objects.filter(lesson_id=ACME_LESSON).exists()
+        )
+
+    def test_rebuild_runs_twice_in_one_transaction(self):
+        with transaction.atomic():
+            rebuild_progress_rollups([ACME_LESSON])
+            rebuild_progress_rollups(since=timezone.now())
+        self.assertEqual(self._rollup(ACME_LESSON)["users_started"], 1)
+
+
+class ProgressExportTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        upsert_progress(BOB, ACME_LESSON, 202, "seen")
+
+    def _export(self, tenant_id=ACME_TENANT, **params):
+        resp = self.client.get(f"/tenants/{tenant_id}/progress/export", params)
+        self.assertEqual(resp.status_code, 200)
+        return resp, b"".join(resp.streaming_content).decode()
+
+    def _ndjson(self, **params):
+        _resp, body = self._export(**params)
+        return [json.loads(line) for line in body.splitlines()]
+
+    def _keys(self, records):
+        return [(r["user_id"], r["lesson_id"], r["block_id"]) for r in records]
+
+    def test_ndjson_streams_tenant_rows_in_key_order(self):
+        resp, _body = self._export()
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+
+        records = self._ndjson()
+        self.assertEqual(
+            self._keys(records),
+            [
+                (ALICE, ACME_LESSON, 200),
+                (ALICE, ACME_LESSON, 201),
+                (BOB, ACME_LESSON, 202),
+            ],
+        )
+        self.assertEqual(records[0]["status"], "completed")
+
+    def test_csv_has_header_and_rows(self):
+        resp, body = self._export(format="csv")
+        self.assertEqual(resp["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2]["user_id"], str(BOB))
+        self.assertEqual(rows[2]["status"], "seen")
+
+    def test_other_tenants_rows_are_excluded(self):
+        upsert_progress(CHARLIE, GLOBEX_LESSON, 200, "seen")
+        self.assertEqual(
+            self._keys(self._ndjson(tenant_id=GLOBEX_TENANT)),
+            [(CHARLIE, GLOBEX_LESSON, 200)],
+        )
+
+    def test_resume_after_cursor(self):
+        records = self._ndjson(after=f"{ALICE}:{ACME_LESSON}:201")
+        self.assertEqual(self._keys(records), [(BOB, ACME_LESSON, 202)])
+
+    def test_updated_at_range(self):
+        cutoff = UserBlockProgress.objects.get(
+            user_id=BOB, lesson_id=ACME_LESSON, block_id=202
+        ).updated_at
+        self.assertEqual(
+            self._keys(self._ndjson(updated_from=cutoff.isoformat())),
+            [(BOB, ACME_LESSON, 202)],
+        )
+        self.assertEqual(len(self._ndjson(updated_to=cutoff.isoformat())), 2)
+
+    def test_lesson_filter(self):
+        self.assertEqual(len(self._ndjson(lesson_id=ACME_LESSON)), 3)
+        self.assertEqual(self._ndjson(lesson_id=GLOBEX_LESSON), [])
+
+    def test_rows_are_fetched_in_chunks(self):
+        rows = list(iter_progress_rows(ACME_TENANT, chunk_size=1))
+        self.assertEqual(len(rows), 3)
+
+    def test_invalid_cursor_returns_400(self):
+        resp = self.client.get(
+            f"/tenants/{ACME_TENANT}/progress/export", {"after": "nope"}
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("error", resp.json())
+
+    def test_unknown_tenant_returns_404(self):
+        resp = self.client.get("/tenants/999/progress/export")
+        self.assertEqual(resp.status_code, 404)
+
+
+class ProgressImportTests(BaseTestCase):
+    def _import(self, records, fmt="ndjson", **kwargs):
+        if fmt == "ndjson":
+            lines = [r if isinstance(r, str) else json.dumps(r) for r in records]
+        else:
+            lines = records
+        rejects = io.StringIO()
+        stats = import_progress(
+            io.StringIO("\n".join(lines) + "\n"), fmt, rejects=rejects, **kwargs
+        )
+        rejected = {
+            int(row["line_no"]): row["reason"]
+            for row in csv.DictReader(io.StringIO(rejects.getvalue()))
+        }
+        return stats, rejected
+
+    def _status(self, user_id, lesson_id, block_id):
+        return (
+            UserBlockProgress.objects.filter(
+                user_id=user_id, lesson_id=lesson_id, block_id=block_id
+            )
+            .values_list("status", flat=True)
+            .first()
+        )
+
+    def _row(self, user_id, block_id, status, lesson_id=ACME_LESSON):
+        return {
+            "user_id": user_id,
+            "lesson_id": lesson_id,
+            "block_id": block_id,
+            "status": status,
+        }
+
+    def test_merges_valid_rows_monotonically(self):
+        stats, rejected = self._import(
+            [
+                self._row(BOB, 200, "seen"),
+                self._row(ALICE, 201, "completed"),
+                self._row(ALICE, 200, "seen"),  # would downgrade
+            ]
+        )
+        self.assertEqual(rejected, {})
+        self.assertEqual(stats["rows_read"], 3)
+        self.assertEqual(stats["rows_merged"], 2)
+        self.assertEqual(self._status(BOB, ACME_LESSON, 200), "seen")
+        self.assertEqual(self._status(ALICE, ACME_LESSON, 201), "completed")
+        self.assertEqual(self._status(ALICE, ACME_LESSON, 200), "completed")
+
+    def test_duplicate_rows_collapse_to_highest_status(self):
+        stats, _rejected = self._import(
+            [self._row(BOB, 202, "completed"), self._row(BOB, 202, "seen")]
+        )
+        self.assertEqual(stats["rows_merged"], 1)
+        self.assertEqual(self._status(BOB, ACME_LESSON, 202), "completed")
+
+    def test_invalid_rows_are_rejected_with_reasons(self):
+        stats, rejected = self._import(
+            [
+                self._row(BOB, 200, "seen"),
+                "{not json",
+                self._row(BOB, 200, "done"),
+                {"user_id": "x", "lesson_id": ACME_LESSON, "block_id": 200},
+                self._row(999, 200, "seen"),
+                self._row(BOB, 200, "seen", lesson_id=999),
+                self._row(CHARLIE, 200, "seen"),
+                self._row(BOB, 999, "seen"),
+                self._row(BOB, "²", "seen"),
+                {**self._row(BOB, 200, "seen"), "user_id": "١٢"},
+            ]
+        )
+        self.assertEqual(
+            rejected,
+            {
+                2: "invalid JSON",
+                3: "status must be seen or completed",
+                4: "user_id must be an integer",
+                5: "unknown user",
+                6: "unknown lesson",
+                7: "user and lesson belong to different tenants",
+                8: "block not in lesson",
+                9: "block_id must be an integer",
+                10: "user_id must be an integer",
+            },
+        )
+        self.assertEqual(stats["rows_rejected"], 9)
+        self.assertEqual(stats["rows_merged"], 1)
+        self.assertFalse(UserBlockProgress.objects.filter(block_id=999).exists())
+
+    def test_ids_outside_int4_are_rejected_per_line(self):
+        stats, rejected = self._import(
+            [
+                self._row(2**31, 200, "seen"),
+                self._row(BOB, -(2**31) - 1, "seen"),
+                self._row(BOB, 200, "seen", lesson_id=str(2**40)),
+                self._row(BOB, 200, "seen"),
+            ]
+        )
+        self.assertEqual(
+            rejected,
+            {
+                1: "user_id is out of range",
+                2: "block_id is out of range",
+                3: "lesson_id is out of range",
+            },
+        )
+        self.assertEqual(stats["rows_merged"], 1)
+        self.assertEqual(self._status(BOB, ACME_LESSON, 200), "seen")
+
+    def test_upgrade_is_stamped_now(self):
+        before = timezone.now()
+        record = dict(
+            self._row(ALICE, 201, "completed"), updated_at="2020-01-01T00:00:00Z"
+        )
+        self._import([record])
+        row = UserBlockProgress.objects.get(
+            user_id=ALICE, lesson_id=ACME_LESSON, block_id=201
+        )
+        self.assertEqual(row.status, "completed")
+        self.assertGreaterEqual(row.updated_at, before - timedelta(seconds=1))
+
+    def test_naive_updated_at_is_utc(self):
+        record = dict(self._row(BOB, 202, "seen"), updated_at="2024-01-02T03:04:05")
+        self._import([record])
+        row = UserBlockProgress.objects.get(
+            user_id=BOB, lesson_id=ACME_LESSON, block_id=202
+        )
+        self.assertEqual(row.updated_at.isoformat(), "2024-01-02T03:04:05+00:00")
+
+    def test_tenant_restriction(self):
+        _stats, rejected = self._import(
+            [self._row(CHARLIE, 200, "seen", lesson_id=GLOBEX_LESSON)],
+            tenant_id=ACME_TENANT,
+        )
+        self.assertEqual(rejected, {1: "outside tenant"})
+        self.assertIsNone(self._status(CHARLIE, GLOBEX_LESSON, 200))
+
+    def test_csv_with_updated_at(self):
+        _stats, rejected = self._import(
+            [
+                "status,block_id,lesson_id,user_id,updated_at",
+                f"completed,202,{ACME_LESSON},{BOB},2024-01-02T03:04:05Z",
+                f"seen,201,{ACME_LESSON},{BOB},yesterday",
+            ],
+            fmt="csv",
+        )
+        self.assertEqual(rejected, {3: "updated_at must be ISO 8601"})
+        row = UserBlockProgress.objects.get(
+            user_id=BOB, lesson_id=ACME_LESSON, block_id=202
+        )
+        self.assertEqual(row.status, "completed")
+        self.assertEqual(row.updated_at.isoformat(), "2024-01-02T03:04:05+00:00")
+
+    def test_csv_without_required_columns_fails(self):
+        with self.assertRaises(ValueError):
+            self._import(["user_id,lesson_id", f"{BOB},{ACME_LESSON}"], fmt="csv")
+
+    def test_rollups_are_rebuilt_for_imported_lessons(self):
+        self._import(
+            [
+                self._row(BOB, 200, "completed"),
+                self._row(BOB, 201, "completed"),
+                self._row(BOB, 202, "completed"),
+            ]
+        )
+        rollup = LessonProgressRollup.objects.get(lesson_id=ACME_LESSON)
+        self.assertEqual(rollup.users_started, 2)
+        self.assertEqual(rollup.users_completed, 1)
+
+
+class ContentIngestTests(BaseTestCase):
+    def _ingest(self, records, **kwargs):
+        lines = [r if isinstance(r, str) else json.dumps(r) for r in records]
+        rejects = io.StringIO()
+        with self.committed():
+            stats = ingest_content(
+                io.StringIO("\n".join(lines) + "\n"), rejects=rejects, **kwargs
+            )
+        rejected = {
+            int(row["line_no"]): row["reason"]
+            for row in csv.DictReader(io.StringIO(rejects.getvalue()))
+        }
+        return stats, rejected
+
+    def _lesson(self, lesson_id=300, tenant_id=ACME_TENANT, slug=None, blocks=()):
+        return {
+            "id": lesson_id,
+            "tenant_id": tenant_id,
+            "slug": slug or f"lesson-{lesson_id}",
+            "title": f"Lesson {lesson_id}",
+            "blocks": list(blocks),
+        }
+
+    def _block(self, block_id, block_type="markdown", *variants):
+        return {"id": block_id, "type": block_type, "variants": list(variants)}
+
+    def test_loads_new_lessons_blocks_and_variants(self):
+        stats, rejected = self._ingest(
+            [
+                self._lesson(
+                    300,
+                    blocks=[
+                        self._block(500, "markdown", {"data": {"markdown": "New"}}),
+                        self._block(
+                            201,
+                            "quiz",
+                            {"tenant_id": ACME_TENANT, "data": {"question": "Acme"}},
+                        ),
+                    ],
+                )
+            ]
+        )
+        self.assertEqual(rejected, {})
+        self.assertEqual(stats["lines_read"], 1)
+        self.assertEqual(stats["rows_staged"], 5)
+        self.assertEqual((stats["lessons_created"], stats["blocks_created"]), (1, 1))
+        self.assertEqual(stats["lesson_blocks"], 2)
+        self.assertEqual(stats["variants_written"], 2)
+
+        resp = APIClient().get(f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/300")
+        self.assertEqual(resp.status_code, 200)
+        blocks = resp.json()["blocks"]
+        self.assertEqual([b["id"] for b in blocks], [500, 201])
+        self.assertEqual(blocks[0]["variant"]["data"], {"markdown": "New"})
+        self.assertEqual(blocks[1]["variant"]["tenant_id"], ACME_TENANT)
+        # The Acme override also reaches the existing Acme lesson.
+        structure = fetch_lesson_structure(ACME_LESSON, ACME_TENANT)
+        self.assertEqual(structure.variant_data[1], {"question": "Acme"})
+        # Variants inserted by identity land past the explicit seed ids.
+        self.assertGreater(
+            BlockVariant.objects.get(block_id=500).id,
+            BlockVariant.objects.filter(block_id=202, tenant_id=2).get().id,
+        )
+
+    def test_existing_lesson_is_replaced_and_evicted(self):
+        url = f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        client = APIClient()
+        version = client.get(url).json()["lesson"]["content_version"]  # cached
+        lesson = self._lesson(
+            ACME_LESSON,
+            slug="ai-basics",
+            blocks=[
+                self._block(202, "markdown", {"data": {"markdown": "Recap"}}),
+                self._block(200),
+            ],
+        )
+        stats, rejected = self._ingest([lesson])
+        self.assertEqual(rejected, {})
+        self.assertEqual((stats["lessons_created"], stats["lessons_updated"]), (0, 1))
+        self.assertEqual(stats["lessons_invalidated"], 2)
+
+        body = client.get(url).json()
+        self.assertEqual(body["lesson"]["title"], f"Lesson {ACME_LESSON}")
+        self.assertGreater(body["lesson"]["content_version"], version)
+        self.assertEqual([b["id"] for b in body["blocks"]], [202, 200])
+        self.assertEqual(body["blocks"][0]["variant"]["data"], {"markdown": "Recap"})
+        # The default was updated in place; Globex keeps its own override.
+        self.assertEqual(
+            BlockVariant.objects.get(block_id=202, tenant_id=None).id, 1002
+        )
+        self.assertEqual(
+            fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT).variant_ids[1], 1200
+        )
+        rollup = LessonProgressRollup.objects.get(lesson_id=ACME_LESSON)
+        self.assertEqual(rollup.users_started, 1)
+
+    def test_invalid_lines_are_rejected_whole(self):
+        stats, rejected = self._ingest(
+            [
+                self._lesson(300, blocks=[self._block(500)]),
+                "{not json",
+                {"id": 301, "tenant_id": ACME_TENANT, "slug": "x", "blocks": []},
+                self._lesson(
+                    302,
+                    blocks=[self._block(501, "markdown", {"tenant_id": 2, "data": {}})],
+                ),
+                self._lesson(303, tenant_id=99),
+                self._lesson(300, slug="other"),
+                self._lesson(304, slug="lesson-300"),
+                self._lesson(305, blocks=[self._block(201, "markdown")]),
+                self._lesson(306, blocks=[self._block(500, "quiz")]),
+                self._lesson(GLOBEX_LESSON),
+                self._lesson(307, slug="ai-basics"),
+                self._lesson(308, blocks=[self._block(502), self._block(502)]),
+            ]
+        )
+        self.assertEqual(
+            rejected,
+            {
+                2: "invalid JSON",
+                3: "title must be a non-empty string",
+                4: "block 501: variant tenant_id must be the lesson's",
+                5: "unknown tenant",
+                6: "lesson id repeated from line 1",
+                7: "slug repeated from line 1",
+                8: "block 201 exists with type quiz",
+                9: "block 500 has type markdown on line 1",
+                10: "lesson id belongs to another tenant",
+                11: f"slug is used by lesson {ACME_LESSON}",
+                12: "block 502 appears twice",
+            },
+        )
+        self.assertEqual(stats["lines_rejected"], 11)
+        self.assertEqual(stats["lessons_created"], 1)
+        self.assertEqual(
+            sorted(Lesson.objects.values_list("id", flat=True)),
+            [ACME_LESSON, GLOBEX_LESSON, 300],
+        )
+        self.assertEqual(Block.objects.get(pk=500).block_type, "markdown")
+        self.assertFalse(Block.objects.filter(pk=501).exists())
+
+    def test_ids_outside_int4_reject_their_line(self):
+        stats, rejected = self._ingest(
+            [
+                self._lesson(2**31),
+                self._lesson(301, blocks=[self._block(-(2**31) - 1)]),
+                self._lesson(302, tenant_id=2**40),
+                self._lesson(300, blocks=[self._block(500)]),
+            ]
+        )
+        self.assertEqual(
+            rejected,
+            {
+                1: "id must be a 32-bit integer",
+                2: "each block needs a 32-bit integer id",
+                3: "tenant_id must be a 32-bit integer",
+            },
+        )
+        self.assertEqual(stats["lessons_created"], 1)
+        self.assertTrue(Lesson.objects.filter(pk=300).exists())
+
+    def test_later_lines_win_for_a_shared_variant(self):
+        _stats, rejected = self._ingest(
+            [
+                self._lesson(
+                    300, blocks=[self._block(500, "markdown", {"data": {"v": 1}})]
+                ),
+                self._lesson(
+                    301, blocks=[self._block(500, "markdown", {"data": {"v": 2}})]
+                ),
+            ]
+        )
+        self.assertEqual(rejected, {})
+        self.assertEqual(BlockVariant.objects.get(block_id=500).data, {"v": 2})
+        self.assertEqual(ResolvedLessonBlock.objects.filter(block_id=500).count(), 2)
+
+    def test_tenant_restriction(self):
+        _stats, rejected = self._ingest(
+            [self._lesson(300, tenant_id=GLOBEX_TENANT)], tenant_id=ACME_TENANT
+        )
+        self.assertEqual(rejected, {1: "outside tenant"})
+        self.assertFalse(Lesson.objects.filter(pk=300).exists())
+
+
+class PartitioningTests(BaseTestCase):
+    """Runs the whole migration inside the test transaction (DDL rolls back)."""
+
+    def _partitioned_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT user_id, lesson_id, block_id, status FROM {PARTITIONED_TABLE}"
+                " ORDER BY 1, 2, 3"
+            )
+            return cursor.fetchall()
+
+    def _migrate(self, partitions=4):
+        self.assertTrue(prepare_partitioned_table(partitions))
+        after, batches = None, 0
+        while True:
+            _count, after = copy_batch(after, batch_size=1)
+            if after is None:
+                break
+            batches += 1
+        self.assertEqual(missing_rows(), 0)
+        swap_partitioned_table()
+        return batches
+
+    def _relations(self, plan):
+        """Scanned relations; ModifyTable names the parent table it routes to."""
+        found = set()
+        if "Relation Name" in plan and plan["Node Type"] != "ModifyTable":
+            found.add(plan["Relation Name"])
+        for child in plan.get("Plans", []):
+            found |= self._relations(child)
+        return found
+
+    def test_writes_during_backfill_are_mirrored(self):
+        prepare_partitioned_table(4)
+        upsert_progress(BOB, ACME_LESSON, 202, "seen")
+        upsert_progress(ALICE, ACME_LESSON, 201, "completed")
+        self.assertEqual(
+            self._partitioned_rows(),
+            [(ALICE, ACME_LESSON, 201, "completed"), (BOB, ACME_LESSON, 202, "seen")],
+        )
+        self.assertEqual(missing_rows(), 1)  # Alice's untouched 200
+
+    def test_backfill_keeps_newer_mirrored_rows(self):
+        prepare_partitioned_table(4)
+        upsert_progress(ALICE, ACME_LESSON, 201, "completed")
+        copy_batch(None, batch_size=10)
+        self.assertIn((ALICE, ACME_LESSON, 201, "completed"), self._partitioned_rows())
+        self.assertEqual(missing_rows(), 0)
+
+    def test_migration_preserves_rows_and_api(self):
+        before = list(
+            UserBlockProgress.objects.order_by(
+                "user_id", "lesson_id", "block_id"
+            ).values_list("user_id", "lesson_id", "block_id", "status")
+        )
+        self.assertEqual(self._migrate(), len(before))
+        self.assertTrue(is_partitioned())
+        self.assertFalse(prepare_partitioned_table(4))
+
+        self.assertEqual(
+            get_progress_map(ALICE, ACME_LESSON), {200: "completed", 201: "seen"}
+        )
+        self.assertEqual(upsert_progress(ALICE, ACME_LESSON, 200, "seen"), "completed")
+        self.assertEqual(
+            upsert_progress(ALICE, ACME_LESSON, 201, "completed"), "completed"
+        )
+        self.assertEqual(upsert_progress(BOB, ACME_LESSON, 200, "seen"), "seen")
+        resp = APIClient().get(
+            f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}"
+        )
+        self.assertEqual(resp.json()["progress_summary"]["completed_blocks"], 2)
+
+    def test_progress_queries_touch_one_partition(self):
+        self._migrate()
+        progress = UserBlockProgress.objects.filter(
+            user_id=ALICE, lesson_id=ACME_LESSON
+        )
+        plans = [
+            json.loads(
+                progress.values_list("block_id", "status").explain(format="json")
+            ),
+            json.loads(
+                progress.filter(block_id=200).select_for_update().explain(format="json")
+            ),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "EXPLAIN (FORMAT JSON) UPDATE user_block_progress SET status = 'completed'"
+                " WHERE user_id = %s AND lesson_id = %s AND block_id = %s",
+                [ALICE, ACME_LESSON, 201],
+            )
+            plans.append(cursor.fetchone()[0])
+        for plan in plans:
+            relations = self._relations(plan[0]["Plan"])
+            self.assertEqual(len(relations), 1, relations)
+            self.assertRegex(relations.pop(), r"^user_block_progress_p\d+$")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], DATABASE_REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(BaseTestCase):
+    """
+    "replica" mirrors the default database through its own connection, which
+    can't see this test's uncommitted writes — a replica that is lagging.
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _get(self, user_id=ALICE):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                resp = self.client.get(
+                    f"/tenants/{ACME_TENANT}/users/{user_id}/lessons/{ACME_LESSON}"
+                )
+        self.assertEqual(resp.status_code, 200)
+        return resp.json(), len(primary), len(replica)
+
+    def _put(self, block_id, status):
+        resp = self.client.put(
+            f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}/progress",
+            {"block_id": block_id, "status": status},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_router_uses_bound_alias(self):
+        self.assertEqual(Lesson.objects.all().db, "default")
+        token = bind_read_alias("replica")
+        try:
+            self.assertEqual(Lesson.objects.all().db, "replica")
+            self.assertEqual(Lesson.objects.db_manager("default").all().db, "default")
+        finally:
+            unbind_read_alias(token)
+
+    def test_get_reads_from_replica(self):
+        _body, primary, replica = self._get()
+        self.assertEqual(primary, 1)  # the structure, cached for everyone
+        self.assertEqual(replica, 3)
+        _body, primary, replica = self._get()
+        self.assertEqual(primary, 0)
+        self.assertEqual(replica, 3)
+
+    def test_cache_fills_read_past_replica_lag(self):
+        BlockVariant.objects.filter(pk=1100).update(data={"markdown": "Edited"})
+        cache.clear()  # the edit's eviction, before the replica catches up
+
+        for _ in range(2):
+            body, _primary, _replica = self._get()
+            self.assertEqual(
+                body["blocks"][0]["variant"]["data"], {"markdown": "Edited"}
+            )
+        structure = cache.get(
+            structure_cache_key(
+                ACME_LESSON, ACME_TENANT, lesson_generation(ACME_LESSON, ACME_TENANT)
+            )
+        )
+        self.assertEqual(structure.variant_data[0], {"markdown": "Edited"})
+
+    def test_new_user_missing_on_the_replica_is_not_remembered(self):
+        User.objects.create(
+            id=12,
+            tenant_id=ACME_TENANT,
+            email="dana@acme.example",
+            created_at=timezone.now(),
+        )
+        body, _primary, _replica = self._get(user_id=12)
+        self.assertEqual(body["lesson"]["id"], ACME_LESSON)
+        self.assertIsNone(cache.get(not_found_cache_key(User, ACME_TENANT, 12)))
+
+        resp = self.client.get(
+            f"/tenants/{ACME_TENANT}/users/999/lessons/{ACME_LESSON}"
+        )
+        self.assertEqual(resp.status_code, 404)
+        self.assertIsNotNone(cache.get(not_found_cache_key(User, ACME_TENANT, 999)))
+
+    def test_put_writes_to_primary_and_pins_user(self):
+        put_body = self._put(202, "completed")
+        self.assertEqual(put_body["progress_summary"]["completed_blocks"], 2)
+
+        body, primary, replica = self._get()
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertEqual(body["progress_summary"], put_body["progress_summary"])
+
+    def test_other_users_keep_reading_from_replica(self):
+        self._put(202, "completed")
+        _body, primary, replica = self._get(user_id=BOB)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_unpinned_read_can_lag_behind_write(self):
+        """Why the pin exists: the lagging replica hasn't seen the PUT yet."""
+        put_body = self._put(202, "completed")
+        cache.clear()
+        body, _primary, _replica = self._get()
+        self.assertLess(
+            body["progress_summary"]["completed_blocks"],
+            put_body["progress_summary"]["completed_blocks"],
+        )
+
+    def test_failed_put_does_not_pin(self):
+        resp = self.client.put(
+            f"/tenants/{ACME_TENANT}/users/{ALICE}/lessons/{ACME_LESSON}/progress",
+            {"block_id": 999, "status": "seen"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 400)
+        _body, primary, _replica = self._get()
+        self.assertEqual(primary, 0)
+
+
+@override_settings(TENANT_DATABASES={GLOBEX_TENANT: "tenants"})
+class TenantRoutingTests(BaseTestCase):
+    """
+    Globex is moved to the "tenants" database (test_pair_tenants) and purged
+    from "default"; Acme stays. Schema and data roll back with the test class.
+    """
+
+    databases = {"default", "tenants"}
+
+    @classmethod
+    def setUpTestData(cls):
+        provision_tenant_database("tenants")
+        cls.copied = move_tenant(GLOBEX_TENANT, "tenants", source="default")
+        purge_tenant(GLOBEX_TENANT, "default")
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _url(self, tenant_id, user_id, lesson_id, suffix=""):
+        return f"/tenants/{tenant_id}/users/{user_id}/lessons/{lesson_id}{suffix}"
+
+    def _count_queries(self, alias, func):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            result = func()
+        return result, len(queries)
+
+    def test_move_copies_every_table(self):
+        self.assertEqual(self.copied["users"], 1)
+        self.assertEqual(self.copied["lesson_blocks"], 3)
+        self.assertEqual(self.copied["resolved_lesson_blocks"], 3)
+        self.assertEqual(tenant_row_counts(GLOBEX_TENANT, "default")["users"], 0)
+
+    def test_get_reads_tenant_data_from_its_database(self):
+        resp, default_queries = self._count_queries(
+            "default",
+            lambda: self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON)),
+        )
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body["lesson"]["title"], "AI Basics (Globex)")
+        self.assertEqual([b["id"] for b in body["blocks"]], [200, 202, 201])
+        self.assertEqual(body["blocks"][1]["variant"]["id"], 1200)
+        self.assertEqual(body["blocks"][1]["variant"]["tenant_id"], GLOBEX_TENANT)
+        self.assertIn(
+            "Globex summary", body["blocks"][1]["variant"]["data"]["markdown"]
+        )
+        # Only the shared block/variant content comes from "default".
+        self.assertEqual(default_queries, 1)
+
+    def test_orphaned_resolved_block_is_skipped(self):
+        # Nothing stops a block being deleted from "default" under a lesson
+        # that resolves to it on the tenant's database.
+        with connections["tenants"].cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO resolved_lesson_blocks "
+                "(tenant_id, lesson_id, position, block_id, variant_id) "
+                "VALUES (%s, %s, 4, 9999, NULL)",
+                [GLOBEX_TENANT, GLOBEX_LESSON],
+            )
+        with self.assertLogs("lessons.services.assembly", "WARNING"):
+            resp = self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([b["id"] for b in resp.json()["blocks"]], [200, 202, 201])
+
+    def test_put_writes_progress_and_rollups_to_tenant_database(self):
+        resp = self.client.put(
+            self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON, "/progress"),
+            {"block_id": 202, "status": "completed"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["progress_summary"]["completed_blocks"], 1)
+        self.assertTrue(
+            UserBlockProgress.objects.using("tenants")
+            .filter(user_id=CHARLIE, block_id=202, status="completed")
+            .exists()
+        )
+        self.assertFalse(UserBlockProgress.objects.filter(user_id=CHARLIE).exists())
+        rollup = LessonProgressRollup.objects.using("tenants").get(
+            lesson_id=GLOBEX_LESSON
+        )
+        self.assertEqual(rollup.completed_blocks_total, 1)
+
+    def test_default_tenants_never_touch_tenant_database(self):
+        resp, tenant_queries = self._count_queries(
+            "tenants",
+            lambda: self.client.get(self._url(ACME_TENANT, ALICE, ACME_LESSON)),
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(tenant_queries, 0)
+
+    def test_user_of_other_tenant_is_not_found(self):
+        resp = self.client.get(self._url(GLOBEX_TENANT, ALICE, GLOBEX_LESSON))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_default_variant_change_reaches_tenant_database(self):
+        self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON))
+        generation = lesson_generation(GLOBEX_LESSON, GLOBEX_TENANT)
+        key = structure_cache_key(GLOBEX_LESSON, GLOBEX_TENANT, generation)
+        self.assertIsNotNone(cache.get(key))
+
+        variant = BlockVariant.objects.get(pk=1001)
+        variant.data = {"question": "Edited"}
+        with self.committed():
+            variant.save()
+        self.assertIsNone(cache.get(key))
+
+        body = self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON)).json()
+        self.assertEqual(body["blocks"][2]["variant"]["data"], {"question": "Edited"})
+        self.assertEqual(body["lesson"]["content_version"], 2)
+
+    def test_inherited_overrides_reach_tenant_database(self):
+        url = self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON)
+        with self.committed():
+            set_tenant_parent(GLOBEX_TENANT, ACME_TENANT)
+        self.assertEqual(
+            self.client.get(url).json()["blocks"][0]["variant"]["id"], 1100
+        )
+
+        now = timezone.now()
+        with self.committed():
+            BlockVariant.objects.create(
+                id=5000,
+                block_id=201,
+                tenant_id=ACME_TENANT,
+                data={"question": "Acme's question"},
+                created_at=now,
+                updated_at=now,
+            )
+        body = self.client.get(url).json()
+        self.assertEqual(body["blocks"][2]["variant"]["id"], 5000)
+        self.assertEqual(body["blocks"][2]["variant"]["tenant_id"], ACME_TENANT)
+
+    def test_field_projection_on_tenant_database(self):
+        resp = self.client.get(
+            self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON), {"fields": "question"}
+        )
+        self.assertEqual(
+            [block["variant"]["data"] for block in resp.json()["blocks"]],
+            [{}, {}, {"question": "In one sentence, what is a neural network?"}],
+        )
+
+    def test_bulk_content_changes_on_tenant_database(self):
+        with self.committed():
+            resp = self.client.post(
+                f"/tenants/{GLOBEX_TENANT}/content/bulk",
+                {
+                    "variants": [{"block_id": 201, "data": {"question": "Globex"}}],
+                    "lesson_blocks": [
+                        {"lesson_id": GLOBEX_LESSON, "block_id": 201, "position": 1},
+                        {"lesson_id": GLOBEX_LESSON, "block_id": 200, "position": 3},
+                    ],
+                },
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 200, resp.content)
+        structure = fetch_lesson_structure(GLOBEX_LESSON, GLOBEX_TENANT)
+        self.assertEqual(list(structure.block_ids), [201, 202, 200])
+        self.assertEqual(structure.variant_data[0], {"question": "Globex"})
+        rows = LessonBlock.objects.using("tenants").filter(lesson_id=GLOBEX_LESSON)
+        self.assertEqual(rows.count(), 3)
+
+    def test_content_ingest_on_tenant_database(self):
+        line = json.dumps(
+            {
+                "id": 301,
+                "tenant_id": GLOBEX_TENANT,
+                "slug": "globex-extra",
+                "title": "Globex extra",
+                "blocks": [
+                    {"id": 202, "type": "markdown"},
+                    {"id": 500, "type": "markdown", "variants": [{"data": {}}]},
+                ],
+            }
+        )
+        rejects = io.StringIO()
+        stats = ingest_content(io.StringIO(line), rejects=rejects)
+        self.assertEqual(stats["lines_rejected"], 1)
+        self.assertIn("ingest it with --tenant", rejects.getvalue())
+
+        with self.committed():
+            stats = ingest_content(io.StringIO(line), tenant_id=GLOBEX_TENANT)
+        self.assertEqual(stats["lessons_created"], 1)
+        self.assertTrue(Lesson.objects.using("tenants").filter(pk=301).exists())
+        self.assertFalse(Lesson.objects.filter(pk=301).exists())
+        structure = fetch_lesson_structure(301, GLOBEX_TENANT)
+        self.assertEqual(list(structure.block_ids), [202, 500])
+        self.assertEqual(structure.variant_ids[0], 1200)
+        self.assertTrue(Block.objects.filter(pk=500).exists())
+
+    def test_publish_on_tenant_database(self):
+        resp = self.client.post(
+            f"/tenants/{GLOBEX_TENANT}/lessons/{GLOBEX_LESSON}/publish"
+        )
+        self.assertEqual(resp.status_code, 201)
+        self.assertTrue(
+            LessonSnapshot.objects.using("tenants")
+            .filter(lesson_id=GLOBEX_LESSON)
+            .exists()
+        )
+        cache.clear()
+        resp, default_queries = self._count_queries(
+            "default",
+            lambda: self.client.get(self._url(GLOBEX_TENANT, CHARLIE, GLOBEX_LESSON)),
+        )
+        self.assertEqual([b["id"] for b in resp.json()["blocks"]], [200, 202, 201])
+        self.assertEqual(resp.json()["blocks"][1]["variant"]["id"], 1200)
+        # The snapshot holds the shared content too.
+        self.assertEqual(default_queries, 0)
+
+    def test_new_override_is_resolved_on_tenant_database(self):
+        now = timezone.now()
+        BlockVariant.objects.create(
+            id=5100,
+            block_id=201,
+            tenant_id=GLOBEX_TENANT,
+            data={"question": "Globex quiz"},
+            created_at=now,
+            updated_at=now,
+        )
+        self.assertEqual(
+            ResolvedLessonBlock.objects.using("tenants")
+            .filter(lesson_id=GLOBEX_LESSON, block_id=201)
+            .values_list("variant_id", flat=True)
+            .get(),
+            5100,
+        )
+
+    def test_lesson_block_change_rebuilds_on_tenant_database(self):
+        with use_tenant_database("tenants"):
+            LessonBlock.objects.create(
+                lesson_id=GLOBEX_LESSON, block_id=203, position=4
+            )
+        self.assertEqual(
+            list(
+                ResolvedLessonBlock.objects.using("tenants")
+                .filter(lesson_id=GLOBEX_LESSON)
+                .values_list("block_id", "variant_id")
+            ),
+            [(200, 1000), (202, 1200), (201, 1001), (203, None)],
+        )
+
+    def test_export_streams_from_tenant_database(self):
+        with use_tenant_database("tenants"):
+            upsert_progress(CHARLIE, GLOBEX_LESSON, 200, "seen")
+        resp = self.client.get(f"/tenants/{GLOBEX_TENANT}/progress/export")
+        body = b"".join(resp.streaming_content).decode()
+        self.assertEqual(json.loads(body)["user_id"], CHARLIE)
+
+    def test_purge_refuses_current_placement(self):
+        with self.assertRaises(ValueError):
+            purge_tenant(GLOBEX_TENANT, "tenants")
+
+
+# ---------------------------------------------------------------------------
+# Performance regression suite
+#
+# Run on its own with:   python manage.py test lessons.tests --keepdb --tag performance
+# Skip it with:          python manage.py test lessons.tests --keepdb --exclude-tag performance
+# ---------------------------------------------------------------------------
+
+# Queries per request, excluding SAVEPOINT bookkeeping from transaction.atomic.
+QUERY_BUDGETS = {
+    ("GET", "cold"): 4,  # validate (2) + structure (1) + progress (1)
+    ("GET", "warm"): 3,  # validate (2) + progress (1)
+    # upsert: SELECT FOR UPDATE + INSERT/UPDATE + rollup statement
+    ("PUT", "cold"): 7,  # validate (2) + structure (1) + upsert (3) + progress (1)
+    ("PUT", "warm"): 6,  # validate (2) + upsert (3) + progress (1)
+}
+
+# Wall-clock budgets in seconds (best of several runs, generous for CI noise).
+SUMMARY_BUDGET_1000_BLOCKS = 0.005
+ASSEMBLY_WARM_BUDGET_1000_BLOCKS = 0.05
+ASSEMBLY_COLD_BUDGET_1000_BLOCKS = 0.25
+
+# Tables whose hot-path lookups must never fall back to a sequential scan.
+HOT_TABLES = {
+    "users",
+    "lessons",
+    "blocks",
+    "lesson_blocks",
+    "block_variants",
+    "user_block_progress",
+    "resolved_lesson_blocks",
+}
+
+PERF_TENANT = 9001
+PERF_USERS = 5000
+PERF_LESSONS = 500
+PERF_BLOCKS_PER_LESSON = 20
+PERF_BIG_LESSON_BLOCKS = 1000
+PERF_ID_BASE = 1_000_000
+PERF_USER = PERF_ID_BASE + 1
+PERF_LESSON = PERF_ID_BASE + 1
+PERF_BIG_LESSON = PERF_ID_BASE + 100_000
+
+
+def _is_bookkeeping(sql):
+    return sql.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT"))
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _best_of(func, runs=5):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@tag("performance")
+class PerformanceTestCase(BaseTestCase):
+    """
+    Loads a generated dataset large enough that the planner prefers indexes
+    (5k users, 500 lessons x 20 blocks, a 1000-block lesson, ~100k progress
+    rows). Everything lives inside the class transaction and is rolled back.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        base = PERF_ID_BASE
+        per_lesson = PERF_BLOCKS_PER_LESSON
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO tenants (id, name) VALUES (%s, 'Perf Tenant')",
+                [PERF_TENANT],
+            )
+            cursor.execute(
+                """
+                INSERT INTO users (id, tenant_id, email)
+                SELECT %s + n, %s, 'perf' || n || '@perf.example'
+                FROM generate_series(1, %s) AS n
+                """,
+                [base, PERF_TENANT, PERF_USERS],
+            )
+            cursor.execute(
+                """
+                INSERT INTO lessons (id, tenant_id, slug, title)
+                SELECT %s + n, %s, 'perf-' || n, 'Perf lesson ' || n
+                FROM generate_series(1, %s) AS n
+                UNION ALL
+                SELECT %s, %s, 'perf-big', 'Perf big lesson'
+                """,
+                [base, PERF_TENANT, PERF_LESSONS, PERF_BIG_LESSON, PERF_TENANT],
+            )
+            cursor.execute(
+                """
+                INSERT INTO blocks (id, block_type)
+                SELECT %s + n, CASE WHEN n %% 3 = 0 THEN 'quiz' ELSE 'markdown' END
+                FROM generate_series(1, %s) AS n
+                """,
+                [base, PERF_LESSONS * per_lesson],
+            )
+            cursor.execute(
+                """
+                INSERT INTO lesson_blocks (lesson_id, block_id, position)
+                SELECT %s + l, %s + (l - 1) * %s + p, p
+                FROM generate_series(1, %s) AS l, generate_series(1, %s) AS p
+                UNION ALL
+                SELECT %s, %s + p, p FROM generate_series(1, %s) AS p
+                """,
+                [
+                    base,
+                    base,
+                    per_lesson,
+                    PERF_LESSONS,
+                    per_lesson,
+                    PERF_BIG_LESSON,
+                    base,
+                    PERF_BIG_LESSON_BLOCKS,
+                ],
+            )
+            cursor.execute(
+                """
+                INSERT INTO block_variants (id, block_id, tenant_id, data)
+                SELECT %s + id, id, NULL, jsonb_build_object('markdown', 'Block ' || id)
+                FROM blocks WHERE id > %s
+                UNION ALL
+                SELECT %s + id, id, %s, jsonb_build_object('markdown', 'Override ' || id)
+                FROM blocks WHERE id > %s AND id %% 5 = 0
+                """,
+                [base, base, 2 * base, PERF_TENANT, base],
+            )
+            # Each user has progress on the first 10 blocks of two lessons.
+            cursor.execute(
+                """
+                INSERT INTO user_block_progress (user_id, lesson_id, block_id, status)
+                SELECT u.id, lb.lesson_id, lb.block_id,
+                       CASE WHEN lb.position %% 2 = 0 THEN 'completed' ELSE 'seen' END
+                FROM users u
+                JOIN lesson_blocks lb
+                  ON lb.lesson_id IN (
+                       %s + 1 + (u.id - %s) %% %s,
+                       %s + 1 + (u.id - %s + 7) %% %s
+                     )
+                 AND lb.position <= 10
+                WHERE u.tenant_id = %s
+                """,
+                [base, base, PERF_LESSONS, base, base, PERF_LESSONS, PERF_TENANT],
+            )
+            cursor.execute(
+                """
+                INSERT INTO user_block_progress (user_id, lesson_id, block_id, status)
+                SELECT %s, %s, block_id, 'seen'
+                FROM lesson_blocks WHERE lesson_id = %s AND position %% 2 = 0
+                """,
+                [PERF_USER, PERF_BIG_LESSON, PERF_BIG_LESSON],
+            )
+            rebuild_resolved_lessons(
+                [base + n for n in range(1, PERF_LESSONS + 1)] + [PERF_BIG_LESSON]
+            )
+            for table in sorted(HOT_TABLES | {"tenants"}):
+                cursor.execute(f"ANALYZE {table}")
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _url(self, user_id, lesson_id):
+        return f"/tenants/{PERF_TENANT}/users/{user_id}/lessons/{lesson_id}"
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        queries = [
+            q["sql"] for q in ctx.captured_queries if not _is_bookkeeping(q["sql"])
+        ]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{len(queries)} queries exceed budget of {budget}:\n" + "\n".join(queries),
+        )
+
+    def assertNoSeqScans(self, captured_queries):
+        """EXPLAIN every captured statement and reject seq scans on hot tables."""
+        explained = 0
+        for query in captured_queries:
+            sql = query["sql"]
+            if _is_bookkeeping(sql) or sql.startswith("INSERT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+                raw = cursor.fetchone()[0]
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            explained += 1
+            for node in _plan_nodes(plan):
+                if node["Node Type"] == "Seq Scan":
+                    self.assertNotIn(
+                        node["Relation Name"],
+                        HOT_TABLES,
+                        f"Sequential scan on {node['Relation Name']}:\n{sql}",
+                    )
+        self.assertGreater(explained, 0)
+
+
+class QueryBudgetTests(PerformanceTestCase):
+    def _put(self, block_id, status="completed"):
+        return self.client.put(
+            self._url(PERF_USER, PERF_LESSON) + "/progress",
+            {"block_id": block_id, "status": status},
+            format="json",
+        )
+
+    def test_get_cold_cache(self):
+        with self.assertQueryBudget(QUERY_BUDGETS[("GET", "cold")]):
+            resp = self.client.get(self._url(PERF_USER, PERF_LESSON))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_get_warm_cache(self):
+        self.client.get(self._url(PERF_USER, PERF_LESSON))
+        with self.assertQueryBudget(QUERY_BUDGETS[("GET", "warm")]):
+            resp = self.client.get(self._url(PERF_USER, PERF_LESSON))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_put_cold_cache(self):
+        with self.assertQueryBudget(QUERY_BUDGETS[("PUT", "cold")]):
+            resp = self._put(PERF_ID_BASE + 15)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_put_warm_cache_insert(self):
+        self.client.get(self._url(PERF_USER, PERF_LESSON))
+        with self.assertQueryBudget(QUERY_BUDGETS[("PUT", "warm")]):
+            resp = self._put(PERF_ID_BASE + 15)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_put_warm_cache_upgrade(self):
+        self.client.get(self._url(PERF_USER, PERF_LESSON))
+        with self.assertQueryBudget(QUERY_BUDGETS[("PUT", "warm")]):
+            resp = self._put(PERF_ID_BASE + 1)
+        self.assertEqual(resp.json()["stored_status"], "completed")
+
+    def test_validation_budget(self):
+        with self.assertNumQueries(2):
+            validate_tenant_user_lesson(PERF_TENANT, PERF_USER, PERF_LESSON)
+
+
+class QueryPlanTests(PerformanceTestCase):
+    def test_get_lesson_plans_use_indexes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self._url(PERF_USER, PERF_LESSON))
+        self.assertNoSeqScans(ctx.captured_queries)
+
+    def test_put_progress_plans_use_indexes(self):
+        url = self._url(PERF_USER, PERF_LESSON) + "/progress"
+        with CaptureQueriesContext(connection) as ctx:
+            # Upgrade an existing row (SELECT FOR UPDATE + UPDATE) ...
+            self.client.put(
+                url,
+                {"block_id": PERF_ID_BASE + 1, "status": "completed"},
+                format="json",
+            )
+            # ... and insert a new one.
+            self.client.put(
+                url, {"block_id": PERF_ID_BASE + 15, "status": "seen"}, format="json"
+            )
+        self.assertNoSeqScans(ctx.captured_queries)
+
+
+class LatencyBudgetTests(PerformanceTestCase):
+    def test_compute_progress_summary_1000_blocks(self):
+        structure = fetch_lesson_structure(PERF_BIG_LESSON, PERF_TENANT)
+        progress_map = get_progress_map(PERF_USER, PERF_BIG_LESSON)
+        self.assertEqual(len(structure), PERF_BIG_LESSON_BLOCKS)
+
+        elapsed = _best_of(lambda: compute_progress_summary(structure, progress_map))
+        self.assertLess(elapsed, SUMMARY_BUDGET_1000_BLOCKS)
+
+    def test_assembly_warm_1000_blocks(self):
+        lesson = Lesson.objects.get(pk=PERF_BIG_LESSON)
+        assemble_lesson(lesson, PERF_TENANT, PERF_USER)
+
+        elapsed = _best_of(lambda: assemble_lesson(lesson, PERF_TENANT, PERF_USER))
+        self.assertLess(elapsed, ASSEMBLY_WARM_BUDGET_1000_BLOCKS)
+
+    def test_assembly_cold_1000_blocks(self):
+        lesson = Lesson.objects.get(pk=PERF_BIG_LESSON)
+
+        def cold_assembly():
+            cache.clear()
+            assemble_lesson(lesson, PERF_TENANT, PERF_USER)
+
+        elapsed = _best_of(cold_assembly)
+        self.assertLess(elapsed, ASSEMBLY_COLD_BUDGET_1000_BLOCKS)
@@ -0,0 +1,104 @@
+"""
+Per-request phase timing, surfaced as a `Server-Timing` response header.
+
+ServerTimingMiddleware binds a recorder to the current request context. Service
+functions mark their phases with `@timed("name")` or `with phase("name")`.
+When no recorder is bound (SERVER_TIMING_ENABLED off, or code called outside a
+request) the decorator costs one ContextVar lookup and `phase()` returns a
+shared no-op context manager.
+"""
+
+import functools
+import time
+from contextvars import ContextVar
+
+_recorder = ContextVar("server_timing_recorder", default=None)
+
+
+class _NoopPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_PHASE = _NoopPhase()
+
+
+class _Phase:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        # Re-entrant phases (e.g. upsert_progress retrying itself) are only
+        # timed at the outermost level so the duration isn't counted twice.
+        if self.name not in self.recorder.active:
+            self.recorder.active.add(self.name)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            elapsed = time.perf_counter() - self.start
+            self.recorder.active.discard(self.name)
+            durations = self.recorder.durations
+            durations[self.name] = durations.get(self.name, 0.0) + elapsed
+        return False
+
+
+class ServerTimingRecorder:
+    """Accumulates phase durations (seconds) in the order phases first ran."""
+
+    def __init__(self):
+        self.durations = {}
+        self.active = set()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def header_value(self):
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.3f}"
+            for name, seconds in self.durations.items()
+        )
+
+
+def bind_recorder(recorder):
+    """Bind `recorder` to the current context. Returns a token for unbind."""
+    return _recorder.set(recorder)
+
+
+def unbind_recorder(token):
+    _recorder.reset(token)
+
+
+def phase(name):
+    """Context manager timing a named phase of the current request."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NOOP_PHASE
+    return recorder.phase(name)
+
+
+def timed(name):
+    """Decorator timing every call of the wrapped function as phase `name`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
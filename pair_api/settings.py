@@ -41,6 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lessons.api.middleware.ServerTimingMiddleware',
+    'lessons.api.middleware.ProfilingMiddleware',
+    'lessons.api.middleware.TenantRoutingMiddleware',
+    'lessons.api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +91,59 @@ DATABASES = {
     }
 }
 
+# Run the hot-path queries as server-side prepared statements
+# (lessons.prepared). Turn off behind a pooler that doesn't keep sessions,
+# e.g. PgBouncer in transaction mode. They are all key lookups, so they always
+# get the generic plan: otherwise Postgres keeps re-planning the ones on a
+# partitioned user_block_progress, whose generic plan looks dearer.
+DATABASE_PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", "1") == "1"
+if DATABASE_PREPARED_STATEMENTS:
+    DATABASES["default"]["OPTIONS"] = {
+        "options": "-c plan_cache_mode=force_generic_plan"
+    }
+
+# Read replica. Defaults to the primary's server so routing can be exercised
+# locally with two aliases on one Postgres; tests read it through the default
+# database's settings.
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "HOST": os.environ.get("DB_REPLICA_HOST", DATABASES["default"]["HOST"]),
+    "PORT": os.environ.get("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+    "TEST": {"MIRROR": "default"},
+}
+
+# Dedicated tenant database, on the primary's server unless DB_TENANTS_HOST is
+# set. Tenants listed in TENANT_DATABASES keep their users, lessons and
+# progress here; shared content (tenants, blocks, block_variants) stays on
+# "default". Create the schema with `manage.py provision_tenant_database tenants`.
+DATABASES["tenants"] = {
+    **DATABASES["default"],
+    "NAME": os.environ.get("DB_TENANTS_NAME", "pair_tenants"),
+    "HOST": os.environ.get("DB_TENANTS_HOST", DATABASES["default"]["HOST"]),
+    "TEST": {"NAME": "test_pair_tenants"},
+}
+
+DATABASE_ROUTERS = ["lessons.routers.DatabaseRouter"]
+
+# {tenant_id: alias}; unlisted tenants live on "default". Move a tenant with
+# `manage.py move_tenant` before changing its entry. From the environment:
+# TENANT_DATABASES="2=tenants,7=tenants".
+TENANT_DATABASES = {
+    int(tenant_id): alias
+    for tenant_id, alias in (
+        entry.split("=")
+        for entry in os.environ.get("TENANT_DATABASES", "").split(",")
+        if entry
+    )
+}
+
+# Aliases lesson GETs may read from; empty keeps every query on the primary.
+DATABASE_REPLICAS = (
+    ["replica"] if os.environ.get("DB_READ_REPLICAS", "0") == "1" else []
+)
+# After a write, the user's reads stay on the primary for this many seconds.
+DATABASE_REPLICA_PIN_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -134,6 +191,61 @@ CACHES = {
         "TIMEOUT": 300,
     }
 }
+# One cache for all worker processes on the host, in a memory-mapped file
+# (lessons.cache_backends.shared_memory), instead of one per process.
+if os.environ.get("SHARED_CACHE_PATH"):
+    CACHES["default"] = {
+        "BACKEND": "lessons.cache_backends.shared_memory.SharedMemoryCache",
+        "LOCATION": os.environ["SHARED_CACHE_PATH"],
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "SIZE": int(os.environ.get("SHARED_CACHE_SIZE", 256 * 2**20)),
+            "SLOTS": int(os.environ.get("SHARED_CACHE_SLOTS", 2**16)),
+        },
+    }
+# A byte budget with frequency-aware eviction
+# (lessons.cache_backends.tinylfu), instead of LocMemCache's 300 entries.
+elif os.environ.get("LESSON_CACHE_MAX_BYTES"):
+    CACHES["default"] = {
+        "BACKEND": "lessons.cache_backends.tinylfu.TinyLFUCache",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_BYTES": int(os.environ["LESSON_CACHE_MAX_BYTES"])},
+    }
+
+# How long live lesson content stays cached. Edits evict it after commit
+# (lessons.services.invalidation), so this mostly bounds memory; with a
+# byte-budgeted cache it can be much longer.
+LESSON_CACHE_TTL = int(
+    os.environ.get(
+        "LESSON_CACHE_TTL",
+        86400 if os.environ.get("LESSON_CACHE_MAX_BYTES") else 300,
+    )
+)
+
+# Threads per process deleting cache entries after content changes commit
+# (lessons.services.invalidation); 0 deletes them in the committing thread.
+CACHE_INVALIDATION_WORKERS = int(os.environ.get("CACHE_INVALIDATION_WORKERS", "2"))
+CACHE_INVALIDATION_BATCH_SIZE = 500
+# Seconds management commands wait for their queued evictions before exiting.
+CACHE_INVALIDATION_FLUSH_TIMEOUT = 30
+# Changes touching at least this many lessons of one tenant renew the
+# tenant's cache generation instead of deleting each lesson's keys.
+CACHE_INVALIDATION_TENANT_THRESHOLD = int(
+    os.environ.get("CACHE_INVALIDATION_TENANT_THRESHOLD", "1000")
+)
+
+# Validation lookups that found nothing are remembered for this many seconds
+# (lessons.services.validation), so repeated requests for a missing user or
+# lesson cost no queries; 0 turns it off. Creating the user or lesson forgets
+# the entry once it commits.
+VALIDATION_NOT_FOUND_TTL = int(os.environ.get("VALIDATION_NOT_FOUND_TTL", "30"))
+# Optional budget of 404s per tenant per minute. Past it, the tenant's
+# lookups that find no user or lesson get a 429 instead of a 404 until the
+# minute ends; lookups that find theirs are never throttled. {tenant_id: budget} overrides the default; None: no budget.
+VALIDATION_NOT_FOUND_PER_MINUTE = (
+    int(os.environ.get("VALIDATION_NOT_FOUND_PER_MINUTE", "0")) or None
+)
+VALIDATION_TENANT_NOT_FOUND_PER_MINUTE = {}
 
 
 REST_FRAMEWORK = {
@@ -141,6 +253,21 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [],
     "EXCEPTION_HANDLER": "lessons.api.views.custom_exception_handler",
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "lessons.api.renderers.TimedJSONRenderer",
     ],
+    # JSON is the only renderer; free up ?format= for the export endpoint.
+    "URL_FORMAT_OVERRIDE": None,
 }
+
+# Emit a Server-Timing header breaking lesson requests into phases
+# (validate, structure, progress, upsert, summary, render).
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "0") == "1"
+
+# On-demand cProfile dumps for selected requests. A request is profiled when it
+# sends a valid `X-Profile-Token` (see `manage.py profile_token`) or is picked
+# by its tenant's sampling rate, e.g. {1: 0.01} profiles 1% of tenant 1.
+PROFILING_SECRET = os.environ.get("PROFILING_SECRET", "")
+PROFILING_TOKEN_MAX_AGE = 3600  # seconds a signed token stays valid
+PROFILING_TENANT_SAMPLE_RATES = {}
+PROFILING_DIR = os.environ.get("PROFILING_DIR", str(BASE_DIR / "profiles"))
+PROFILING_MAX_BYTES = 256 * 1024 * 1024